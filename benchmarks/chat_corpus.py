@@ -0,0 +1,83 @@
+"""
+Generate a corpus of real-looking chat comments for benchmarking.
+
+Twitch chat is dominated by short ASCII messages, repeated emote names and a
+limited set of active chatters, with some longer messages, non-latin text and
+emoji mixed in. The corpus is generated from a fixed seed so it is the same on
+every run.
+"""
+
+import random
+from typing import Any, Dict, List
+
+EMOTES = [
+    "Kappa", "PogChamp", "LUL", "KEKW", "OMEGALUL", "monkaS", "PepeHands", "Sadge",
+    "catJAM", "EZ", "Clap", "HeyGuys", "NotLikeThis", "BibleThump", "ResidentSleeper",
+    "PauseChamp", "5Head", "WeirdChamp", "peepoHappy", "Pog",
+]
+
+WORDS = [
+    "the", "a", "is", "that", "was", "so", "good", "lol", "what", "no", "yes", "gg",
+    "wp", "chat", "streamer", "play", "game", "boss", "why", "how", "did", "you",
+    "see", "this", "clip", "it", "insane", "actually", "bro", "nice", "run", "again",
+    "first", "time", "hype", "let's", "go", "!!!", "???", "@mod", "W", "L",
+]
+
+UNICODE_WORDS = [
+    "こんにちは", "草", "ありがとう", "你好", "哈哈哈", "안녕하세요", "ㅋㅋㅋ", "привет",
+    "καλησπέρα", "señor", "naïve", "🔥", "😂😂😂", "❤️", "👍", "🎉🎉", "Ｆｕｌｌｗｉｄｔｈ",
+]
+
+
+def make_comments(count: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """Make `count` comments in the format returned by the Twitch API"""
+    rnd = random.Random(seed)
+    chatters = [_make_chatter(rnd, n) for n in range(max(count // 20, 10))]
+    comments: List[Dict[str, Any]] = []
+
+    for n in range(count):
+        chatter = chatters[min(int(rnd.expovariate(1 / 30)), len(chatters) - 1)]
+        comments.append(
+            {
+                "id": f"comment-{n}",
+                "commenter": chatter,
+                "contentOffsetSeconds": n // 5,
+                "createdAt": "2025-01-01T00:00:00.000Z",
+                "message": {
+                    "fragments": [{"emote": None, "text": _make_text(rnd)}],
+                    "userBadges": [],
+                    "userColor": "#FF0000",
+                },
+            }
+        )
+
+    return comments
+
+
+def _make_chatter(rnd: random.Random, n: int) -> Dict[str, Any]:
+    name = rnd.choice(WORDS).capitalize() + rnd.choice(EMOTES) + str(rnd.randint(0, 9999))
+    if rnd.random() < 0.05:
+        name = rnd.choice(UNICODE_WORDS) + str(n)
+    return {"id": str(1000 + n), "login": name.lower(), "displayName": name}
+
+
+def _make_text(rnd: random.Random) -> str:
+    kind = rnd.random()
+
+    # Emote spam
+    if kind < 0.25:
+        return " ".join([rnd.choice(EMOTES)] * rnd.randint(1, 6))
+
+    # Long messages
+    length = rnd.randint(10, 40) if kind > 0.9 else rnd.randint(1, 10)
+    words: List[str] = []
+    for _ in range(length):
+        choice = rnd.random()
+        if choice < 0.15:
+            words.append(rnd.choice(EMOTES))
+        elif choice < 0.22:
+            words.append(rnd.choice(UNICODE_WORDS))
+        else:
+            words.append(rnd.choice(WORDS))
+
+    return " ".join(words)
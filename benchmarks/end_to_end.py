@@ -0,0 +1,145 @@
+"""
+Run twitch-dl commands end to end against a local stand-in for Twitch, see
+benchmarks/fake_twitch.py, and report wall time, requests/s and MB/s for each
+phase.
+
+Each command runs in a separate process, like when invoked by users, and all
+phases share a fresh cache dir. Chat is exported to ytt after exporting it to
+json, so the ytt phase measures rendering from the local chat archive.
+
+`chat video` is not included since it needs fonts from GitHub and ffmpeg.
+
+With --http2, the server uses TLS and the download phases are run twice, over
+HTTP/1.1 and over HTTP/2, to compare them. Combine with --latency to compare
+them on links with a high round trip time, e.g.:
+
+    python -m benchmarks.end_to_end --http2 --latency 150 --bandwidth 5m
+
+Usage: python -m benchmarks.end_to_end [OPTIONS]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+from benchmarks.fake_twitch import CHANNEL, VIDEO_ID, Config, Counter, FakeTwitch, server_options
+from twitchdl.output import print_table
+
+MB = 1024 * 1024
+
+PHASES: List[Tuple[str, List[str]]] = [
+    (
+        "download",
+        ["download", VIDEO_ID, "--quality", "source", "--concat", "--output", "{dir}/video.ts"],
+    ),
+    ("clips --download", ["clips", CHANNEL, "--download", "--target-dir", "{dir}/clips"]),
+    ("chat json", ["chat", "json", VIDEO_ID, "--output", "{dir}/chat.json"]),
+    ("chat ytt", ["chat", "ytt", VIDEO_ID, "--output", "{dir}/chat.ytt"]),
+]
+
+DOWNLOAD_COMMANDS = ["download", "clips"]
+"""Commands which download from the CDN, and can use HTTP/2"""
+
+
+@click.command(context_settings={"show_default": True})
+@click.option("-w", "--workers", type=int, help="Workers passed to download and clips commands")
+@click.option("-v", "--verbose", is_flag=True, help="Show output of twitch-dl commands")
+@click.option("--http2", is_flag=True, help="Compare downloading over HTTP/1.1 and HTTP/2")
+@server_options
+def main(workers: Optional[int], verbose: bool, http2: bool, **options: Any):
+    """Benchmark twitch-dl commands against a local stand-in for Twitch."""
+    if http2:
+        options["tls"] = True
+    server = FakeTwitch(Config(**options))
+    server.start()
+
+    rows: List[List[str]] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {**os.environ, **server.env, "XDG_CACHE_HOME": str(Path(tmp_dir, "cache"))}
+
+        for name, args in PHASES:
+            if workers and args[0] in DOWNLOAD_COMMANDS:
+                args = args + [
+                    "--workers" if args[0] == "clips" else "--max-workers",
+                    str(workers),
+                ]
+
+            variants = [(name, [], "")]
+            if http2 and args[0] in DOWNLOAD_COMMANDS:
+                variants = [
+                    (f"{name} (HTTP/1.1)", [], "http1"),
+                    (f"{name} (HTTP/2)", ["--http2"], "http2"),
+                ]
+
+            for variant_name, global_args, subdir in variants:
+                # Each variant downloads to its own dir so nothing is reused
+                target_dir = Path(tmp_dir, subdir)
+                target_dir.mkdir(exist_ok=True)
+                command = global_args + [arg.format(dir=target_dir) for arg in args]
+
+                before = server.stats.snapshot()
+                start = time.perf_counter()
+                returncode = _run(command, env, verbose)
+                duration = time.perf_counter() - start
+                after = server.stats.snapshot()
+
+                rows.append(_phase_row(variant_name, duration, returncode, before, after))
+
+    server.shutdown()
+    server.server_close()
+
+    print_table(
+        rows,
+        headers=["Phase", "Time", "Requests", "Req/s", "MB", "MB/s", "Errors", "Result"],
+        alignments={n: "right" for n in range(1, 7)},
+    )
+
+
+def _run(args: List[str], env: Dict[str, str], verbose: bool) -> int:
+    command = [sys.executable, "-m", "twitchdl", *args]
+    if verbose:
+        click.secho(f"$ twitch-dl {' '.join(args)}", dim=True)
+        return subprocess.run(command, env=env, stdin=subprocess.DEVNULL).returncode
+
+    result = subprocess.run(command, env=env, stdin=subprocess.DEVNULL, capture_output=True)
+    if result.returncode != 0:
+        click.secho(result.stderr.decode(errors="replace"), err=True, fg="red")
+    return result.returncode
+
+
+def _phase_row(
+    name: str,
+    duration: float,
+    returncode: int,
+    before: Dict[str, Counter],
+    after: Dict[str, Counter],
+) -> List[str]:
+    requests = 0
+    size = 0
+    errors = 0
+    for endpoint, counter in after.items():
+        previous = before.get(endpoint, Counter())
+        requests += counter.requests - previous.requests
+        size += counter.bytes - previous.bytes
+        errors += counter.errors - previous.errors
+
+    return [
+        name,
+        f"{duration:.2f}s",
+        str(requests),
+        f"{requests / duration:.0f}",
+        f"{size / MB:.1f}",
+        f"{size / MB / duration:.1f}",
+        str(errors),
+        "ok" if returncode == 0 else f"exit {returncode}",
+    ]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+HTTP/2 support for the fake Twitch CDN, see benchmarks/fake_twitch.py.
+
+Only CDN requests are served over HTTP/2, since those are the only requests
+twitch-dl makes over HTTP/2. Each stream is served in a separate thread, while
+all reading from and writing to the socket is done by the connection's thread,
+since SSL sockets can't be used from several threads at once.
+"""
+
+import select
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+from urllib.parse import urlparse
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.errors import ErrorCodes
+from h2.events import ConnectionTerminated, RequestReceived, StreamReset
+from h2.exceptions import ProtocolError
+
+if TYPE_CHECKING:
+    from benchmarks.fake_twitch import FakeTwitch
+
+READ_SIZE = 64 * 1024
+
+
+class Pacer:
+    """Limits the rate at which all streams of a connection send data."""
+
+    def __init__(self, rate: Optional[int]):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_send = 0.0
+
+    def wait(self, size: int):
+        if not self.rate:
+            return
+
+        with self.lock:
+            now = time.perf_counter()
+            self.next_send = max(self.next_send, now) + size / self.rate
+            delay = self.next_send - now
+
+        time.sleep(delay)
+
+
+class Connection:
+    def __init__(self, server: "FakeTwitch", sock: socket.socket):
+        self.server = server
+        self.sock = sock
+        self.h2 = H2Connection(H2Configuration(client_side=False, header_encoding="utf-8"))
+        self.pacer = Pacer(server.config.bandwidth)
+        self.closed = False
+        self.reset_streams: List[int] = []
+
+        # Guards the h2 connection, notified when flow control windows change
+        self.condition = threading.Condition()
+
+        # Stream threads wake up the connection thread to send their data
+        self.wakeup_read, self.wakeup_write = socket.socketpair()
+
+    def serve(self):
+        with self.condition:
+            self.h2.initiate_connection()
+
+        try:
+            while not self.closed:
+                self._send()
+                readable, _, _ = select.select([self.sock, self.wakeup_read], [], [])
+                if self.wakeup_read in readable:
+                    self.wakeup_read.recv(READ_SIZE)
+                if self.sock in readable:
+                    self._receive()
+        except OSError:
+            pass
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+            self.wakeup_read.close()
+            self.wakeup_write.close()
+
+    def _receive(self):
+        data = self.sock.recv(READ_SIZE)
+        if not data:
+            self.closed = True
+            return
+
+        # SSL sockets may have decrypted more data, which select doesn't see
+        pending = getattr(self.sock, "pending", None)
+        while pending and pending():
+            data += self.sock.recv(READ_SIZE)
+
+        with self.condition:
+            for event in self.h2.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    headers = dict(event.headers)  # type: ignore
+                    threading.Thread(
+                        target=self._respond,
+                        args=(event.stream_id, headers),
+                        daemon=True,
+                    ).start()
+                elif isinstance(event, StreamReset):
+                    self.reset_streams.append(event.stream_id)  # type: ignore
+                elif isinstance(event, ConnectionTerminated):
+                    self.closed = True
+            self.condition.notify_all()
+
+    def _send(self):
+        with self.condition:
+            data = self.h2.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def _wakeup(self):
+        try:
+            self.wakeup_write.send(b"\0")
+        except OSError:
+            pass
+
+    def _respond(self, stream_id: int, headers: Dict[str, str]):
+        time.sleep(self.server.config.latency / 1000)
+        content = self.server.cdn_content(urlparse(headers[":path"]).path)
+
+        try:
+            if content:
+                self._send_cdn(stream_id, *content)
+            else:
+                self._send_body(stream_id, 404, b"Not found", "text/plain")
+                self.server.stats.add("other", 9)
+        except ProtocolError:
+            # Stream was reset by the client
+            pass
+
+    def _send_body(self, stream_id: int, status: int, body: bytes, content_type: str):
+        with self.condition:
+            self.h2.send_headers(stream_id, _headers(status, content_type, len(body)))
+            self.h2.send_data(stream_id, body, end_stream=True)
+        self._wakeup()
+
+    def _send_cdn(self, stream_id: int, body: bytes, content_type: str):
+        fail = self.server.should_fail()
+        # Failed responses are cut off half way and the stream is reset
+        size = len(body) // 2 if fail else len(body)
+
+        with self.condition:
+            self.h2.send_headers(stream_id, _headers(200, content_type, len(body)))
+        self._wakeup()
+
+        offset = 0
+        while offset < size:
+            with self.condition:
+                while not self._stopped(stream_id) and self._window(stream_id) <= 0:
+                    self.condition.wait()
+                if self._stopped(stream_id):
+                    return
+
+                chunk_size = min(
+                    self._window(stream_id),
+                    self.h2.max_outbound_frame_size,
+                    size - offset,
+                )
+                end = offset + chunk_size
+                self.h2.send_data(stream_id, body[offset:end], end_stream=end == len(body))
+            self._wakeup()
+            self.pacer.wait(chunk_size)
+            offset = end
+
+        if fail:
+            with self.condition:
+                self.h2.reset_stream(stream_id, ErrorCodes.INTERNAL_ERROR)
+            self._wakeup()
+
+        self.server.stats.add("cdn", size, error=fail)
+
+    def _window(self, stream_id: int) -> int:
+        return self.h2.local_flow_control_window(stream_id)
+
+    def _stopped(self, stream_id: int) -> bool:
+        return self.closed or stream_id in self.reset_streams
+
+
+def serve(server: "FakeTwitch", sock: socket.socket):
+    """Serve an HTTP/2 connection until it's closed."""
+    Connection(server, sock).serve()
+
+
+def _headers(status: int, content_type: str, length: int):
+    return [
+        (":status", str(status)),
+        ("content-type", content_type),
+        ("content-length", str(length)),
+    ]
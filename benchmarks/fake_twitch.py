@@ -0,0 +1,505 @@
+"""
+Local stand-in for the Twitch APIs and CDN, for benchmarking twitch-dl without
+network access.
+
+Serves fake responses to the GQL queries made by `twitchdl.twitch`, an usher
+endpoint returning video playlists, and a CDN serving VOD segments and clips.
+CDN responses can be slowed down and made to fail to simulate real networks.
+All content is generated from a fixed seed, so it's the same on every run.
+
+With --tls, the server uses HTTPS with a self-signed certificate generated
+using the openssl CLI, and serves the CDN over HTTP/2 to clients which support
+it, which requires the h2 package.
+
+Point twitch-dl to the server by setting the environment variables printed on
+startup. The server counts requests and bytes sent so they can be reported.
+
+Usage: python -m benchmarks.fake_twitch [OPTIONS]
+"""
+
+import json
+import random
+import re
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import click
+
+from benchmarks.chat_corpus import make_comments
+from twitchdl.cli import validate_size
+
+VIDEO_ID = "1000000001"
+CHANNEL = "fakestreamer"
+
+SEGMENT_SECONDS = 10
+COMMENTS_PAGE_SIZE = 100
+WRITE_CHUNK_SIZE = 64 * 1024
+
+QUALITIES = [
+    # name, group_id, resolution, bandwidth
+    ("1080p60", "chunked", "1920x1080", 8_000_000),
+    ("720p60", "720p60", "1280x720", 4_000_000),
+    ("480p30", "480p30", "852x480", 1_500_000),
+]
+
+
+@dataclass
+class Config:
+    duration: int = 600
+    """Video length in seconds"""
+    segment_size: int = 1024 * 1024
+    """Size of each VOD segment in bytes"""
+    clip_count: int = 50
+    clip_size: int = 2 * 1024 * 1024
+    """Size of each clip in bytes"""
+    latency: float = 0.0
+    """
+    Round trip time in milliseconds. Each request is delayed by it, and new
+    connections by one more for the TCP handshake, and one more with TLS.
+    """
+    bandwidth: Optional[int] = None
+    """Maximum CDN download speed per connection, in bytes per second"""
+    error_rate: float = 0.0
+    """Share of CDN requests which fail by dropping the connection mid-response"""
+    seed: int = 1
+    tls: bool = False
+    """Serve over HTTPS, and the CDN over HTTP/2 to clients which support it"""
+
+
+@dataclass
+class Counter:
+    requests: int = 0
+    bytes: int = 0
+    errors: int = 0
+
+
+class Stats:
+    """Requests and bytes sent by the server, per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Counter] = {}
+
+    def add(self, endpoint: str, size: int, error: bool = False):
+        with self._lock:
+            counter = self._counters.setdefault(endpoint, Counter())
+            counter.requests += 1
+            counter.bytes += size
+            counter.errors += int(error)
+
+    def snapshot(self) -> Dict[str, Counter]:
+        with self._lock:
+            return {name: Counter(**vars(c)) for name, c in self._counters.items()}
+
+
+class FakeTwitch(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: Config, address: Tuple[str, int] = ("127.0.0.1", 0)):
+        super().__init__(address, Handler)
+        self.config = config
+        self.stats = Stats()
+        self.random = random.Random(config.seed)
+        self.random_lock = threading.Lock()
+        self.comments = make_comments(config.duration * 5, config.seed)
+        self.segment = _make_content(config.segment_size, config.seed)
+        self.clip = _make_content(config.clip_size, config.seed + 1)
+
+        self.cert_dir: Optional[Path] = None
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        if config.tls:
+            self.cert_dir = Path(tempfile.mkdtemp(prefix="fake-twitch-"))
+            self.ssl_context = _make_ssl_context(self.cert_dir, self.server_address[0])
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        scheme = "https" if self.ssl_context else "http"
+        return f"{scheme}://{host}:{port}"
+
+    @property
+    def env(self) -> Dict[str, str]:
+        """Environment variables which point twitch-dl to this server"""
+        env = {
+            "TWITCH_DL_GQL_URL": f"{self.url}/gql",
+            "TWITCH_DL_USHER_URL": f"{self.url}/usher",
+        }
+        if self.cert_dir:
+            # Trust the self-signed certificate, used by httpx
+            env["SSL_CERT_FILE"] = str(self.cert_dir / "cert.pem")
+        return env
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def server_close(self):
+        super().server_close()
+        if self.cert_dir:
+            shutil.rmtree(self.cert_dir, ignore_errors=True)
+
+    def finish_request(self, request: Any, client_address: Any):
+        config = self.config
+        # Simulate the round trips needed to open a connection
+        handshakes = 2 if self.ssl_context else 1
+        time.sleep(config.latency * handshakes / 1000)
+
+        if not self.ssl_context:
+            Handler(request, client_address, self)
+            return
+
+        with self.ssl_context.wrap_socket(request, server_side=True) as tls_socket:
+            if tls_socket.selected_alpn_protocol() == "h2":
+                from benchmarks import fake_cdn_h2
+
+                fake_cdn_h2.serve(self, tls_socket)
+            else:
+                Handler(tls_socket, client_address, self)
+
+    def handle_error(self, request: Any, client_address: Any):
+        # Clients drop connections e.g. when cancelling downloads, ignore it
+        if not isinstance(sys.exc_info()[1], (ConnectionError, ssl.SSLError)):
+            super().handle_error(request, client_address)
+
+    def should_fail(self) -> bool:
+        with self.random_lock:
+            return self.random.random() < self.config.error_rate
+
+    def cdn_content(self, path: str) -> Optional[Tuple[bytes, str]]:
+        """Body and content type of a VOD segment or clip"""
+        if re.fullmatch(r"/cdn/vods/\d+/[^/]+/\d+\.ts", path):
+            return self.segment, "video/mp2t"
+        if re.fullmatch(r"/cdn/clips/[^/]+\.mp4", path):
+            return self.clip, "video/mp4"
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: FakeTwitch
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_POST(self):
+        time.sleep(self.server.config.latency / 1000)
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+
+        if isinstance(payload, list):
+            data = [self._gql(query) for query in payload]
+        else:
+            data = self._gql(payload)
+
+        self._send("gql", json.dumps(data).encode(), "application/json")
+
+    def do_GET(self):
+        time.sleep(self.server.config.latency / 1000)
+        path = urlparse(self.path).path
+
+        if match := re.fullmatch(r"/usher/vod/(\d+)", path):
+            self._send("usher", self._master_playlist(match[1]).encode())
+        elif re.fullmatch(r"/cdn/vods/\d+/[^/]+/index-dvr\.m3u8", path):
+            self._send("cdn", self._media_playlist().encode())
+        elif content := self.server.cdn_content(path):
+            self._send_cdn(*content)
+        else:
+            self._send("other", b"Not found", status=404)
+
+    def _send(
+        self,
+        endpoint: str,
+        body: bytes,
+        content_type: str = "text/plain",
+        status: int = 200,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.add(endpoint, len(body))
+
+    def _send_cdn(self, body: bytes, content_type: str):
+        config = self.server.config
+        fail = self.server.should_fail()
+        # Failed responses are cut off half way and the connection is dropped
+        size = len(body) // 2 if fail else len(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        start = time.perf_counter()
+        for offset in range(0, size, WRITE_CHUNK_SIZE):
+            self.wfile.write(body[offset : min(offset + WRITE_CHUNK_SIZE, size)])
+            if config.bandwidth:
+                ahead = (offset + WRITE_CHUNK_SIZE) / config.bandwidth
+                delay = ahead - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+        if fail:
+            self.close_connection = True
+        self.server.stats.add("cdn", size, error=fail)
+
+    def _master_playlist(self, video_id: str) -> str:
+        lines = ["#EXTM3U"]
+        for name, group_id, resolution, bandwidth in QUALITIES:
+            url = f"{self.server.url}/cdn/vods/{video_id}/{group_id}/index-dvr.m3u8"
+            lines += [
+                f'#EXT-X-MEDIA:TYPE=VIDEO,GROUP-ID="{group_id}",NAME="{name}"'
+                + ",AUTOSELECT=YES,DEFAULT=YES",
+                f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}"
+                + f',CODECS="avc1.64002A,mp4a.40.2",VIDEO="{group_id}"',
+                url,
+            ]
+        return "\n".join(lines) + "\n"
+
+    def _media_playlist(self) -> str:
+        count = -(-self.server.config.duration // SEGMENT_SECONDS)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for n in range(count):
+            lines += [f"#EXTINF:{SEGMENT_SECONDS}.000,", f"{n}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def _gql(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if "query" in payload:
+            return self._gql_query(payload["query"])
+
+        operation = payload.get("operationName")
+        variables = payload.get("variables", {})
+
+        if operation == "VideoAccessToken_Clip":
+            return {"data": {"clip": self._clip_access_token(variables["slug"])}}
+        if operation == "VideoPlayer_ChapterSelectButtonVideo":
+            return {"data": {"video": {"id": variables["videoID"], "moments": {"edges": []}}}}
+        if operation == "VideoCommentsByOffsetOrCursor":
+            return {"data": {"video": self._comments(variables)}}
+        if operation == "VideoComments":
+            return {"data": {"video": self._video(variables["videoID"]), "badges": []}}
+
+        return _gql_error(f"Unknown operation: {operation}")
+
+    def _gql_query(self, query: str) -> Dict[str, Any]:
+        if "videoPlaybackAccessToken" in query:
+            token = {"signature": "fake", "value": json.dumps({"expires": time.time() + 3600})}
+            return {"data": {"videoPlaybackAccessToken": token}}
+
+        if match := re.search(r'video\(id: "(\d+)"\)', query):
+            return {"data": {"video": self._video(match[1])}}
+
+        if match := re.search(r'clip\(slug: "([^"]+)"\)', query):
+            return {"data": {"clip": self._clip(int(match[1].split("-")[-1]))}}
+
+        if match := re.search(r'clips\(\s*first: (\d+),\s*after: "(\d*)"', query):
+            return {"data": {"user": {"clips": self._clips_page(int(match[1]), match[2])}}}
+
+        if "videos(" in query:
+            return {"data": {"user": {"videos": self._videos_page()}}}
+
+        if "game(name:" in query:
+            return {"data": {"game": {"id": "1"}}}
+
+        return _gql_error("Unknown query")
+
+    def _video(self, video_id: str) -> Dict[str, Any]:
+        owner = {"id": "1", "login": CHANNEL, "displayName": "FakeStreamer"}
+        return {
+            "id": video_id,
+            "title": "Fake stream",
+            "description": None,
+            "createdAt": "2025-01-01T00:00:00Z",
+            "recordedAt": "2025-01-01T00:00:00Z",
+            "publishedAt": "2025-01-01T00:00:00Z",
+            "updatedAt": "2025-01-01T00:00:00Z",
+            "broadcastType": "ARCHIVE",
+            "lengthSeconds": self.server.config.duration,
+            "status": "RECORDED",
+            "viewCount": 1000,
+            "seekPreviewsURL": f"{self.server.url}/cdn/vods/{video_id}/storyboards/0.json",
+            "game": {"id": "1", "name": "Fake Game"},
+            "owner": owner,
+            "creator": owner,
+        }
+
+    def _videos_page(self) -> Dict[str, Any]:
+        video = self._video(VIDEO_ID)
+        return {
+            "totalCount": 1,
+            "pageInfo": {"hasNextPage": False},
+            "edges": [{"cursor": "0", "node": video}],
+        }
+
+    def _clip(self, index: int) -> Dict[str, Any]:
+        slug = f"FakeClip-{index}"
+        return {
+            "id": str(2000000000 + index),
+            "slug": slug,
+            "title": f"Fake clip {index}",
+            "createdAt": "2025-01-01T00:00:00Z",
+            "viewCount": 1000 - index,
+            "durationSeconds": 30,
+            "url": f"{self.server.url}/clips/{slug}",
+            "videoQualities": self._clip_qualities(slug),
+            "game": {"id": "1", "name": "Fake Game"},
+            "broadcaster": {"displayName": "FakeStreamer", "login": CHANNEL},
+        }
+
+    def _clip_qualities(self, slug: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                "frameRate": 60,
+                "quality": quality,
+                "sourceURL": f"{self.server.url}/cdn/clips/{slug}-{quality}.mp4",
+            }
+            for quality in ["1080", "720"]
+        ]
+
+    def _clips_page(self, first: int, after: str) -> Dict[str, Any]:
+        start = int(after) + 1 if after else 0
+        end = min(start + first, self.server.config.clip_count)
+        return {
+            "pageInfo": {
+                "hasNextPage": end < self.server.config.clip_count,
+                "hasPreviousPage": start > 0,
+            },
+            "edges": [{"cursor": str(n), "node": self._clip(n)} for n in range(start, end)],
+        }
+
+    def _clip_access_token(self, slug: str) -> Dict[str, Any]:
+        value = json.dumps({"expires": int(time.time()) + 3600})
+        return {
+            "id": slug,
+            "playbackAccessToken": {"signature": "fake", "value": value},
+            "videoQualities": self._clip_qualities(slug),
+        }
+
+    def _comments(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        comments = self.server.comments
+
+        if "cursor" in variables:
+            start = int(variables["cursor"]) + 1
+        else:
+            offset = variables.get("contentOffsetSeconds", 0)
+            start = next(
+                (n for n, c in enumerate(comments) if c["contentOffsetSeconds"] >= offset),
+                len(comments),
+            )
+
+        end = min(start + COMMENTS_PAGE_SIZE, len(comments))
+        return {
+            "id": variables["videoID"],
+            "comments": {
+                "edges": [{"cursor": str(n), "node": comments[n]} for n in range(start, end)],
+                "pageInfo": {"hasNextPage": end < len(comments), "hasPreviousPage": start > 0},
+            },
+        }
+
+
+def _gql_error(message: str) -> Dict[str, Any]:
+    return {"errors": [{"message": message}]}
+
+
+def _make_content(size: int, seed: int) -> bytes:
+    # Repeat a random block instead of generating all of it, which is slow for
+    # large sizes and makes no difference to the client
+    block = random.Random(seed).randbytes(min(size, 64 * 1024))
+    return (block * (size // len(block) + 1))[:size] if block else b""
+
+
+def _make_ssl_context(cert_dir: Path, host: str) -> ssl.SSLContext:
+    """Generate a self-signed certificate for host and a server context using it"""
+    cert = cert_dir / "cert.pem"
+    key = cert_dir / "key.pem"
+    command = ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1"]
+    command += ["-subj", f"/CN={host}", "-addext", f"subjectAltName=IP:{host}"]
+    command += ["-keyout", str(key), "-out", str(cert)]
+    subprocess.run(command, check=True, capture_output=True)
+
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    context.set_alpn_protocols(["h2", "http/1.1"])
+    return context
+
+
+def server_options(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Add options for each Config field to a click command"""
+    defaults = Config()
+    options = [
+        click.option("--duration", default=defaults.duration, help="Video length in seconds"),
+        click.option(
+            "--segment-size",
+            default=str(defaults.segment_size),
+            callback=validate_size,
+            help="VOD segment size, e.g. 2m",
+        ),
+        click.option("--clip-count", default=defaults.clip_count, help="Number of clips"),
+        click.option(
+            "--clip-size",
+            default=str(defaults.clip_size),
+            callback=validate_size,
+            help="Clip size, e.g. 5m",
+        ),
+        click.option(
+            "--latency",
+            default=defaults.latency,
+            help="Round trip time added to each request and connection, in milliseconds",
+        ),
+        click.option(
+            "--bandwidth",
+            callback=validate_size,
+            help="CDN bandwidth per connection in bytes per second, e.g. 10m",
+        ),
+        click.option(
+            "--error-rate",
+            default=defaults.error_rate,
+            type=click.FloatRange(0, 1),
+            help="Share of CDN requests which fail",
+        ),
+        click.option("--seed", default=defaults.seed, help="Seed for generated content"),
+        click.option("--tls", is_flag=True, help="Use HTTPS, and HTTP/2 for the CDN if supported"),
+    ]
+
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+@click.command(context_settings={"show_default": True})
+@click.option("--port", default=8000, help="Port to listen on")
+@server_options
+def main(port: int, **options: Any):
+    """Run a local stand-in for Twitch."""
+    server = FakeTwitch(Config(**options), ("127.0.0.1", port))
+    click.echo(f"Serving on {server.url}, video {VIDEO_ID}, channel {CHANNEL}")
+    for name, value in server.env.items():
+        click.echo(f"export {name}={value}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+Microbenchmarks for hot pure-Python code paths, using large generated inputs.
+
+Each benchmark is run several times and the fastest run is reported, since it's
+the least affected by other processes. Fast benchmarks are called repeatedly
+within a run, so that the run is long enough to be measured reliably.
+
+Results can be saved to a JSON file per release and compared with results
+saved earlier to find regressions. Compare only results from the same machine
+and Python version.
+
+Usage:
+    python -m benchmarks.micro [NAME]...
+    python -m benchmarks.micro --save
+    python -m benchmarks.micro --compare benchmarks/results/twitch-dl-2.10.0.json
+"""
+
+import io
+import json
+import platform
+import sys
+import time
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+
+import twitchdl
+from benchmarks.chat_corpus import make_comments
+from twitchdl import naming, output, utils
+from twitchdl.chat.ytt import wrap_lines
+from twitchdl.chat.ytt_options import YttOptions
+from twitchdl.entities import Video
+from twitchdl.fonts import Coverage, Font, make_group_by_font
+from twitchdl.playlists import (
+    enumerate_vods,
+    filter_vods,
+    load_m3u8,
+    make_join_playlist,
+    parse_playlists,
+)
+from twitchdl.progress import Progress
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+REGRESSION_THRESHOLD = 0.15
+"""Relative slowdown over previous results which is reported as a regression"""
+
+MIN_RUN_TIME = 0.2
+"""Minimum duration of a single run, in seconds"""
+
+SEGMENT_COUNT = 4320
+"""Number of segments in a 12 hour video"""
+
+
+@dataclass
+class Case:
+    run: Callable[[Any], Any]
+    """Function being benchmarked, called with the result of setup"""
+    items: int
+    """Number of items processed by a single run, used to report throughput"""
+    setup: Callable[[], Any] = lambda: None
+    """Prepares input for a single run, not included in the measured time"""
+
+
+BENCHMARKS: Dict[str, Callable[[], Case]] = {}
+
+
+def benchmark(func: Callable[[], Case]) -> Callable[[], Case]:
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+@benchmark
+def parse_master_playlists() -> Case:
+    count = 100
+    text = _master_playlist(count)
+    return Case(lambda _: parse_playlists(text), count)
+
+
+@benchmark
+def enumerate_segments() -> Case:
+    document = load_m3u8(_media_playlist(SEGMENT_COUNT))
+    return Case(lambda _: list(enumerate_vods(document)), SEGMENT_COUNT)
+
+
+@benchmark
+def filter_segments() -> Case:
+    vods = list(enumerate_vods(load_m3u8(_media_playlist(SEGMENT_COUNT))))
+    return Case(lambda _: filter_vods(vods, 3 * 3600 + 5, 9 * 3600 + 5), SEGMENT_COUNT)
+
+
+@benchmark
+def join_playlist() -> Case:
+    text = _media_playlist(SEGMENT_COUNT)
+    vods = list(enumerate_vods(load_m3u8(text)))
+    targets = [Path("cache", vod.filename) for vod in vods]
+    # Makes changes to the playlist, so each run needs a fresh one
+    return Case(
+        lambda document: make_join_playlist(document, vods, targets),
+        SEGMENT_COUNT,
+        setup=lambda: load_m3u8(text),
+    )
+
+
+@benchmark
+def progress_advance() -> Case:
+    tasks = 500
+    chunks = 100
+
+    def run(progress: Progress):
+        with redirect_stdout(io.StringIO()):
+            for task_id in range(tasks):
+                progress.start(task_id, chunks * 1024)
+                for _ in range(chunks):
+                    progress.advance(task_id, 1024)
+                progress.end(task_id)
+
+    return Case(run, tasks * chunks, setup=lambda: Progress(tasks))
+
+
+@benchmark
+def progress_print() -> Case:
+    count = 10_000
+
+    def setup() -> Progress:
+        progress = Progress(count)
+        with redirect_stdout(io.StringIO()):
+            for task_id in range(100):
+                progress.start(task_id, 1024 * 1024)
+                progress.advance(task_id, 1024)
+        return progress
+
+    def run(progress: Progress):
+        with redirect_stdout(io.StringIO()):
+            for _ in range(count):
+                # Bypass throttling so every call prints
+                progress.last_printed = None
+                progress.print()
+
+    return Case(run, count, setup=setup)
+
+
+@benchmark
+def group_by_font() -> Case:
+    def font(name: str, ranges: List[range]) -> Font:
+        image_font: Any = name
+        codepoints = Coverage.from_codepoints(c for r in ranges for c in r)
+        return Font(Path(name), image_font, codepoints, False, 10)
+
+    fonts = [
+        font("latin", [range(0x20, 0x250)]),
+        font("cjk", [range(0x20, 0x7F), range(0x3000, 0xA000), range(0xAC00, 0xD7A4)]),
+        font("emoji", [range(0x2600, 0x27C0), range(0x1F300, 0x1FAFF)]),
+    ]
+    texts = [_comment_text(comment) for comment in _comments()]
+
+    def run(_: None):
+        group = make_group_by_font(fonts, lambda char: None)
+        for text in texts:
+            for _ in group(text):
+                pass
+
+    return Case(run, len(texts))
+
+
+@benchmark
+def ytt_wrap_lines() -> Case:
+    comments = _comments()
+    options = YttOptions(
+        background_color="#FEFEFE",
+        background_opacity=0,
+        font_size=0,
+        font_style="3",
+        foreground_color="#FEFEFE",
+        foreground_opacity=254,
+        horizontal_offset=70,
+        text_align="0",
+        text_edge_color="#000000",
+        text_edge_type="4",
+        vertical_offset=0,
+        line_count=13,
+        line_chars=25,
+    )
+
+    def run(_: None):
+        for comment in comments:
+            wrap_lines(comment, options)  # type: ignore
+
+    return Case(run, len(comments))
+
+
+@benchmark
+def format_filename() -> Case:
+    videos = [_video(n, _comment_text(comment)) for n, comment in enumerate(_comments())]
+
+    def run(_: None):
+        for video in videos:
+            naming.video_filename(video, "mp4", naming.DEFAULT_VIDEO_OUTPUT)
+
+    return Case(run, len(videos))
+
+
+@benchmark
+def slugify() -> Case:
+    texts = [_comment_text(comment) for comment in _comments()]
+
+    def run(_: None):
+        for text in texts:
+            utils.slugify(text)
+
+    return Case(run, len(texts))
+
+
+@benchmark
+def print_table() -> Case:
+    rows = [
+        [f"/cache/twitch-dl/videos/{n}", _comment_text(comment), str(n), f"{n * 1.5:.1f} MB"]
+        for n, comment in enumerate(_comments()[:20_000])
+    ]
+
+    def run(_: None):
+        with redirect_stdout(io.StringIO()):
+            output.print_table(
+                rows,
+                headers=["Path", "Title", "Files", "Size"],
+                alignments={2: "right", 3: "right"},
+            )
+
+    return Case(run, len(rows))
+
+
+@click.command()
+@click.argument("names", nargs=-1, type=click.Choice(list(BENCHMARKS)))
+@click.option("-r", "--repeat", default=5, show_default=True, help="Runs per benchmark")
+@click.option("-s", "--save", is_flag=True, help=f"Save results to {RESULTS_DIR.name}/")
+@click.option(
+    "-c",
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Compare with results saved earlier, exit with an error on regressions",
+)
+@click.option(
+    "-t",
+    "--threshold",
+    default=REGRESSION_THRESHOLD,
+    show_default=True,
+    help="Relative slowdown which is considered a regression",
+)
+def main(
+    names: List[str],
+    repeat: int,
+    save: bool,
+    compare: Optional[Path],
+    threshold: float,
+):
+    """Run microbenchmarks"""
+    previous = json.loads(compare.read_text())["results"] if compare else {}
+    results: Dict[str, Dict[str, float]] = {}
+    regressions: List[str] = []
+    rows: List[List[str]] = []
+
+    for name in names or BENCHMARKS:
+        case = BENCHMARKS[name]()
+        duration = _measure(case, repeat)
+        results[name] = {"time": duration, "items": case.items}
+
+        row = [
+            name,
+            str(case.items),
+            f"{duration * 1000:.1f}ms",
+            f"{case.items / duration:,.0f}",
+        ]
+
+        if name in previous:
+            change = duration / previous[name]["time"] - 1
+            row.append(f"{change:+.1%}")
+            if change > threshold:
+                regressions.append(name)
+        elif compare:
+            row.append("")
+
+        rows.append(row)
+
+    headers = ["Benchmark", "Items", "Time", "Items/s"] + (["Change"] if compare else [])
+    output.print_table(rows, headers=headers, alignments={1: "right", 2: "right", 3: "right"})
+
+    if save:
+        path = _save(results)
+        click.echo(f"\nSaved results to {path}")
+
+    if regressions:
+        click.secho(f"\nRegressions: {', '.join(regressions)}", fg="red", err=True)
+        sys.exit(1)
+
+
+def _measure(case: Case, repeat: int) -> float:
+    """Duration of a single call in the fastest run, in seconds"""
+    calls = 1
+    while _run(case, calls) < MIN_RUN_TIME:
+        calls *= 2
+
+    return min(_run(case, calls) for _ in range(repeat)) / calls
+
+
+def _run(case: Case, calls: int) -> float:
+    duration = 0.0
+    for _ in range(calls):
+        data = case.setup()
+        start = time.perf_counter()
+        case.run(data)
+        duration += time.perf_counter() - start
+    return duration
+
+
+def _save(results: Dict[str, Dict[str, float]]) -> Path:
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"twitch-dl-{twitchdl.__version__}.json"
+    data = {
+        "version": twitchdl.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    path.write_text(json.dumps(data, indent=2) + "\n")
+    return path
+
+
+@lru_cache(maxsize=None)
+def _comments() -> List[Dict[str, Any]]:
+    return make_comments(50_000)
+
+
+def _comment_text(comment: Dict[str, Any]) -> str:
+    return "".join(fragment["text"] for fragment in comment["message"]["fragments"])
+
+
+def _video(n: int, title: str) -> Video:
+    owner: Any = {"id": "1", "login": "streamer", "displayName": "Streamer"}
+    video: Any = {
+        "id": str(1000000000 + n),
+        "title": title,
+        "createdAt": "2025-01-01T12:00:00Z",
+        "game": {"id": "1", "name": "Dark Souls III"},
+        "owner": owner,
+    }
+    return video
+
+
+def _master_playlist(count: int) -> str:
+    lines = ["#EXTM3U"]
+    for n in range(count):
+        group_id = "chunked" if n == 0 else f"{1080 - n}p60"
+        lines += [
+            f'#EXT-X-MEDIA:TYPE=VIDEO,GROUP-ID="{group_id}",NAME="{1080 - n}p60"'
+            + ",AUTOSELECT=YES,DEFAULT=YES",
+            f"#EXT-X-STREAM-INF:BANDWIDTH={8_000_000 - n},RESOLUTION=1920x{1080 - n}"
+            + f',CODECS="avc1.64002A,mp4a.40.2",VIDEO="{group_id}",FRAME-RATE=60.000',
+            f"https://example.com/{group_id}/index-dvr.m3u8",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _media_playlist(count: int) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:10"]
+    for n in range(count):
+        lines += ["#EXTINF:10.000,", f"{n}.ts"]
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measure startup time of common twitch-dl commands which don't make any network
+requests, to catch import time regressions.
+
+Startup time is reported on top of the time it takes to start the interpreter.
+Also checks that modules which are slow to import are not imported by commands
+which don't need them, and lists the modules which took longest to import, as
+reported by `python -X importtime`.
+
+Exits with a non-zero status if any command exceeds the budget or imports a
+module which should be imported lazily.
+
+Usage: python -m benchmarks.startup [RUNS] [BUDGET_MS]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+COMMANDS = [
+    ["--help"],
+    ["--version"],
+    ["cache"],
+    ["info", "--help"],
+    ["download", "--help"],
+    ["videos", "--help"],
+    ["clips", "--help"],
+    ["chat", "video", "--help"],
+]
+
+BUDGET_MS = 150
+"""Maximum startup time of a command on top of interpreter startup"""
+
+LAZY_MODULES = {"asyncio", "fontTools", "httpx", "m3u8", "PIL"}
+"""Modules which must not be imported by any of COMMANDS"""
+
+TOP_IMPORTS = 5
+"""Number of slowest modules to list for each command"""
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else BUDGET_MS
+
+    with tempfile.TemporaryDirectory() as cache_home:
+        # Don't touch the user's cache dir when running `cache`
+        env = {**os.environ, "XDG_CACHE_HOME": cache_home}
+
+        baseline = _measure([sys.executable, "-c", "pass"], runs, env)
+        print(f"Interpreter startup: {baseline:.0f}ms\n")
+
+        failed = False
+        for args in COMMANDS:
+            command = [sys.executable, "-m", "twitchdl", *args]
+            duration = _measure(command, runs, env) - baseline
+            imports = _import_times(command, env)
+            lazy = sorted(LAZY_MODULES & {name.split(".")[0] for name in imports})
+
+            over_budget = duration > budget
+            failed = failed or over_budget or bool(lazy)
+
+            status = "FAIL" if over_budget or lazy else "ok"
+            print(f"twitch-dl {' '.join(args)}: {duration:.0f}ms [{status}]")
+            if lazy:
+                print(f"  Imports lazy modules: {', '.join(lazy)}")
+            slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)
+            for name, self_time in slowest[:TOP_IMPORTS]:
+                print(f"  {self_time / 1000:6.1f}ms  {name}")
+
+    print(f"\nBudget: {budget:.0f}ms")
+    if failed:
+        sys.exit(1)
+
+
+def _measure(command: List[str], runs: int, env: Dict[str, str]) -> float:
+    """Median wall time of running the command, in milliseconds"""
+    durations: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def _import_times(command: List[str], env: Dict[str, str]) -> Dict[str, int]:
+    """
+    Run the command with `-X importtime` and return the time it took to import
+    each module, excluding its dependencies, in microseconds.
+    """
+    command = [command[0], "-X", "importtime", *command[1:]]
+    result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+
+    imports: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # Lines look like: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, _, name = line.removeprefix("import time:").split("|")
+        imports[name.strip()] = int(self_time)
+
+    return imports
+
+
+if __name__ == "__main__":
+    main()
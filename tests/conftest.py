@@ -0,0 +1,14 @@
+from typing import Generator
+
+import pytest
+
+from twitchdl import cache_index
+
+
+@pytest.fixture(autouse=True)
+def flush_cache_index() -> Generator[None, None, None]:
+    # Index writes are deferred until exit, when the cache dir set up by a test
+    # no longer applies, so write them to the test's cache dir when it's done
+    cache_index._pending.clear()
+    yield
+    cache_index.flush()
@@ -0,0 +1,127 @@
+import os
+import time
+from pathlib import Path
+from typing import Any, List
+
+import httpx
+import pytest
+
+from twitchdl import api_cache, twitch
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(api_cache, "enabled", True)
+    return tmp_path / "twitch-dl" / api_cache.API_CACHE_SUBDIR
+
+
+def test_make_key():
+    key = api_cache.make_key({"query": "{ video(id: 1) { id } }"})
+    assert key == api_cache.make_key({"query": "\n  {\n    video(id: 1) {\n  id } }\n"})
+    assert key != api_cache.make_key({"query": "{ video(id: 2) { id } }"})
+
+    key = api_cache.make_key({"operationName": "Foo", "variables": {"a": 1, "b": 2}})
+    assert key == api_cache.make_key({"variables": {"b": 2, "a": 1}, "operationName": "Foo"})
+    assert key != api_cache.make_key({"operationName": "Foo", "variables": {"a": 1, "b": 3}})
+
+
+def test_get_put(monkeypatch: pytest.MonkeyPatch):
+    assert api_cache.get("foo") is None
+
+    api_cache.put("foo", {"bar": 1}, 60)
+    assert api_cache.get("foo") == {"bar": 1}
+
+    # Expired entries are discarded
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert api_cache.get("foo") is None
+
+    # Disabled cache is bypassed
+    monkeypatch.setattr(api_cache, "enabled", False)
+    api_cache.put("bar", {"bar": 1}, 60)
+    assert api_cache.get("bar") is None
+
+
+def test_evict(cache_dir: Path):
+    for n in range(10):
+        api_cache.put(f"key{n}", "x" * 100, 60)
+        path = cache_dir / f"key{n}.json"
+        os.utime(path, (n, n))
+
+    size = sum(f.stat().st_size for f in cache_dir.iterdir())
+    api_cache.evict(size - 1)
+
+    # Oldest entries are evicted until below 80% of the max size
+    remaining = sorted(f.name for f in cache_dir.iterdir())
+    assert remaining == [f"key{n}.json" for n in range(3, 10)]
+
+
+def test_evict_recently_used(cache_dir: Path):
+    for n in range(10):
+        api_cache.put(f"key{n}", "x" * 100, 60)
+        path = cache_dir / f"key{n}.json"
+        os.utime(path, (n, n))
+
+    # Reading an entry marks it as recently used
+    assert api_cache.get("key0") == "x" * 100
+
+    size = sum(f.stat().st_size for f in cache_dir.iterdir())
+    api_cache.evict(size - 1)
+
+    remaining = sorted(f.name for f in cache_dir.iterdir())
+    assert remaining == ["key0.json"] + [f"key{n}.json" for n in range(4, 10)]
+
+
+def test_evict_throttled(monkeypatch: pytest.MonkeyPatch):
+    calls: List[int] = []
+    monkeypatch.setattr(api_cache, "evict", lambda: calls.append(1))
+    monkeypatch.setattr(api_cache, "_last_evicted", 0.0)
+
+    api_cache.put("foo", 1, 60)
+    api_cache.put("bar", 2, 60)
+    assert len(calls) == 1
+
+
+def test_gql_query_cache(monkeypatch: pytest.MonkeyPatch):
+    requests: List[Any] = []
+
+    def authenticated_post(url: str, *, json: Any = None, auth_token: Any = None):
+        requests.append(json)
+        request = httpx.Request("POST", url)
+        return httpx.Response(200, json={"data": {"n": len(requests)}}, request=request)
+
+    monkeypatch.setattr(twitch, "authenticated_post", authenticated_post)
+
+    # Not cached without ttl
+    assert twitch.gql_query("{ foo }") == {"data": {"n": 1}}
+    assert twitch.gql_query("{ foo }") == {"data": {"n": 2}}
+
+    # Cached with ttl
+    assert twitch.gql_query("{ bar }", ttl=60) == {"data": {"n": 3}}
+    assert twitch.gql_query("{ bar }", ttl=60) == {"data": {"n": 3}}
+
+    # Authenticated queries are never cached
+    assert twitch.gql_query("{ baz }", auth_token="x", ttl=60) == {"data": {"n": 4}}
+    assert twitch.gql_query("{ baz }", auth_token="x", ttl=60) == {"data": {"n": 5}}
+
+    query = {"operationName": "Foo", "variables": {"id": "1"}}
+    assert twitch.gql_persisted_query(query, ttl=60) == {"data": {"n": 6}}
+    assert twitch.gql_persisted_query(query, ttl=60) == {"data": {"n": 6}}
+    assert len(requests) == 6
+
+
+def test_gql_query_cache_not_found(monkeypatch: pytest.MonkeyPatch):
+    requests: List[Any] = []
+
+    def authenticated_post(url: str, *, json: Any = None, auth_token: Any = None):
+        requests.append(json)
+        request = httpx.Request("POST", url)
+        return httpx.Response(200, json={"data": {"video": None}}, request=request)
+
+    monkeypatch.setattr(twitch, "authenticated_post", authenticated_post)
+
+    # Lookups which found nothing are not cached
+    assert twitch.gql_query("{ video }", ttl=60) == {"data": {"video": None}}
+    assert twitch.gql_query("{ video }", ttl=60) == {"data": {"video": None}}
+    assert len(requests) == 2
@@ -0,0 +1,58 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from twitchdl import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: List[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        status, content = (404, b"") if self.path == "/missing" else (200, self.path.encode())
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+def test_download_cached_all():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    cached_url = f"{base_url}/cached"
+    cache.cached_path(cached_url, subdir="emotes").write_bytes(b"cached")
+    urls = [cached_url, f"{base_url}/missing"] + [f"{base_url}/emote{n}" for n in range(10)]
+
+    try:
+        paths, stats = cache.download_cached_all(urls, subdir="emotes", workers=4)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert sorted(Handler.requests) == sorted(["/missing"] + [f"/emote{n}" for n in range(10)])
+    assert stats == cache.PrefetchStats(cached=1, downloaded=10, failed=1)
+    assert str(stats) == "1 cached, 10 downloaded, 1 failed (8% hit rate)"
+
+    assert paths[f"{base_url}/missing"] is None
+    assert paths[cached_url] == cache.cached_path(cached_url, subdir="emotes")
+    assert paths[f"{base_url}/emote3"].read_bytes() == b"/emote3"  # type: ignore
+
+    # Downloaded files are used by download_cached
+    url = f"{base_url}/emote3"
+    assert cache.download_cached(url, subdir="emotes") == paths[url]
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from twitchdl import cache, cache_index
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    # Evict exactly to the limit to make results predictable
+    monkeypatch.setattr(cache_index, "EVICT_TO", 1)
+    return tmp_path / "twitch-dl"
+
+
+def make_file(path: Path, size: int, age: float) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    timestamp = time.time() - age
+    os.utime(path, (timestamp, timestamp))
+    os.utime(path.parent, (timestamp, timestamp))
+    return path
+
+
+def indexed_paths():
+    with closing(cache_index._connect()) as conn:
+        return {path for (path,) in conn.execute("SELECT path FROM files")}
+
+
+def test_evict_lru(cache_dir: Path):
+    emotes = cache_dir / "emotes"
+    make_file(emotes / "old", 100, 5000)
+    make_file(emotes / "older", 100, 6000)
+    make_file(emotes / "new", 100, 10)
+    make_file(cache_dir / "sync" / "channel.json", 100, 9000)
+
+    result = cache_index.evict(300, policy="lru")
+    assert result == cache_index.EvictionResult(files=1, size=100)
+    assert not (emotes / "older").exists()
+    assert indexed_paths() == {"emotes/old", "emotes/new", "sync/channel.json"}
+
+    # Recently used and pinned files are not evicted
+    result = cache_index.evict(0, policy="lru")
+    assert result == cache_index.EvictionResult(files=1, size=100)
+    assert indexed_paths() == {"emotes/new", "sync/channel.json"}
+
+
+def test_evict_lfu(cache_dir: Path):
+    badges = cache_dir / "badges"
+    popular = make_file(badges / "popular", 100, 5000)
+    make_file(badges / "unpopular", 100, 6000)
+    make_file(badges / "forgotten", 100, 7000)
+
+    # Index the files first to record accesses
+    cache_index.evict()
+    cache_index.touch(popular)
+    cache_index.touch(popular)
+    cache_index.touch(badges / "unpopular")
+    cache_index.flush()
+
+    # Make accesses old enough to allow eviction
+    with closing(cache_index._connect()) as conn, conn:
+        conn.execute("UPDATE files SET accessed = ?", (time.time() - 5000,))
+
+    result = cache_index.evict(150, policy="lfu")
+    assert result.files == 2
+    assert indexed_paths() == {"badges/popular"}
+
+
+def test_evict_quotas(cache_dir: Path):
+    make_file(cache_dir / "emotes" / "a", 100, 5000)
+    make_file(cache_dir / "emotes" / "b", 100, 6000)
+    make_file(cache_dir / "fonts" / "c", 100, 7000)
+
+    result = cache_index.evict(quotas={"emotes": 100})
+    assert result.files == 1
+    assert indexed_paths() == {"emotes/a", "fonts/c"}
+
+
+def test_evict_removes_empty_dirs(cache_dir: Path):
+    segment = make_file(cache_dir / "videos" / "123" / "chunked" / "00001.ts", 100, 5000)
+    active = make_file(cache_dir / "videos" / "456" / "chunked" / "00001.ts", 100, 5000)
+
+    # Files in directories which were recently written to belong to running jobs
+    os.utime(active.parent)
+
+    cache_index.evict(0)
+    assert not segment.exists()
+    assert not (cache_dir / "videos" / "123").exists()
+    assert active.exists()
+    assert (cache_dir / "videos").exists()
+
+
+def test_touch(cache_dir: Path, tmp_path: Path):
+    path = make_file(cache_dir / "emotes" / "foo", 100, 5000)
+    cache_index.touch(path)
+    cache_index.touch(path)
+    cache_index.touch(tmp_path / "elsewhere")
+    cache_index.flush()
+
+    with closing(cache_index._connect()) as conn:
+        rows = conn.execute("SELECT path, subdir, size, hits FROM files").fetchall()
+    assert rows == [("emotes/foo", "emotes", 100, 2)]
+
+
+def test_flush_to_touched_root(cache_dir: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = make_file(cache_dir / "emotes" / "a", 10, 0)
+    cache_index.touch(path)
+
+    # Written to the cache dir the file was touched in
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "other"))
+    cache_index.flush()
+    assert not (tmp_path / "other").exists()
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert indexed_paths() == {"emotes/a"}
+
+
+def test_download_cached_touches(cache_dir: Path):
+    path = cache_dir / "fonts" / "font.ttf"
+    make_file(path, 10, 0)
+    url = "https://example.com/font.ttf"
+    assert cache.download_cached(url, subdir="fonts", filename="font.ttf") == path
+    assert cache_index._pending == {(str(cache_dir), "fonts/font.ttf"): 1}
+
+
+def test_background_evict(cache_dir: Path):
+    path = make_file(cache_dir / "emotes" / "a", 100, 5000)
+
+    cache_index._background_evict(0, "lru")
+    assert not path.exists()
+
+    # Skipped when recently evicted, possibly by another process
+    make_file(path, 100, 5000)
+    cache_index._background_evict(0, "lru")
+    assert path.exists()
+
+
+def test_background_evict_stopped(cache_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    path = make_file(cache_dir / "emotes" / "a", 100, 5000)
+    monkeypatch.setattr(cache_index, "_stopping", threading.Event())
+
+    # Stopping on exit commits the files evicted so far
+    cache_index.rescan()
+    cache_index._stopping.set()
+    result = cache_index.evict(0)
+    assert result == cache_index.EvictionResult()
+    assert path.exists()
+    assert indexed_paths() == {"emotes/a"}
+
+    # Scanning is abandoned
+    with pytest.raises(cache_index.EvictionStopped):
+        cache_index.rescan()
+
+
+def test_exit_stops_background_evict(cache_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    path = make_file(cache_dir / "emotes" / "a", 100, 5000)
+    monkeypatch.setattr(cache_index, "_stopping", threading.Event())
+    monkeypatch.setattr(cache_index, "_exit_registered", True)
+    monkeypatch.setattr(cache_index, "max_size", 0)
+    monkeypatch.setattr(cache_index, "_evict_thread", None)
+
+    def background_evict(max_size: int, policy: cache_index.Policy):
+        # Hold the write lock until asked to stop, like a long eviction
+        with closing(cache_index._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cache_index._stopping.wait()
+            conn.commit()
+
+    monkeypatch.setattr(cache_index, "_background_evict", background_evict)
+    cache_index.evict_in_background()
+    cache_index.touch(path)
+
+    # Eviction is stopped before flushing, which would otherwise wait for it
+    start = time.monotonic()
+    cache_index._on_exit()
+    assert time.monotonic() - start < 1
+    assert indexed_paths() == {"emotes/a"}
+
+
+def test_usage(cache_dir: Path):
+    make_file(cache_dir / "emotes" / "a", 100, 5000)
+    make_file(cache_dir / "emotes" / "b", 50, 5000)
+    make_file(cache_dir / "fonts" / "c", 10, 5000)
+
+    # First use scans the cache dir
+    assert cache_index.usage() == {"emotes": (2, 150), "fonts": (1, 10)}
+
+    # Files added through the cache are indexed, others only after a rescan
+    segments = cache.Cache(cache_dir / "videos" / "123")
+    make_file(segments.get_path("00001.ts"), 20, 0)
+    make_file(cache_dir / "fonts" / "d", 10, 0)
+    assert cache_index.usage() == {"emotes": (2, 150), "fonts": (1, 10), "videos": (1, 20)}
+
+    cache_index.rescan()
+    assert cache_index.usage() == {"emotes": (2, 150), "fonts": (2, 20), "videos": (1, 20)}
+
+    # Deleted files are removed from the index
+    segments.delete()
+    assert cache_index.usage() == {"emotes": (2, 150), "fonts": (2, 20)}
+
+    cache_index.clear("emotes")
+    assert cache_index.usage() == {"fonts": (2, 20)}
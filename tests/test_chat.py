@@ -0,0 +1,233 @@
+import io
+import json
+import re
+from pathlib import Path
+from typing import Any, List, Optional
+from xml.etree import ElementTree
+
+import pytest
+
+from twitchdl import locks
+from twitchdl.chat import archive, comments
+from twitchdl.chat import json as chat_json
+from twitchdl.chat.comments import Shard, generate_comment_pages, make_shards
+from twitchdl.chat.json import write_json, write_json_lines
+from twitchdl.chat.utils import USER_COLORS
+from twitchdl.chat.ytt import Comment as YttComment
+from twitchdl.chat.ytt import YttOptions, split_words, wc_width, wrap_lines, write_ytt
+
+
+def test_make_shards():
+    assert make_shards(0) == [Shard(0, None)]
+    assert make_shards(100) == [Shard(0, None)]
+    assert make_shards(3600) == [Shard(0, 1800), Shard(1800, None)]
+    assert make_shards(3601) == [Shard(0, 1200), Shard(1200, 2400), Shard(2400, None)]
+    assert make_shards(3600, start=1800) == [Shard(1800, None)]
+    assert make_shards(5000, start=6000) == [Shard(6000, None)]
+
+    shards = make_shards(100_000)
+    assert len(shards) == 10
+    assert shards[0].start == 0
+    assert shards[-1].end is None
+
+
+def _fake_get_comments(offsets: List[int], page_size: int):
+    """Simulates the comments API for comments at given offsets"""
+
+    async def get_comments(
+        client: Any,
+        video_id: str,
+        *,
+        cursor: Optional[str] = None,
+        offset_seconds: Optional[int] = None,
+    ):
+        if cursor is not None:
+            start = int(cursor) + 1
+        else:
+            start = next((i for i, o in enumerate(offsets) if o >= (offset_seconds or 0)), 0)
+            # Simulate the API returning a few comments before the offset
+            start = max(start - 2, 0)
+
+        page = offsets[start : start + page_size]
+        edges = [
+            {"cursor": str(n), "node": {"id": f"c{n}", "contentOffsetSeconds": offset}}
+            for n, offset in enumerate(page, start)
+        ]
+        has_next = start + page_size < len(offsets)
+        return {"comments": {"edges": edges, "pageInfo": {"hasNextPage": has_next}}}
+
+    return get_comments
+
+
+@pytest.mark.parametrize("max_shards", [1, 3, 10])
+def test_generate_comment_pages(monkeypatch: pytest.MonkeyPatch, max_shards: int):
+    offsets = sorted([n * 7 % 5000 for n in range(1000)] + [1800, 1800, 3600])
+    monkeypatch.setattr(comments.twitch_async, "get_comments", _fake_get_comments(offsets, 7))
+
+    pages = list(generate_comment_pages("1", 5000, max_shards=max_shards))
+    fetched = [c["contentOffsetSeconds"] for page in pages for c in page.comments]
+    assert fetched == offsets
+
+
+def test_comment_archive(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    video: Any = {"id": "1", "lengthSeconds": 5000, "status": "RECORDED"}
+
+    offsets = list(range(0, 5000, 10))
+    monkeypatch.setattr(comments.twitch_async, "get_comments", _fake_get_comments(offsets, 7))
+    fetched = [c["contentOffsetSeconds"] for c in archive.load_comments(video)]
+    assert fetched == offsets
+
+    # Archived comments are read without contacting Twitch
+    monkeypatch.setattr(comments.twitch_async, "get_comments", None)
+    archived = [c["contentOffsetSeconds"] for c in archive.load_comments(video)]
+    assert archived == offsets
+
+    # Refresh only fetches comments after the last archived one
+    offsets.extend([5000, 5001])
+    monkeypatch.setattr(comments.twitch_async, "get_comments", _fake_get_comments(offsets, 7))
+    refreshed = [c["contentOffsetSeconds"] for c in archive.load_comments(video, refresh=True)]
+    assert refreshed == offsets
+
+    monkeypatch.setattr(comments.twitch_async, "get_comments", None)
+    archived = [c["contentOffsetSeconds"] for c in archive.load_comments(video)]
+    assert archived == offsets
+
+
+def test_comment_archive_recording(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    video: Any = {"id": "1", "lengthSeconds": 100, "status": "RECORDING"}
+
+    offsets = [1, 2, 3]
+    monkeypatch.setattr(comments.twitch_async, "get_comments", _fake_get_comments(offsets, 2))
+    assert [c["contentOffsetSeconds"] for c in archive.load_comments(video)] == offsets
+
+    # New comments are fetched without refresh while the video is recording
+    offsets.extend([4, 5])
+    fetched = [c["contentOffsetSeconds"] for c in archive.load_comments(video)]
+    assert fetched == offsets
+
+
+def test_comment_archive_lock(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    video: Any = {"id": "1", "lengthSeconds": 100, "status": "RECORDED"}
+    monkeypatch.setattr(comments.twitch_async, "get_comments", _fake_get_comments([1, 2, 3], 2))
+
+    # The archive is locked from loading its state until it's fully read
+    lock = locks.path_lock(str(archive._archive_path("1")))
+    pages = archive.load_comment_pages(video)
+    next(pages)
+    assert not lock.acquire(blocking=False)
+
+    list(pages)
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_write_json():
+    video: Any = {"id": "1", "title": "Foo ✨"}
+    video_comments: Any = {"badges": [{"id": "b1"}]}
+    chat_comments: Any = [{"id": f"c{n}", "contentOffsetSeconds": n} for n in range(3)]
+
+    f = io.StringIO()
+    write_json(f, video, video_comments, iter(chat_comments))
+    expected = {"video": video, "video_comments": video_comments, "comments": chat_comments}
+    assert f.getvalue() == json.dumps(expected)
+
+    f = io.StringIO()
+    write_json(f, video, video_comments, iter([]))
+    expected = {"video": video, "video_comments": video_comments, "comments": []}
+    assert f.getvalue() == json.dumps(expected)
+
+
+def test_render_chat_json_failure(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    video: Any = {"id": "1", "title": "Foo"}
+    target = tmp_path / "chat.json"
+
+    def generate_comments(video: Any, refresh: bool):
+        yield {"id": "c1", "contentOffsetSeconds": 1}
+        raise ConnectionError("Network down")
+
+    monkeypatch.setattr(chat_json, "get_video", lambda id: video)
+    monkeypatch.setattr(chat_json, "get_target_path", lambda *args: target)
+    monkeypatch.setattr(chat_json, "get_video_comments", lambda id: {"badges": []})
+    monkeypatch.setattr(chat_json, "generate_comments", generate_comments)
+
+    with pytest.raises(ConnectionError):
+        chat_json.render_chat_json("1", str(target), overwrite=False, refresh=False)
+
+    # Nothing is left at the target, or in temp files
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_json_lines():
+    video: Any = {"id": "1", "title": "Foo ✨"}
+    video_comments: Any = {"badges": [{"id": "b1"}]}
+    chat_comments: Any = [{"id": f"c{n}", "contentOffsetSeconds": n} for n in range(3)]
+
+    f = io.StringIO()
+    write_json_lines(f, video, video_comments, iter(chat_comments))
+    lines = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert lines == [{"video": video, "video_comments": video_comments}] + chat_comments
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_write_ytt(pretty: bool):
+    options = YttOptions("#FEFEFE", 0, 0, "3", "#FEFEFE", 254, 70, "0", "#000000", "4", 0, 3, 25)
+    ytt_comments = [
+        YttComment(
+            start=1000 * (n // 2), username=f"user{n}", color=USER_COLORS[0], lines=["a", "b"]
+        )
+        for n in range(10)
+    ]
+
+    f = io.BytesIO()
+    write_ytt(f, iter(ytt_comments), options, 10_000, pretty)
+    root = ElementTree.fromstring(f.getvalue())
+
+    paragraphs = root.findall("body/p")
+    assert [p.get("t") for p in paragraphs] == ["0", "1000", "2000", "3000", "4000"]
+    assert [p.get("d") for p in paragraphs] == ["1000", "1000", "1000", "1000", "6000"]
+
+    # Only the last 3 lines are visible
+    last = paragraphs[-1]
+    assert [s.text for s in last.findall("s")] == ["b", "user9: ", "a", "b"]
+
+
+def test_write_ytt_empty():
+    options = YttOptions("#FEFEFE", 0, 0, "3", "#FEFEFE", 254, 70, "0", "#000000", "4", 0, 3, 25)
+
+    f = io.BytesIO()
+    write_ytt(f, iter([]), options, 10_000, False)
+    root = ElementTree.fromstring(f.getvalue())
+    assert root.find("body") is not None
+    assert root.findall("body/p") == []
+
+
+def test_split_words():
+    for text in ["", " ", "  ", "a", " a", "a ", " a  b\tc\n", "a　b", "\x1fx\x1c"]:
+        assert split_words(text) == re.split(r"\s+", text)
+
+
+def test_wc_width():
+    assert wc_width("") == 0
+    assert wc_width("Kappa") == 5
+    assert wc_width("日本語") == 6
+    assert wc_width("señor") == 5
+    assert wc_width("a\x01") == -1
+
+
+def test_wrap_lines():
+    options = YttOptions("#FEFEFE", 0, 0, "3", "#FEFEFE", 254, 70, "0", "#000000", "4", 0, 3, 20)
+
+    def wrap(username: str, text: str):
+        comment: Any = {
+            "commenter": {"displayName": username},
+            "message": {"fragments": [{"text": text}]},
+        }
+        return wrap_lines(comment, options)
+
+    assert wrap("foo", "bar baz") == ["bar baz"]
+    assert wrap("foo", "bar baz qux quux") == ["bar baz qux", "quux"]
+    assert wrap("foo", "日本語 日本語 日本語 日本語") == ["日本語 日本語", "日本語 日本語"]
+    assert wrap("foobarbazquxquuxcorge", "a") == ["", "a"]
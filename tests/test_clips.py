@@ -0,0 +1,195 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from twitchdl import twitch_async
+from twitchdl.commands import clips
+from twitchdl.entities import Clip, Data, Page
+from twitchdl.exceptions import ConsoleError
+from twitchdl.twitch import GQLError
+
+
+def _clip(index: int) -> Clip:
+    clip: Any = {
+        "id": str(index),
+        "slug": f"slug{index}",
+        "title": f"Clip {index}",
+        "createdAt": "2024-01-02T03:04:05Z",
+        "broadcaster": {"login": "channel"},
+        "videoQualities": [{"sourceURL": f"https://example.com/{index}.mp4"}],
+    }
+    return clip
+
+
+def test_download_clips_pipeline(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+):
+    events: List[str] = []
+    pages = [[_clip(1), _clip(2)], [_clip(3), _clip(4)], [_clip(5)]]
+
+    async def page_generator(client: Any, channel_id: str, period: str, page_size: int):
+        for index, items in enumerate(pages):
+            events.append(f"page {index + 1}")
+            yield Page(index + 1, index + 1 < len(pages), items)
+
+    async def download_clip(client: Any, tokens: Any, task: clips.Task):
+        await asyncio.sleep(0.01)
+        events.append(f"download {task.slug}")
+        task.target.touch()
+        return True
+
+    monkeypatch.setattr(clips.twitch_async, "channel_clips_page_generator", page_generator)
+    monkeypatch.setattr(clips, "_download_clip", download_clip)
+    batches = _fake_batch_query(monkeypatch)
+
+    # Existing clips are skipped
+    existing = tmp_path / clips._target_filename(_clip(2), _clip(2)["videoQualities"])
+    existing.touch()
+
+    asyncio.run(clips.download_clips("channel", "all_time", tmp_path, workers=2))
+
+    downloads = [e for e in events if e.startswith("download")]
+    assert sorted(downloads) == [
+        "download slug1",
+        "download slug3",
+        "download slug4",
+        "download slug5",
+    ]
+
+    # All pages are fetched before the first download completes
+    assert events.index("page 3") < events.index("download slug1")
+    assert len(list(tmp_path.iterdir())) == 5
+
+    out, _ = capsys.readouterr()
+    assert "Downloaded 4 clips, 1 already existed, 0 failed" in out
+
+    # Access tokens are loaded in batches, once per clip
+    assert sorted(sum(batches, [])) == ["slug1", "slug3", "slug4", "slug5"]
+
+
+def test_download_clips_fetch_error(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    async def page_generator(client: Any, channel_id: str, period: str, page_size: int):
+        yield Page(1, True, [_clip(1)])
+        raise ValueError("fetch failed")
+
+    async def download_clip(client: Any, tokens: Any, task: clips.Task):
+        task.target.touch()
+        return True
+
+    monkeypatch.setattr(clips.twitch_async, "channel_clips_page_generator", page_generator)
+    monkeypatch.setattr(clips, "_download_clip", download_clip)
+
+    with pytest.raises(ValueError, match="fetch failed"):
+        asyncio.run(clips.download_clips("channel", "all_time", tmp_path, workers=2))
+
+
+def _fake_batch_query(monkeypatch: pytest.MonkeyPatch, expires: float = 0) -> List[List[str]]:
+    batches: List[List[str]] = []
+    expires = expires or time.time() + 3600
+
+    async def batch_query(client: Any, queries: List[Data]):
+        slugs = [q["variables"]["slug"] for q in queries]
+        batches.append(slugs)
+        return [_token_response(slug, expires) for slug in slugs]
+
+    monkeypatch.setattr(twitch_async, "gql_persisted_query_batch", batch_query)
+    return batches
+
+
+def _token_response(slug: str, expires: float) -> Data:
+    if slug == "missing":
+        return {"data": {"clip": None}}
+
+    if slug == "error":
+        return {"errors": [{"message": "bad slug"}], "data": {"clip": None}}
+
+    value = json.dumps({"clip_slug": slug, "expires": int(expires)})
+    return {
+        "data": {
+            "clip": {
+                "id": slug,
+                "playbackAccessToken": {"signature": "sig", "value": value},
+                "videoQualities": [],
+            }
+        }
+    }
+
+
+def test_clip_access_token_batcher(monkeypatch: pytest.MonkeyPatch):
+    batches = _fake_batch_query(monkeypatch)
+
+    async def run():
+        tokens = twitch_async.ClipAccessTokenBatcher(Any, batch_size=3)
+        slugs = ["a", "b", "c", "d", "a"]
+        results = await asyncio.gather(*[tokens.get(slug) for slug in slugs])
+        assert [r["id"] for r in results] == slugs
+
+        # Cached tokens are not fetched again
+        tokens.prefetch(["a", "e"])
+        assert (await tokens.get("e"))["id"] == "e"
+        assert (await tokens.get("b"))["id"] == "b"
+
+        with pytest.raises(ConsoleError, match="Access token not found for slug 'missing'"):
+            await tokens.get("missing")
+
+        with pytest.raises(GQLError, match="bad slug"):
+            await tokens.get("error")
+
+        await tokens.close()
+        return tokens.requests
+
+    requests = asyncio.run(run())
+    assert batches == [["a", "b", "c"], ["d"], ["e"], ["missing"], ["error"]]
+    assert requests == 5
+
+
+def test_clip_access_token_batcher_expiry(monkeypatch: pytest.MonkeyPatch):
+    # Tokens expiring within the margin are not cached
+    expires = time.time() + twitch_async.TOKEN_EXPIRY_MARGIN - 1
+    batches = _fake_batch_query(monkeypatch, expires)
+
+    async def run():
+        tokens = twitch_async.ClipAccessTokenBatcher(Any)
+        await tokens.get("a")
+        await tokens.get("a")
+
+    asyncio.run(run())
+    assert batches == [["a"], ["a"]]
+
+
+def test_clip_access_token_batcher_failure(monkeypatch: pytest.MonkeyPatch):
+    async def batch_query(client: Any, queries: List[Data]):
+        raise ValueError("request failed")
+
+    monkeypatch.setattr(twitch_async, "gql_persisted_query_batch", batch_query)
+
+    async def run():
+        tokens = twitch_async.ClipAccessTokenBatcher(Any)
+        results = await asyncio.gather(tokens.get("a"), tokens.get("b"), return_exceptions=True)
+        assert [str(r) for r in results] == ["request failed", "request failed"]
+
+    asyncio.run(run())
+
+
+def test_scan_clips(tmp_path: Path):
+    names = [
+        "20240102_123_channel_some_title.mp4",
+        "20240102_456_channel_name_renamed_title.mp4",
+        "20240102_789_channel_partial.mp4.tmp",
+        "20240102_abc_channel_not_a_clip.mp4",
+        "notes.txt",
+    ]
+    for name in names:
+        (tmp_path / name).touch()
+    (tmp_path / "20240102_999_channel_directory").mkdir()
+
+    assert clips._scan_clips(tmp_path) == {
+        "123": tmp_path / "20240102_123_channel_some_title.mp4",
+        "456": tmp_path / "20240102_456_channel_name_renamed_title.mp4",
+    }
@@ -0,0 +1,77 @@
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("fontTools")
+
+from twitchdl.fonts import Coverage, Font, make_group_by_font  # noqa: E402
+
+
+def _font(name: str, codepoints: List[int]) -> Font:
+    image_font: Any = name
+    return Font(Path(name), image_font, Coverage.from_codepoints(codepoints), False, 10)
+
+
+LATIN = _font("latin", list(range(0x20, 0x250)))
+CJK = _font("cjk", list(range(0x20, 0x7F)) + list(range(0x3000, 0xA000)))
+EMOJI = _font("emoji", list(range(0x1F300, 0x1FAFF)))
+
+
+def test_coverage(tmp_path: Path):
+    coverage = Coverage.from_codepoints([0, 65, 0x3042, 0x10FFFF])
+    assert len(coverage) == 4
+    assert 0 in coverage
+    assert 65 in coverage
+    assert 66 not in coverage
+    assert 0x3042 in coverage
+    assert 0x10FFFF in coverage
+
+    path = tmp_path / "font.cov"
+    coverage.save(path)
+    loaded = Coverage.load(path)
+    assert loaded.bitmap == coverage.bitmap
+    assert len(loaded) == 4
+
+    with pytest.raises(ValueError):
+        Coverage(b"foo")
+
+
+def _group(fonts: List[Font], text: str):
+    not_found: List[str] = []
+    group_by_font = make_group_by_font(fonts, not_found.append)
+    groups = [(fragment, font.path.name) for fragment, font in group_by_font(text)]
+    return groups, not_found
+
+
+def test_group_by_font():
+    fonts = [LATIN, CJK, EMOJI]
+
+    assert _group(fonts, "") == ([], [])
+    assert _group(fonts, "Hello world!") == ([("Hello world!", "latin")], [])
+    assert _group(fonts, "Hello 日本語 🔥🔥 ok") == (
+        [
+            ("Hello ", "latin"),
+            ("日本語", "cjk"),
+            (" ", "latin"),
+            ("🔥🔥", "emoji"),
+            (" ok", "latin"),
+        ],
+        [],
+    )
+
+    # Chars which cannot be rendered are skipped
+    assert _group(fonts, "abࠀcd") == ([("abcd", "latin")], ["ࠀ"])
+    assert _group(fonts, "ࠀࠁ") == ([], ["ࠀ", "ࠁ"])
+    assert _group(fonts, "a\tb") == ([("ab", "latin")], ["\t"])
+
+
+def test_group_by_font_no_ascii_font():
+    # ASCII is split between two fonts so there's no single font for it
+    low = _font("low", list(range(0x20, 0x50)))
+    high = _font("high", list(range(0x50, 0x7F)))
+
+    groups, not_found = _group([low, high], "ABC xyz")
+    assert groups == [("ABC ", "low"), ("xyz", "high")]
+    assert not_found == []
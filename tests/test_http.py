@@ -0,0 +1,174 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, List
+
+import httpx
+import pytest
+
+from twitchdl import http
+from twitchdl.exceptions import ConsoleError
+from twitchdl.http import ConnectionStats, MultiplexingTransport, download_all, make_transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+FILE = bytes(range(256)) * 4
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves FILE, honouring single Range headers, and records requested paths"""
+
+    protocol_version = "HTTP/1.1"
+    requests: List[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        range_header = self.headers.get("Range")
+        if range_header:
+            start, end = range_header.removeprefix("bytes=").split("-")
+            content = FILE[int(start) : int(end) + 1]
+            self.send_response(206)
+        else:
+            content = FILE
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+def test_connection_stats():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    async def run(stats: ConnectionStats):
+        async with httpx.AsyncClient(event_hooks={"request": [stats.on_request]}) as client:
+            for _ in range(5):
+                response = await client.get(url)
+                assert response.text == "ok"
+
+    try:
+        stats = ConnectionStats()
+        asyncio.run(run(stats))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert stats.requests == 5
+    assert stats.connections == 1
+    assert stats.reused == 4
+    assert str(stats) == "5 requests over 1 connections (4 reused)"
+
+
+def test_download_all_priority(tmp_path: Path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    sources = [(f"{url}/{n}.mp4", tmp_path / f"{n}.mp4") for n in range(3)]
+    priority = [
+        (f"{url}/init.mp4", tmp_path / "init-100.mp4", (100, 199)),
+        (f"{url}/init-0.mp4", tmp_path / "init-0.mp4", None),
+    ]
+
+    try:
+        asyncio.run(download_all(sources, 1, count=3, priority=priority))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # With a single worker, priority downloads go first
+    assert FileHandler.requests == ["/init.mp4", "/init-0.mp4", "/0.mp4", "/1.mp4", "/2.mp4"]
+    assert (tmp_path / "init-100.mp4").read_bytes() == FILE[100:200]
+    assert (tmp_path / "init-0.mp4").read_bytes() == FILE
+    assert (tmp_path / "2.mp4").read_bytes() == FILE
+
+
+class Body(httpx.AsyncByteStream):
+    """Response body which is not read up front, like bodies from real transports"""
+
+    async def __aiter__(self):
+        yield b"ok"
+
+
+def mock_transport(requests: List[str]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        return httpx.Response(200, stream=Body())
+
+    return httpx.MockTransport(handler)
+
+
+def test_multiplexing_transport_spreads_requests():
+    first: List[str] = []
+    second: List[str] = []
+    transport = MultiplexingTransport([mock_transport(first), mock_transport(second)], 2)
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "http://example.com/1"):
+                async with client.stream("GET", "http://example.com/2"):
+                    async with client.stream("GET", "http://example.com/3"):
+                        assert transport.active == [2, 1]
+                assert transport.active == [1, 0]
+
+            assert transport.active == [0, 0]
+            response = await client.get("http://example.com/4")
+            assert response.text == "ok"
+            assert transport.active == [0, 0]
+
+    asyncio.run(run())
+
+    assert first == ["/1", "/3", "/4"]
+    assert second == ["/2"]
+
+
+def test_multiplexing_transport_limits_streams():
+    requests: List[str] = []
+    transport = MultiplexingTransport([mock_transport(requests)], 1)
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "http://example.com/1"):
+                second = asyncio.create_task(client.get("http://example.com/2"))
+                await asyncio.sleep(0.01)
+                assert requests == ["/1"]
+
+            await second
+            assert requests == ["/1", "/2"]
+
+    asyncio.run(run())
+
+
+def test_make_transport(monkeypatch: pytest.MonkeyPatch):
+    assert make_transport(10) is None
+
+    monkeypatch.setattr(http, "http2", True)
+    try:
+        import h2  # type: ignore # noqa: F401
+    except ImportError:
+        with pytest.raises(ConsoleError, match="twitch-dl\\[http2\\]"):
+            make_transport(10)
+        return
+
+    transport = make_transport(10)
+    assert isinstance(transport, MultiplexingTransport)
+    assert len(transport.transports) == 2
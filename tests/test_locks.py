@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from twitchdl import cache, http, locks
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+# flock locks are held per open file, so locks taken through different
+# FileLock instances exclude each other even within a single process.
+
+
+def test_exclusive_lock():
+    first = locks.path_lock("foo")
+    second = locks.path_lock("foo")
+
+    with first:
+        assert first.locked
+        assert not second.acquire(blocking=False)
+        assert not second.locked
+        assert locks.path_lock("bar").acquire(blocking=False)
+
+    assert not first.locked
+    assert second.acquire(blocking=False)
+    second.release()
+
+
+def test_shared_lock():
+    first = locks.path_lock("foo", shared=True)
+    second = locks.path_lock("foo", shared=True)
+    assert first.acquire(blocking=False)
+    assert second.acquire(blocking=False)
+    assert not locks.path_lock("foo").acquire(blocking=False)
+
+    # Cannot upgrade while another process holds a shared lock
+    assert not first.upgrade(blocking=False)
+    first.release()
+    assert second.upgrade(blocking=False)
+    assert not locks.path_lock("foo", shared=True).acquire(blocking=False)
+    second.release()
+
+
+def test_striped_lock():
+    paths = {locks.striped_lock(f"emote-{n}").path for n in range(1000)}
+    assert len(paths) <= locks.STRIPES
+    assert locks.striped_lock("foo").path == locks.striped_lock("foo").path
+
+
+def test_download_cached_once(monkeypatch: pytest.MonkeyPatch):
+    downloads = []
+
+    def download_file(url: str, target: Path):
+        downloads.append(url)
+        time.sleep(0.1)
+        target.write_bytes(b"emote")
+
+    monkeypatch.setattr(http, "download_file", download_file)
+
+    url = "https://example.com/emote.png"
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.download_cached(url, subdir="emotes")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert downloads == [url]
+    assert len(set(results)) == 1
+    assert results[0].read_bytes() == b"emote"
+
+
+def test_download_cached_all_once(monkeypatch: pytest.MonkeyPatch):
+    downloads: List[str] = []
+
+    async def download_async(client: Any, url: str, target: Path):
+        downloads.append(url)
+        await asyncio.sleep(0.1)
+        target.write_bytes(b"emote")
+
+    monkeypatch.setattr(cache, "_download_async", download_async)
+
+    urls = [f"https://example.com/emote{n}.png" for n in range(5)]
+    results: List[cache.PrefetchStats] = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.download_cached_all(urls, subdir="emotes")[1])
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Each file is downloaded once, others wait for it and use the cached file
+    assert sorted(downloads) == urls
+    assert sum(stats.downloaded for stats in results) == 5
+    assert sum(stats.cached for stats in results) == 10
+
+
+def test_cache_delete_shared(tmp_path: Path):
+    first = cache.Cache(tmp_path / "videos" / "123")
+    second = cache.Cache(tmp_path / "videos" / "123")
+    first.get_path("00000.ts").write_bytes(b"segment")
+    second.get_path("00000.ts")
+
+    # Cache is in use by another job, keep it
+    first.delete()
+    assert (tmp_path / "videos" / "123" / "00000.ts").exists()
+
+    # Last one to finish deletes it
+    second.delete()
+    assert not (tmp_path / "videos" / "123").exists()
@@ -0,0 +1,310 @@
+import struct
+from typing import List, Optional
+
+from twitchdl import probe
+from twitchdl.subonly import PROBE_SIZE, _probe_range
+
+
+class BitWriter:
+    def __init__(self):
+        self.bits: List[int] = []
+
+    def u(self, bits: int, value: int):
+        self.bits.extend((value >> (bits - 1 - i)) & 1 for i in range(bits))
+
+    def ue(self, value: int):
+        value += 1
+        length = value.bit_length()
+        self.u(length - 1, 0)
+        self.u(length, value)
+
+    def se(self, value: int):
+        self.ue(2 * value - 1 if value > 0 else -2 * value)
+
+    def bytes(self) -> bytes:
+        bits = self.bits + [1]  # rbsp_stop_one_bit
+        bits += [0] * (-len(bits) % 8)
+        return bytes(
+            int("".join(str(b) for b in bits[i : i + 8]), 2) for i in range(0, len(bits), 8)
+        )
+
+
+def make_sps(
+    width: int,
+    height: int,
+    frame_rate: Optional[int] = None,
+    profile_idc: int = 100,
+    scaling_matrix: bool = False,
+) -> bytes:
+    w = BitWriter()
+    w.u(8, profile_idc)
+    w.u(8, 0)  # constraint flags
+    w.u(8, 42)  # level_idc
+    w.ue(0)  # seq_parameter_set_id
+    if profile_idc == 100:
+        w.ue(1)  # chroma_format_idc
+        w.ue(0)  # bit_depth_luma_minus8
+        w.ue(0)  # bit_depth_chroma_minus8
+        w.u(1, 0)  # qpprime_y_zero_transform_bypass_flag
+        w.u(1, int(scaling_matrix))
+        if scaling_matrix:
+            w.u(1, 1)  # first list present
+            for _ in range(16):
+                w.se(1)
+            for _ in range(7):
+                w.u(1, 0)
+    w.ue(0)  # log2_max_frame_num_minus4
+    w.ue(0)  # pic_order_cnt_type
+    w.ue(2)  # log2_max_pic_order_cnt_lsb_minus4
+    w.ue(4)  # max_num_ref_frames
+    w.u(1, 0)  # gaps_in_frame_num_value_allowed_flag
+
+    width_in_mbs = (width + 15) // 16
+    height_in_mbs = (height + 15) // 16
+    w.ue(width_in_mbs - 1)
+    w.ue(height_in_mbs - 1)
+    w.u(1, 1)  # frame_mbs_only_flag
+    w.u(1, 1)  # direct_8x8_inference_flag
+
+    crop_right = (width_in_mbs * 16 - width) // 2
+    crop_bottom = (height_in_mbs * 16 - height) // 2
+    if crop_right or crop_bottom:
+        w.u(1, 1)
+        w.ue(0)
+        w.ue(crop_right)
+        w.ue(0)
+        w.ue(crop_bottom)
+    else:
+        w.u(1, 0)
+
+    w.u(1, 1 if frame_rate else 0)  # vui_parameters_present_flag
+    if frame_rate:
+        w.u(1, 1)  # aspect_ratio_info_present_flag
+        w.u(8, 1)  # aspect_ratio_idc
+        w.u(1, 0)  # overscan_info_present_flag
+        w.u(1, 1)  # video_signal_type_present_flag
+        w.u(3, 5)
+        w.u(1, 0)
+        w.u(1, 1)  # colour_description_present_flag
+        w.u(24, 0x010101)
+        w.u(1, 0)  # chroma_loc_info_present_flag
+        w.u(1, 1)  # timing_info_present_flag
+        w.u(32, 1)  # num_units_in_tick
+        w.u(32, frame_rate * 2)  # time_scale
+        w.u(1, 1)  # fixed_frame_rate_flag
+
+    return b"\x67" + escape_rbsp(w.bytes())
+
+
+def escape_rbsp(data: bytes) -> bytes:
+    """Insert emulation prevention bytes"""
+    result = bytearray()
+    zeros = 0
+    for byte in data:
+        if zeros >= 2 and byte <= 3:
+            result.append(3)
+            zeros = 0
+        result.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(result)
+
+
+def test_parse_sps():
+    sps = probe.parse_sps(make_sps(1920, 1080, 60))
+    assert sps == probe.SPS(1920, 1080, 60)
+
+    sps = probe.parse_sps(make_sps(1280, 720))
+    assert sps == probe.SPS(1280, 720, None)
+
+    sps = probe.parse_sps(make_sps(852, 480, 30, profile_idc=77))
+    assert sps == probe.SPS(852, 480, 30)
+
+    sps = probe.parse_sps(make_sps(2560, 1440, 60, scaling_matrix=True))
+    assert sps == probe.SPS(2560, 1440, 60)
+
+
+def test_unescape_rbsp():
+    assert probe._unescape_rbsp(b"\x00\x00\x03\x01\x00\x00\x03\x00") == b"\x00\x00\x01\x00\x00\x00"
+
+
+# ------------------------------------------------------------------------------
+# MPEG-TS
+# ------------------------------------------------------------------------------
+
+PMT_PID = 0x1000
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+
+
+def ts_packet(pid: int, payload: bytes, start: bool) -> bytes:
+    header = struct.pack(">BHB", 0x47, (0x4000 if start else 0) | pid, 0x10)
+    if len(payload) >= 184:
+        return header + payload[:184]
+
+    # Pad short payloads using an adaptation field
+    padding = 184 - len(payload)
+    header = struct.pack(">BHB", 0x47, (0x4000 if start else 0) | pid, 0x30)
+    field = bytes([padding - 1]) + (b"\x00" + b"\xff" * (padding - 2) if padding > 1 else b"")
+    return header + field + payload
+
+
+def ts_packets(pid: int, data: bytes) -> bytes:
+    packets = b""
+    first = True
+    while data:
+        packet = ts_packet(pid, data[:184], first)
+        packets += packet
+        data = data[184:]
+        first = False
+    return packets
+
+
+def psi(table_id: int, body: bytes) -> bytes:
+    section_length = len(body) + 5 + 4
+    section = struct.pack(">BHHBBB", table_id, 0xB000 | section_length, 1, 0xC1, 0, 0)
+    return b"\x00" + section + body + b"\x00\x00\x00\x00"
+
+
+def pes(data: bytes, pts: int) -> bytes:
+    pts_bytes = bytes(
+        [
+            0x21 | ((pts >> 29) & 0x0E),
+            (pts >> 22) & 0xFF,
+            ((pts >> 14) & 0xFE) | 1,
+            (pts >> 7) & 0xFF,
+            ((pts << 1) & 0xFE) | 1,
+        ]
+    )
+    return b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + pts_bytes + data
+
+
+def make_ts(sps: bytes, frame_rate: int, frames: int = 5, stream_type: int = 0x1B) -> bytes:
+    pat = psi(0, struct.pack(">HH", 1, 0xE000 | PMT_PID))
+    pmt_streams = struct.pack(">BHH", 0x0F, 0xE000 | AUDIO_PID, 0xF000)
+    pmt_streams += struct.pack(">BHH", stream_type, 0xE000 | VIDEO_PID, 0xF000)
+    pmt = psi(2, struct.pack(">HH", 0xE000 | VIDEO_PID, 0xF000) + pmt_streams)
+
+    data = ts_packet(0, pat, True) + ts_packet(PMT_PID, pmt, True)
+    data += ts_packets(AUDIO_PID, b"\xff" * 300)
+
+    frame_duration = 90000 // frame_rate
+    # Out of order timestamps as with B-frames
+    pts_order = [0, 3, 1, 2, 4, 7, 5, 6][:frames]
+    for n, index in enumerate(pts_order):
+        nal = b"\x00\x00\x00\x01\x09\xf0"
+        if n == 0:
+            nal += b"\x00\x00\x00\x01" + sps
+        nal += b"\x00\x00\x01\x65" + b"\x88" * 400
+        data += ts_packets(VIDEO_PID, pes(nal, 900 + index * frame_duration))
+
+    return data
+
+
+def test_probe_ts():
+    # Frame rate from SPS
+    data = make_ts(make_sps(1920, 1080, 60), 30)
+    assert probe.probe(data) == probe.VideoInfo(1920, 1080, 60)
+
+    # Frame rate from PTS when not in SPS
+    data = make_ts(make_sps(1280, 720), 60)
+    assert probe.probe(data) == probe.VideoInfo(1280, 720, 60)
+
+    data = make_ts(make_sps(852, 480), 30)
+    assert probe.probe(data) == probe.VideoInfo(852, 480, 30)
+
+    # Truncated data is fine as long as it contains the SPS
+    data = make_ts(make_sps(1920, 1080, 60), 30)
+    assert probe.probe(data[:1500]) == probe.VideoInfo(1920, 1080, 60)
+
+    # Not H.264
+    data = make_ts(make_sps(1920, 1080, 60), 30, stream_type=0x24)
+    assert probe.probe(data) is None
+
+
+# ------------------------------------------------------------------------------
+# MP4
+# ------------------------------------------------------------------------------
+
+
+def box(type: bytes, *children: bytes) -> bytes:
+    payload = b"".join(children)
+    return struct.pack(">I4s", 8 + len(payload), type) + payload
+
+
+def full_box(type: bytes, version: int, *children: bytes) -> bytes:
+    return box(type, bytes([version, 0, 0, 0]), *children)
+
+
+def make_mp4_init(sps: Optional[bytes], width: int, height: int, sample_duration: int) -> bytes:
+    avcc = b""
+    if sps:
+        avcc = box(b"avcC", bytes([1, 100, 0, 42, 0xFF, 0xE1]), struct.pack(">H", len(sps)), sps)
+
+    sample_entry = box(
+        b"avc1",
+        b"\x00" * 6 + struct.pack(">H", 1) + b"\x00" * 16,
+        struct.pack(">HH", width, height),
+        b"\x00" * 50,
+        avcc,
+    )
+
+    video_trak = box(
+        b"trak",
+        full_box(b"tkhd", 0, struct.pack(">III", 0, 0, 1), b"\x00" * 68),
+        box(
+            b"mdia",
+            full_box(b"mdhd", 0, struct.pack(">IIII", 0, 0, 90000, 0), b"\x00" * 4),
+            full_box(b"hdlr", 0, b"\x00" * 4, b"vide", b"\x00" * 13),
+            box(
+                b"minf",
+                box(b"stbl", full_box(b"stsd", 0, struct.pack(">I", 1), sample_entry)),
+            ),
+        ),
+    )
+
+    audio_trak = box(
+        b"trak",
+        full_box(b"tkhd", 1, b"\x00" * 16, struct.pack(">I", 2), b"\x00" * 72),
+        box(
+            b"mdia",
+            full_box(b"mdhd", 1, b"\x00" * 16, struct.pack(">I", 48000), b"\x00" * 12),
+            full_box(b"hdlr", 0, b"\x00" * 4, b"soun", b"\x00" * 13),
+        ),
+    )
+
+    mvex = box(
+        b"mvex",
+        full_box(b"trex", 0, struct.pack(">IIIII", 2, 1, 1024, 0, 0)),
+        full_box(b"trex", 0, struct.pack(">IIIII", 1, 1, sample_duration, 0, 0)),
+    )
+
+    ftyp = box(b"ftyp", b"iso5\x00\x00\x02\x00iso6mp41")
+    return ftyp + box(b"moov", audio_trak, video_trak, mvex)
+
+
+def test_probe_mp4():
+    data = make_mp4_init(make_sps(1920, 1080, 60), 1920, 1080, 3000)
+    assert probe.probe(data) == probe.VideoInfo(1920, 1080, 60)
+
+    # Frame rate from default sample duration when not in SPS
+    data = make_mp4_init(make_sps(1280, 720), 1280, 720, 1500)
+    assert probe.probe(data) == probe.VideoInfo(1280, 720, 60)
+
+    data = make_mp4_init(None, 1280, 720, 0)
+    assert probe.probe(data) == probe.VideoInfo(1280, 720, None)
+
+
+def test_probe_unknown():
+    assert probe.probe(b"") is None
+    assert probe.probe(b"foo" * 1000) is None
+
+    # Broken data doesn't raise
+    data = make_mp4_init(make_sps(1920, 1080, 60), 1920, 1080, 3000)
+    assert probe.probe(data[:200]) is None
+
+
+def test_probe_range():
+    assert _probe_range(None) == (0, PROBE_SIZE - 1)
+    assert _probe_range("720@100") == (100, 819)
+    assert _probe_range("720") == (0, 719)
+    assert _probe_range(f"{PROBE_SIZE * 2}@10") == (10, PROBE_SIZE + 9)
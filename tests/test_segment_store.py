@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import pytest
+
+from twitchdl import segment_store
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+def test_store_path():
+    path = segment_store.store_path("https://foo.cloudfront.net/abc_123/chunked/1.ts")
+    assert path.parent.name == segment_store.SEGMENTS_SUBDIR
+    assert path.suffix == ".ts"
+
+    # Host doesn't matter, path does
+    assert path == segment_store.store_path("https://bar.cloudfront.net/abc_123/chunked/1.ts")
+    assert path != segment_store.store_path("https://foo.cloudfront.net/abc_123/720p60/1.ts")
+    assert path != segment_store.store_path("https://foo.cloudfront.net/abc_123/chunked/1-muted.ts")
+
+
+def test_store_and_link(tmp_path: Path):
+    base_url = "https://foo.cloudfront.net/abc_123/chunked"
+    first_job = tmp_path / "first"
+    first_job.mkdir()
+    (first_job / "00000.ts").write_bytes(b"zero")
+    (first_job / "00001.ts").write_bytes(b"one")
+
+    # Segments which failed to download are skipped
+    sources = [f"{base_url}/{n}.ts" for n in range(3)]
+    targets = [first_job / f"{n:05d}.ts" for n in range(3)]
+    assert segment_store.store(zip(sources, targets)) == 2
+    assert segment_store.store(zip(sources, targets)) == 0
+
+    stored = segment_store.store_path(sources[0])
+    assert stored.read_bytes() == b"zero"
+    assert stored.stat().st_ino == targets[0].stat().st_ino
+
+    # Deleting the job's files doesn't affect the store
+    for target in targets[:2]:
+        target.unlink()
+    assert stored.exists()
+
+    # Another job reuses the stored segments, the rest are downloaded
+    second_job = tmp_path / "second"
+    second_job.mkdir()
+    targets = [second_job / f"{n:05d}.ts" for n in range(3)]
+    assert segment_store.link_stored(zip(sources, targets)) == 2
+    assert targets[0].read_bytes() == b"zero"
+    assert targets[1].read_bytes() == b"one"
+    assert not targets[2].exists()
+    assert list(second_job.glob("*.tmp")) == []
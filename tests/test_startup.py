@@ -0,0 +1,28 @@
+"""
+Check that slow to import modules are not imported on CLI startup, see
+benchmarks/startup.py for measuring startup time.
+"""
+
+import subprocess
+import sys
+
+import twitchdl
+
+LAZY_MODULES = ["asyncio", "fontTools", "httpx", "m3u8", "PIL", "twitchdl.twitch"]
+
+
+def test_cli_lazy_imports():
+    code = "import sys, twitchdl.cli; print(' '.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set(result.stdout.split())
+
+    assert [name for name in LAZY_MODULES if name in modules] == []
+
+
+def test_version():
+    assert isinstance(twitchdl.__version__, str)
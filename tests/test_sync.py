@@ -0,0 +1,127 @@
+from pathlib import Path
+from typing import Any, List, Optional
+
+import pytest
+
+from twitchdl.commands import sync
+from twitchdl.commands.clips import DownloadStats
+from twitchdl.entities import Video
+
+DAY = sync.DAY
+
+
+def test_clips_period():
+    now = 1_700_000_000
+    assert sync.clips_period(None, now) == "all_time"
+    assert sync.clips_period(now - 3600, now) == "last_day"
+    assert sync.clips_period(now - DAY, now) == "last_week"
+    assert sync.clips_period(now - 6 * DAY, now) == "last_week"
+    assert sync.clips_period(now - 7 * DAY, now) == "last_month"
+    assert sync.clips_period(now - 29 * DAY, now) == "last_month"
+    assert sync.clips_period(now - 30 * DAY, now) == "all_time"
+
+
+def _video(id: int, status: str = "RECORDED") -> Video:
+    video: Any = {
+        "id": str(id),
+        "publishedAt": f"2024-01-{id:02}T00:00:00Z",
+        "status": status,
+    }
+    return video
+
+
+def _run_sync(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    videos: List[Video],
+    failed_clips: int = 0,
+    fail_on: Optional[str] = None,
+):
+    pages_read: List[str] = []
+    downloaded: List[str] = []
+    clip_periods: List[str] = []
+
+    def channel_videos_generator(
+        channel_id: str, max_videos: int, sort: str, type: str, prefetch: int
+    ):
+        def generator():
+            for video in videos:
+                pages_read.append(video["id"])
+                yield video
+
+        return len(videos), generator()
+
+    def download_video(video: Video, args: Any):
+        if video["id"] == fail_on:
+            raise ValueError("download failed")
+        downloaded.append(video["id"])
+
+    async def download_clips(channel_name: str, period: str, target_dir: Path, workers: int):
+        clip_periods.append(period)
+        return DownloadStats(failed=failed_clips)
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(sync.twitch, "channel_videos_generator", channel_videos_generator)
+    monkeypatch.setattr(sync, "download_video", download_video)
+    monkeypatch.setattr(sync, "download_clips", download_clips)
+
+    sync.sync(
+        "Channel",
+        auth_token=None,
+        clips=True,
+        format="mp4",
+        full=False,
+        max_workers=1,
+        output="{id}.{format}",
+        quality="source",
+        target_dir=tmp_path / "target",
+        video_types=["archive"],
+        videos=True,
+    )
+
+    return pages_read, downloaded, clip_periods
+
+
+def test_sync(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    videos = [_video(3), _video(2), _video(1)]
+    pages_read, downloaded, clip_periods = _run_sync(monkeypatch, tmp_path, videos)
+    assert pages_read == ["3", "2", "1"]
+    assert downloaded == ["1", "2", "3"]
+    assert clip_periods == ["all_time"]
+
+    state = sync._load_state(sync._state_path("channel"))
+    assert state.videos["archive"].last_id == "3"
+    assert state.clips_synced_at is not None
+
+    # Stops at the last known video, skips videos which are still recording
+    videos = [_video(6, "RECORDING"), _video(5), _video(4), _video(3), _video(2), _video(1)]
+    pages_read, downloaded, clip_periods = _run_sync(monkeypatch, tmp_path, videos)
+    assert pages_read == ["6", "5", "4", "3"]
+    assert downloaded == ["4", "5"]
+    assert clip_periods == ["last_day"]
+
+    # Stops at older videos if the last known video was deleted
+    videos = [_video(7), _video(4), _video(3)]
+    pages_read, downloaded, _ = _run_sync(monkeypatch, tmp_path, videos)
+    assert pages_read == ["7", "4"]
+    assert downloaded == ["7"]
+
+
+def test_sync_failure(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    videos = [_video(3), _video(2), _video(1)]
+    with pytest.raises(ValueError):
+        _run_sync(monkeypatch, tmp_path, videos, fail_on="2")
+
+    # State is saved for videos downloaded before the failure
+    state = sync._load_state(sync._state_path("channel"))
+    assert state.videos["archive"].last_id == "1"
+
+    # Clip sync time is not updated if any clips failed
+    pages_read, downloaded, clip_periods = _run_sync(monkeypatch, tmp_path, videos, failed_clips=1)
+    assert pages_read == ["3", "2", "1"]
+    assert downloaded == ["2", "3"]
+    assert clip_periods == ["all_time"]
+
+    state = sync._load_state(sync._state_path("channel"))
+    assert state.videos["archive"].last_id == "3"
+    assert state.clips_synced_at is None
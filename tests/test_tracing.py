@@ -0,0 +1,121 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from twitchdl import tracing
+
+
+@pytest.fixture
+def enabled(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(tracing, "enabled", False)
+    tracing.enable()
+    yield
+    tracing._spans.clear()
+
+
+def test_disabled():
+    with tracing.span("foo"):
+        pass
+
+    assert tracing.get_spans() == []
+
+
+def test_nested_spans(enabled: None):
+    with tracing.span("download", count=3):
+        for _ in range(3):
+            with tracing.span("segment"):
+                pass
+    with tracing.span("join"):
+        pass
+
+    spans = {span.name: span for span in tracing.get_spans()}
+    assert spans["download"].depth == 0
+    assert spans["download"].args == {"count": 3}
+    assert spans["segment"].depth == 1
+    assert spans["join"].depth == 0
+
+    summary = tracing._summarize(tracing.get_spans())
+    assert list(summary) == [(0, "download"), (1, "segment"), (0, "join")]
+    assert summary[(1, "segment")][0] == 3
+
+
+def test_span_recorded_on_error(enabled: None):
+    with pytest.raises(ValueError):
+        with tracing.span("foo"):
+            raise ValueError()
+
+    [span] = tracing.get_spans()
+    assert span.name == "foo"
+
+
+def test_concurrent_tasks(enabled: None):
+    async def work(name: str):
+        with tracing.span(name):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        with tracing.span("main"):
+            await asyncio.gather(
+                asyncio.create_task(work("one"), name="worker-1"),
+                asyncio.create_task(work("two"), name="worker-2"),
+            )
+
+    asyncio.run(main())
+
+    spans = {span.name: span for span in tracing.get_spans()}
+    assert spans["one"].track == "worker-1"
+    assert spans["two"].track == "worker-2"
+    assert spans["one"].depth == spans["two"].depth == 1
+
+
+def test_threads(enabled: None):
+    def work():
+        with tracing.span("work"):
+            pass
+
+    thread = threading.Thread(target=work, name="worker")
+    thread.start()
+    thread.join()
+
+    [span] = tracing.get_spans()
+    assert span.track == "worker"
+    assert span.depth == 0
+
+
+def test_chrome_trace(enabled: None, tmp_path: Path):
+    with tracing.span("download", path=Path("foo")):
+        with tracing.span("segment"):
+            pass
+
+    path = tmp_path / "trace.json"
+    tracing.write_chrome_trace(path)
+    events = json.loads(path.read_text())["traceEvents"]
+
+    metadata = [e for e in events if e["ph"] == "M"]
+    complete = [e for e in events if e["ph"] == "X"]
+
+    assert len(metadata) == 1
+    assert metadata[0]["args"] == {"name": "MainThread"}
+    assert [e["name"] for e in complete] == ["download", "segment"]
+    assert complete[0]["args"] == {"path": "foo"}
+    assert complete[0]["ts"] <= complete[1]["ts"]
+    assert complete[0]["dur"] >= complete[1]["dur"]
+
+
+def test_print_summary(enabled: None, capsys: pytest.CaptureFixture[str]):
+    with tracing.span("download"):
+        with tracing.span("segment"):
+            pass
+
+    tracing.print_summary()
+    captured = capsys.readouterr()
+
+    assert captured.out == ""
+    lines = captured.err.splitlines()
+    assert lines[1].startswith("Phase")
+    assert lines[3].startswith("download")
+    assert lines[4].startswith("· segment")
+    assert lines[-1].startswith("Total")
@@ -0,0 +1,121 @@
+import threading
+import time
+from typing import Any, List, Optional
+
+import pytest
+
+from twitchdl import twitch
+from twitchdl.entities import Data
+from twitchdl.utils import prefetch
+
+
+def test_prefetch():
+    assert list(prefetch(range(10), 0)) == list(range(10))
+    assert list(prefetch(range(10), 1)) == list(range(10))
+    assert list(prefetch(range(10), 3)) == list(range(10))
+    assert list(prefetch([], 2)) == []
+
+
+def test_prefetch_runs_ahead():
+    produced: List[int] = []
+    event = threading.Event()
+
+    def generator():
+        for x in range(5):
+            produced.append(x)
+            if x == 2:
+                event.set()
+            yield x
+
+    items = prefetch(generator(), 2)
+    assert next(items) == 0
+
+    # Items 1 and 2 are fetched in the background
+    assert event.wait(1)
+    assert produced == [0, 1, 2]
+    assert list(items) == [1, 2, 3, 4]
+
+
+def test_prefetch_error():
+    def generator():
+        yield 1
+        raise ValueError("failed")
+
+    items = prefetch(generator(), 2)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="failed"):
+        next(items)
+
+
+def test_prefetch_close():
+    produced: List[int] = []
+
+    def generator():
+        for x in range(100):
+            time.sleep(0.01)
+            produced.append(x)
+            yield x
+
+    items = prefetch(generator(), 3)
+    assert next(items) == 0
+    items.close()
+
+    # Pending fetches are cancelled, at most the one in progress completes
+    time.sleep(0.1)
+    assert len(produced) <= 3
+
+
+def _fake_clips(total: int, requests: List[Any]):
+    def get_channel_clips(channel_id: str, period: str, limit: int, after: Optional[str] = None):
+        requests.append((limit, after))
+        time.sleep(0.001)
+        start = int(after) + 1 if after else 0
+        end = min(start + limit, total)
+        edges = [{"cursor": str(n), "node": {"id": str(n)}} for n in range(start, end)]
+        return {"pageInfo": {"hasNextPage": end < total}, "edges": edges}
+
+    return get_channel_clips
+
+
+@pytest.mark.parametrize("prefetch_pages", [0, 1, 3])
+def test_channel_clips_generator(monkeypatch: pytest.MonkeyPatch, prefetch_pages: int):
+    requests: List[Any] = []
+    monkeypatch.setattr(twitch, "get_channel_clips", _fake_clips(250, requests))
+
+    def clip_ids(limit: int) -> List[str]:
+        requests.clear()
+        generator = twitch.channel_clips_generator(
+            "channel", "all_time", limit, prefetch=prefetch_pages
+        )
+        return [clip["id"] for clip in generator]
+
+    assert clip_ids(10) == [str(n) for n in range(10)]
+    assert requests == [(10, None)]
+
+    assert clip_ids(1000) == [str(n) for n in range(250)]
+    assert requests == [(100, None), (100, "99"), (100, "199")]
+
+    assert clip_ids(150) == [str(n) for n in range(150)]
+    assert requests == [(100, None), (50, "99")]
+
+
+def test_channel_videos_generator(monkeypatch: pytest.MonkeyPatch):
+    requests: List[Any] = []
+    get_clips = _fake_clips(120, requests)
+
+    def get_channel_videos(
+        channel_id: str,
+        limit: int,
+        sort: str,
+        type: str = "archive",
+        game_ids: Optional[List[str]] = None,
+        after: Optional[str] = None,
+    ) -> Data:
+        return {"totalCount": 120, **get_clips(channel_id, "all_time", limit, after)}
+
+    monkeypatch.setattr(twitch, "get_channel_videos", get_channel_videos)
+
+    total_count, generator = twitch.channel_videos_generator("channel", 1000, "time", "archive")
+    assert total_count == 120
+    assert [video["id"] for video in generator] == [str(n) for n in range(120)]
+    assert requests == [(100, None), (100, "99")]
@@ -1,4 +1,8 @@
-from twitchdl.utils import titlify, slugify
+from pathlib import Path
+
+import pytest
+
+from twitchdl.utils import atomic_write, titlify, slugify
 
 
 def test_titlify():
@@ -11,3 +15,20 @@ def test_slugify():
     assert slugify("Foo Bar Baz") == "foo_bar_baz"
     assert slugify("  Foo   Bar   Baz  ") == "foo_bar_baz"
     assert slugify("Foo@{}[] Bar Baz!\"#$%&/()=?*+'🔪") == "foo_bar_baz"
+
+
+def test_atomic_write(tmp_path: Path):
+    target = tmp_path / "foo.txt"
+
+    with atomic_write(target) as tmp:
+        tmp.write_text("foo")
+        assert not target.exists()
+    assert target.read_text() == "foo"
+
+    # Target is left as it was on failure
+    with pytest.raises(ValueError):
+        with atomic_write(target) as tmp:
+            tmp.write_text("bar")
+            raise ValueError()
+    assert target.read_text() == "foo"
+    assert list(tmp_path.iterdir()) == [target]
@@ -1,4 +1,13 @@
-from twitchdl.playlists import Vod, filter_vods
+from pathlib import Path
+
+from twitchdl.playlists import (
+    Vod,
+    enumerate_vods,
+    filter_vods,
+    get_init_sections,
+    load_m3u8,
+    make_join_playlist,
+)
 
 
 def test_filter_vods():
@@ -31,3 +40,74 @@ def test_filter_vods():
     assert filtered_vods[-1].index == 11
     assert crop_start == 3
     assert crop_duration == 52
+
+
+FMP4_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:6
+#EXT-X-TARGETDURATION:10
+#EXT-X-MAP:URI="init-0.mp4"
+#EXTINF:10.000,
+0.mp4
+#EXTINF:10.000,
+1.mp4
+#EXT-X-DISCONTINUITY
+#EXT-X-MAP:URI="init.mp4",BYTERANGE="720@100"
+#EXTINF:10.000,
+2.mp4
+#EXT-X-DISCONTINUITY
+#EXT-X-MAP:URI="init.mp4",BYTERANGE="720"
+#EXTINF:10.000,
+3.mp4
+#EXT-X-DISCONTINUITY
+#EXT-X-MAP:URI="a/init.mp4",BYTERANGE="100"
+#EXTINF:10.000,
+4.mp4
+#EXT-X-DISCONTINUITY
+#EXT-X-MAP:URI="b/init.mp4",BYTERANGE="100"
+#EXTINF:10.000,
+5.mp4
+#EXT-X-DISCONTINUITY
+#EXT-X-MAP:URI="b/init.mp4",BYTERANGE="200"
+#EXTINF:10.000,
+6.mp4
+#EXT-X-ENDLIST
+"""
+
+
+def test_init_sections():
+    document = load_m3u8(FMP4_PLAYLIST)
+    sections = get_init_sections(document)
+
+    assert [(s.uri, s.byterange) for s in sections] == [
+        ("init-0.mp4", None),
+        ("init.mp4", (100, 819)),
+        ("init.mp4", (0, 719)),
+        ("a/init.mp4", (0, 99)),
+        ("b/init.mp4", (0, 99)),
+        ("b/init.mp4", (0, 199)),
+    ]
+
+    # Names don't collide between files, byte ranges or directories
+    filenames = [s.filename for s in sections]
+    assert len(set(filenames)) == len(filenames)
+    assert all(f.startswith("init-") and f.endswith(".mp4") for f in filenames)
+    assert filenames == [s.filename for s in get_init_sections(document)]
+
+
+def test_make_join_playlist():
+    document = load_m3u8(FMP4_PLAYLIST)
+    vods, _, _ = filter_vods(enumerate_vods(document), 10, 30)
+    targets = [Path("cache", vod.filename) for vod in vods]
+    init_0, init_100 = [s.filename for s in get_init_sections(document)][:2]
+    playlist = make_join_playlist(document, vods, targets)
+
+    assert playlist.dumps().splitlines()[3:] == [
+        f'#EXT-X-MAP:URI="{init_0}"',
+        "#EXTINF:10,",
+        "00001.mp4",
+        f'#EXT-X-MAP:URI="{init_100}"',
+        "#EXT-X-DISCONTINUITY",
+        "#EXTINF:10,",
+        "00002.mp4",
+        "#EXT-X-ENDLIST",
+    ]
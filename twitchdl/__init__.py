@@ -1,8 +1,15 @@
-from importlib import metadata
+CLIENT_ID = "kd1unb4b3q4t58fwlpcbzcbnm76a8fp"
 
-try:
-    __version__ = metadata.version("twitch-dl")
-except metadata.PackageNotFoundError:
-    __version__ = "0.0.0"
 
-CLIENT_ID = "kd1unb4b3q4t58fwlpcbzcbnm76a8fp"
+def __getattr__(name: str):
+    # Resolved on first access since importing importlib.metadata is slow and
+    # the version is rarely needed
+    if name == "__version__":
+        from importlib import metadata
+
+        try:
+            return metadata.version("twitch-dl")
+        except metadata.PackageNotFoundError:
+            return "0.0.0"
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,142 @@
+"""
+On-disk cache for Twitch API responses.
+
+Responses are stored as JSON files in the cache dir, named by a hash of the
+normalized request, along with the time at which they expire. The total size of
+the cache is bounded, least recently used entries are evicted first.
+
+Only responses to anonymous queries for data which rarely changes should be
+cached, never access tokens or responses to authenticated queries.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Mapping, Optional, Tuple
+
+from twitchdl import cache_index
+from twitchdl.cache import get_cache_dir
+from twitchdl.utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+API_CACHE_SUBDIR = "api"
+
+MAX_SIZE = 10 * 1024 * 1024
+"""Maximum size of the cache in bytes"""
+
+EVICT_TO = 0.8
+"""When over MAX_SIZE, evict entries until the size drops to this fraction of it"""
+
+EVICT_INTERVAL = 60
+"""Minimum time between checking the cache size, in seconds"""
+
+enabled = True
+"""Set to False to bypass the cache, can be changed using --no-api-cache"""
+
+_last_evicted = 0.0
+
+
+def make_key(payload: Mapping[str, Any]) -> str:
+    """
+    Make a cache key from the request payload. Whitespace in queries is
+    normalized so the same query formatted differently maps to the same key.
+    """
+    query = payload.get("query")
+    if isinstance(query, str):
+        payload = {**payload, "query": " ".join(query.split())}
+
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get(key: str) -> Optional[Any]:
+    """Returns the cached response for the given key or None if not cached or expired."""
+    if not enabled:
+        return None
+
+    path = _path(key)
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        logger.warning(f"Failed reading API cache entry {path}: {ex}")
+        return None
+
+    if entry["expires"] < time.time():
+        path.unlink(missing_ok=True)
+        cache_index.touch(path, hit=False)
+        return None
+
+    logger.info(f"API cache hit: {key}")
+    cache_index.touch(path)
+    # Eviction is ordered by modification time, mark the entry as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return entry["data"]
+
+
+def put(key: str, data: Any, ttl: int):
+    """Caches the response under the given key for `ttl` seconds."""
+    if not enabled:
+        return
+
+    path = _path(key)
+    try:
+        with atomic_write(path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({"expires": time.time() + ttl, "data": data}, f)
+        cache_index.touch(path, hit=False)
+    except Exception as ex:
+        logger.warning(f"Failed writing API cache entry {path}: {ex}")
+        return
+
+    # Listing the cache dir on every put is wasteful, check only occasionally
+    global _last_evicted
+    if time.monotonic() - _last_evicted > EVICT_INTERVAL:
+        _last_evicted = time.monotonic()
+        try:
+            evict()
+        except OSError as ex:
+            logger.warning(f"Failed evicting API cache entries: {ex}")
+
+
+def evict(max_size: int = MAX_SIZE):
+    """Delete least recently used entries if the cache has grown larger than max_size."""
+    entries: List[Tuple[float, int, str]] = []
+    total_size = 0
+
+    with os.scandir(get_cache_dir(API_CACHE_SUBDIR)) as it:
+        for entry in it:
+            if entry.name.endswith(".json"):
+                # Entries may be deleted concurrently, e.g. when they expire
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+    if total_size <= max_size:
+        return
+
+    target_size = max_size * EVICT_TO
+    for _, size, path in sorted(entries):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        cache_index.touch(Path(path), hit=False)
+        total_size -= size
+        if total_size <= target_size:
+            break
+
+
+def _path(key: str) -> Path:
+    return get_cache_dir(API_CACHE_SUBDIR) / f"{key}.json"
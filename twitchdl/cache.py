@@ -1,37 +1,84 @@
+"""
+Cache dir access and downloading files to the cache.
+
+Imported by the CLI to determine option defaults, so network related modules
+are imported only when needed to keep startup fast.
+"""
+
+from __future__ import annotations
+
 import hashlib
 import logging
 import os
 import sys
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
 
-from httpx import HTTPError
+from twitchdl import cache_index, locks
+from twitchdl.output import print_error, print_status, print_warning
+from twitchdl.utils import atomic_write
 
-from twitchdl.http import download_file
-from twitchdl.output import print_error, print_status
+if TYPE_CHECKING:
+    import httpx
 
 CACHE_SUBFOLDER = "twitch-dl"
 
 
+PREFETCH_WORKERS = 20
+"""Number of files downloaded concurrently by download_cached_all"""
+
+
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class PrefetchStats:
+    cached: int = 0
+    downloaded: int = 0
+    failed: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.cached + self.downloaded + self.failed
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cached / self.total if self.total else 1.0
+
+    def __str__(self):
+        return (
+            f"{self.cached} cached, {self.downloaded} downloaded, {self.failed} failed"
+            + f" ({self.hit_rate:.0%} hit rate)"
+        )
+
+
+def cached_path(url: str, *, subdir: Optional[str] = None, filename: Optional[str] = None) -> Path:
+    """Path at which download_cached stores the given URL"""
+    if not filename:
+        filename = hashlib.sha256(url.encode()).hexdigest()
+    return get_cache_dir(subdir) / filename
+
+
 def download_cached(
     url: str,
     *,
     subdir: Optional[str] = None,
     filename: Optional[str] = None,
 ) -> Path:
-    target_dir = get_cache_dir(subdir)
+    from twitchdl import http
 
-    if not filename:
-        filename = hashlib.sha256(url.encode()).hexdigest()
-    target = target_dir / filename
+    target = cached_path(url, subdir=subdir, filename=filename)
 
     if not target.exists():
-        print_status(f"Downloading {url}", dim=True)
-        download_file(url, target)
+        # Another process may be downloading the same file, wait for it and
+        # check again before downloading
+        with locks.striped_lock(str(target)):
+            if not target.exists():
+                print_status(f"Downloading {url}", dim=True)
+                http.download_file(url, target)
 
+    cache_index.touch(target)
     return target
 
 
@@ -41,29 +88,120 @@ def download_cached_or_none(
     subdir: Optional[str] = None,
     filename: Optional[str] = None,
 ) -> Optional[Path]:
+    import httpx
+
     try:
         return download_cached(url, subdir=subdir, filename=filename)
-    except HTTPError as ex:
+    except httpx.HTTPError as ex:
         print_error(ex)
         return None
 
 
-def get_cache_dir(subdir: Optional[str] = None) -> Path:
+def download_cached_all(
+    urls: Iterable[str],
+    *,
+    subdir: Optional[str] = None,
+    workers: int = PREFETCH_WORKERS,
+) -> Tuple[Dict[str, Optional[Path]], PrefetchStats]:
+    """
+    Download the given URLs to the cache, skipping ones which are already
+    cached, using concurrent requests over a shared connection pool. Returns
+    the paths of cached files, or None for ones which failed to download.
+    """
+    import asyncio
+
+    return asyncio.run(_download_cached_all(urls, subdir, workers))
+
+
+async def _download_cached_all(
+    urls: Iterable[str],
+    subdir: Optional[str],
+    workers: int,
+) -> Tuple[Dict[str, Optional[Path]], PrefetchStats]:
+    import asyncio
+
+    import httpx
+
+    from twitchdl.http import TIMEOUT
+
+    paths: Dict[str, Optional[Path]] = {}
+    stats = PrefetchStats()
+    missing: List[Tuple[str, Path]] = []
+
+    for url in urls:
+        target = cached_path(url, subdir=subdir)
+        paths[url] = target
+        if target.exists():
+            cache_index.touch(target)
+            stats.cached += 1
+        else:
+            missing.append((url, target))
+
+    if not missing:
+        return paths, stats
+
+    semaphore = asyncio.Semaphore(workers)
+    limits = httpx.Limits(max_connections=workers)
+
+    async def download(client: httpx.AsyncClient, url: str, target: Path):
+        async with semaphore:
+            # Another process may be downloading the same file, wait for it
+            # without blocking other downloads and check again before downloading
+            lock = locks.striped_lock(str(target))
+            while not lock.acquire(blocking=False):
+                await asyncio.sleep(locks.POLL_INTERVAL)
+
+            try:
+                if target.exists():
+                    stats.cached += 1
+                else:
+                    await _download_async(client, url, target)
+                    stats.downloaded += 1
+                cache_index.touch(target)
+            except httpx.HTTPError as ex:
+                logger.error(f"Failed downloading {url}: {ex}")
+                paths[url] = None
+                stats.failed += 1
+            finally:
+                lock.release()
+
+    async with httpx.AsyncClient(timeout=TIMEOUT, limits=limits, follow_redirects=True) as client:
+        await asyncio.gather(*(download(client, url, target) for url, target in missing))
+
+    return paths, stats
+
+
+async def _download_async(client: httpx.AsyncClient, url: str, target: Path):
+    import httpx
+
+    from twitchdl.http import RETRY_COUNT
+
+    for n in range(RETRY_COUNT):
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            break
+        except httpx.RequestError:
+            if n + 1 >= RETRY_COUNT:
+                raise
+    else:
+        raise Exception("Should not happen")
+
+    # Download to a temp file first so concurrent processes downloading the
+    # same file don't see it partially written
+    with atomic_write(target) as tmp_target, open(tmp_target, "wb") as f:
+        f.write(response.content)
+
+
+def get_cache_dir(subdir: Optional[str] = None, *, create: bool = True) -> Path:
     path = _cache_dir_path()
     if subdir:
         path = path / subdir
-    path.mkdir(parents=True, exist_ok=True)
+    if create:
+        path.mkdir(parents=True, exist_ok=True)
     return path
 
 
-def get_cache_subdirs() -> List[Path]:
-    subdirs: List[Path] = []
-    for item in _cache_dir_path().iterdir():
-        if item.is_dir():
-            subdirs.append(item)
-    return subdirs
-
-
 def _cache_dir_path() -> Path:
     """Returns the path to the cache directory"""
 
@@ -84,17 +222,29 @@ def _cache_dir_path() -> Path:
 
 
 class Cache:
-    """Helps keep track of cached files and folders and delete them when finished"""
+    """
+    Helps keep track of cached files and folders and delete them when finished.
+
+    Holds a shared lock on the cache dir while in use, so when several processes
+    use the same cache dir, only the last one to finish deletes it.
+    """
 
     def __init__(self, root: Path):
         self.root = root
         self.files: List[Path] = []
         self.dirs: List[Path] = []
+        self.lock = locks.path_lock(str(root.absolute()), shared=True)
+        self.lock.acquire()
         self.mkdir(root)
 
+    def download_lock(self) -> locks.FileLock:
+        """Exclusive lock to be held while downloading files to the cache dir"""
+        return locks.path_lock(f"{self.root.absolute()}:download")
+
     def get_path(self, filename: str) -> Path:
         path = self.root / filename
         self.files.append(path)
+        cache_index.touch(path, hit=False)
         return path
 
     def mkdir(self, path: Path):
@@ -113,11 +263,23 @@ class Cache:
                 raise
 
     def delete(self):
+        if not self.lock.upgrade(blocking=False):
+            print_warning(f"Not deleting cache, it's in use by another process: {self.root}")
+            self.lock.release()
+            return
+
         try:
             for file in self.files:
                 if file.exists():
                     os.remove(file)
+                cache_index.touch(file, hit=False)
             for dir in reversed(self.dirs):
                 os.rmdir(dir)
+            # The cache dir may have been created by another process which
+            # finished using it before this one
+            if self.root not in self.dirs and not any(self.root.iterdir()):
+                os.rmdir(self.root)
         except Exception as ex:
             print_error(f"Failed deleting cache: {ex}\nSome files are left over in {self.root}")
+        finally:
+            self.lock.release()
@@ -0,0 +1,481 @@
+"""
+Index of files in the cache dir, used to keep the cache within a size budget.
+
+Keeps the size, last access time and number of accesses of each cached file in
+a SQLite database in the cache root. The index is updated as files are added,
+used and removed, so listing cache usage and choosing files to evict doesn't
+require walking the cache dir. A full scan is done when the index was not
+scanned for a day, to pick up files written without updating the index.
+
+When the cache grows over its budget, or a subdirectory over its quota, files
+are evicted least recently used (lru) or least frequently used (lfu) first.
+
+SQLite takes care of locking so several twitch-dl processes can share the
+index. Eviction runs in a write transaction so only one process evicts at a
+time, and recently accessed files are never evicted since they may be in use
+by another running job.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Literal, Mapping, Optional, Set, Tuple
+
+from twitchdl import cache
+
+logger = logging.getLogger(__name__)
+
+Policy = Literal["lru", "lfu"]
+
+INDEX_FILENAME = "index.sqlite"
+
+PINNED_SUBDIRS = {"sync"}
+"""Subdirs which are never evicted because they contain state, not cached data"""
+
+IGNORED_SUBDIRS = {"locks"}
+"""Subdirs which are not indexed"""
+
+MIN_AGE = 3600
+"""Files accessed more recently than this many seconds ago are not evicted"""
+
+EVICT_INTERVAL = 600
+"""Minimum number of seconds between background evictions"""
+
+RESCAN_INTERVAL = 24 * 3600
+"""
+Number of seconds after which the cache dir is scanned again to pick up files
+which were added or removed without updating the index
+"""
+
+EVICT_TO = 0.9
+"""When over budget, evict files until the size drops to this fraction of it"""
+
+EXIT_TIMEOUT = 5
+"""Maximum number of seconds to wait for background eviction to stop on exit"""
+
+max_size: Optional[int] = None
+"""Cache budget in bytes, when set the cache is evicted in the background"""
+
+policy: Policy = "lru"
+"""Eviction policy used for background eviction"""
+
+_pending: Dict[Tuple[str, str], int] = {}
+"""Number of hits by cache root and path relative to it, waiting to be flushed"""
+_pending_lock = threading.Lock()
+
+_stopping = threading.Event()
+"""Set on exit to stop background eviction early"""
+
+_evict_thread: Optional[threading.Thread] = None
+_exit_registered = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    subdir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+class EvictionStopped(Exception):
+    """Raised when background eviction is stopped on exit"""
+
+
+@dataclass
+class EvictionResult:
+    files: int = 0
+    size: int = 0
+
+
+def touch(path: Path, hit: bool = True):
+    """
+    Record that a cached file was accessed, or added, changed or removed when
+    `hit` is False. Changes are kept in memory and written to the index in one
+    go on exit or before eviction to avoid a database write for each one.
+    """
+    # Called for each used cache file, so avoid creating the cache dir and
+    # resolving its path every time. The root is kept with the entry since the
+    # cache dir may change before flushing, e.g. in tests.
+    root = _absolute_path(cache.get_cache_dir(create=False))
+    relative = _relative_path(path, root)
+    if relative is None:
+        return
+
+    _register_exit()
+    with _pending_lock:
+        _pending[(root, relative)] = _pending.get((root, relative), 0) + int(hit)
+
+
+def flush(timeout: float = 30):
+    """Write recorded changes to the index."""
+    with _pending_lock:
+        pending = list(_pending.items())
+        _pending.clear()
+
+    by_root: Dict[str, List[Tuple[str, int]]] = {}
+    for (root, relative), hits in pending:
+        by_root.setdefault(root, []).append((relative, hits))
+
+    for root, accesses in by_root.items():
+        _flush(Path(root), accesses, timeout)
+
+
+def _flush(root: Path, accesses: List[Tuple[str, int]], timeout: float):
+    try:
+        with closing(_connect(timeout, root)) as conn:
+            # Check the files while holding the write lock, so files deleted
+            # by a concurrent eviction are not added back to the index
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows: List[Tuple[str, str, int, float, int]] = []
+                removed: List[Tuple[str]] = []
+                for relative, hits in accesses:
+                    try:
+                        size = os.path.getsize(root / relative)
+                        rows.append((relative, _subdir(relative), size, now, hits))
+                    except OSError:
+                        removed.append((relative,))
+
+                conn.executemany(
+                    """
+                    INSERT INTO files (path, subdir, size, accessed, hits)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (path) DO UPDATE SET
+                        size = excluded.size,
+                        accessed = excluded.accessed,
+                        hits = hits + excluded.hits
+                    """,
+                    rows,
+                )
+                conn.executemany("DELETE FROM files WHERE path = ?", removed)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    except sqlite3.Error as ex:
+        logger.warning(f"Failed updating cache index: {ex}")
+
+
+def rescan():
+    """Rebuild the index from the files in the cache dir."""
+    flush()
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _scan(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def usage() -> Dict[str, Tuple[int, int]]:
+    """
+    Returns the number of files and their total size for each cache subdir.
+    The cache dir is scanned if it wasn't recently, otherwise the index is used.
+    """
+    flush()
+    with closing(_connect()) as conn:
+        if _needs_scan(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _scan(conn)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+        rows = conn.execute(
+            "SELECT subdir, COUNT(*), SUM(size) FROM files GROUP BY subdir ORDER BY subdir"
+        )
+        return {subdir: (count, size) for subdir, count, size in rows}
+
+
+def clear(subdir: Optional[str] = None):
+    """Remove entries for the given subdir, or all entries, from the index."""
+    with closing(_connect()) as conn, conn:
+        if subdir:
+            conn.execute("DELETE FROM files WHERE subdir = ?", (subdir,))
+        else:
+            conn.execute("DELETE FROM files")
+
+
+def evict(
+    max_size: Optional[int] = None,
+    quotas: Mapping[str, int] = {},
+    policy: Policy = "lru",
+    min_age: int = MIN_AGE,
+) -> EvictionResult:
+    """
+    Evict files until the cache is within `max_size` bytes and each subdir is
+    within its quota. Files accessed within the last `min_age` seconds are kept.
+    """
+    flush()
+    result = EvictionResult()
+    root = cache.get_cache_dir()
+    active_dirs: Dict[Path, bool] = {}
+    evicted_dirs: Set[Path] = set()
+
+    with closing(_connect()) as conn:
+        # Take the write lock up front so concurrent processes evict one by one
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if _needs_scan(conn):
+                _scan(conn)
+            for subdir, quota in quotas.items():
+                _evict_until(
+                    conn, root, quota, policy, min_age, result, active_dirs, evicted_dirs, subdir
+                )
+            if max_size is not None:
+                _evict_until(
+                    conn, root, max_size, policy, min_age, result, active_dirs, evicted_dirs
+                )
+            _set_meta(conn, "evicted_at", time.time())
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    _remove_empty_dirs(root, evicted_dirs)
+    return result
+
+
+def evict_in_background():
+    """
+    Evict the cache to `max_size` in a background thread, unless it was
+    recently done by this or another process.
+    """
+    if max_size is None:
+        return
+
+    global _evict_thread
+    _register_exit()
+    _evict_thread = threading.Thread(target=_background_evict, args=(max_size, policy), daemon=True)
+    _evict_thread.start()
+
+
+def _register_exit():
+    global _exit_registered
+    if not _exit_registered:
+        atexit.register(_on_exit)
+        _exit_registered = True
+
+
+def _on_exit():
+    if _evict_thread is None:
+        flush()
+        return
+
+    # Daemon threads are killed on exit, which could happen after files have
+    # been deleted but before the transaction removing them from the index is
+    # committed. Ask eviction to stop after the current file and wait for it
+    # before flushing, since eviction holds the index write lock.
+    _stopping.set()
+    _evict_thread.join(EXIT_TIMEOUT)
+    flush(timeout=EXIT_TIMEOUT)
+
+
+def _background_evict(max_size: int, policy: Policy):
+    try:
+        with closing(_connect()) as conn:
+            evicted_at = _get_meta(conn, "evicted_at")
+        if evicted_at and evicted_at > time.time() - EVICT_INTERVAL:
+            return
+
+        result = evict(max_size, policy=policy)
+        logger.info(f"Evicted {result.files} files ({result.size} bytes) from cache")
+    except sqlite3.OperationalError as ex:
+        # Most likely another process is evicting
+        logger.info(f"Skipping cache eviction: {ex}")
+    except EvictionStopped:
+        pass
+    except Exception:
+        logger.exception("Cache eviction failed")
+
+
+def _scan(conn: sqlite3.Connection):
+    """
+    Update the index to match the files in the cache dir. Files not seen before
+    are added using their modification time as the access time.
+    """
+    indexed = {path: size for path, size in conn.execute("SELECT path, size FROM files")}
+    found: Dict[str, Tuple[int, float]] = {}
+
+    for relative, stat in _walk(cache.get_cache_dir()):
+        # Scanning a large cache takes a while, give up when exiting
+        if _stopping.is_set():
+            raise EvictionStopped()
+        found[relative] = (stat.st_size, stat.st_mtime)
+
+    conn.executemany(
+        "DELETE FROM files WHERE path = ?",
+        [(path,) for path in indexed.keys() - found.keys()],
+    )
+    conn.executemany(
+        "INSERT INTO files (path, subdir, size, accessed) VALUES (?, ?, ?, ?)",
+        [
+            (path, _subdir(path), size, mtime)
+            for path, (size, mtime) in found.items()
+            if path not in indexed
+        ],
+    )
+    conn.executemany(
+        "UPDATE files SET size = ? WHERE path = ?",
+        [
+            (size, path)
+            for path, (size, _) in found.items()
+            if path in indexed and indexed[path] != size
+        ],
+    )
+    _set_meta(conn, "scanned_at", time.time())
+
+
+def _needs_scan(conn: sqlite3.Connection) -> bool:
+    scanned_at = _get_meta(conn, "scanned_at")
+    return scanned_at is None or scanned_at < time.time() - RESCAN_INTERVAL
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[float]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: float):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _evict_until(
+    conn: sqlite3.Connection,
+    root: Path,
+    max_size: int,
+    policy: Policy,
+    min_age: int,
+    result: EvictionResult,
+    active_dirs: Dict[Path, bool],
+    evicted_dirs: Set[Path],
+    subdir: Optional[str] = None,
+):
+    where = "subdir = ?" if subdir else "1"
+    params = (subdir,) if subdir else ()
+    query = f"SELECT COALESCE(SUM(size), 0) FROM files WHERE {where}"
+    (total_size,) = conn.execute(query, params).fetchone()
+
+    if total_size <= max_size:
+        return
+
+    target_size = max_size * EVICT_TO
+    threshold = time.time() - min_age
+    order = "hits, accessed" if policy == "lfu" else "accessed"
+    pinned = ", ".join("?" for _ in PINNED_SUBDIRS)
+    candidates = conn.execute(
+        f"""
+        SELECT path, size FROM files
+        WHERE {where} AND subdir NOT IN ({pinned}) AND accessed < ?
+        ORDER BY {order}
+        """,
+        (*params, *PINNED_SUBDIRS, threshold),
+    ).fetchall()
+
+    for path, size in candidates:
+        if _stopping.is_set():
+            break
+
+        parent = (root / path).parent
+        try:
+            # Files in nested dirs belong to jobs such as video downloads which
+            # add files as they go, skip ones recently written to as they may
+            # still be running. Checked once per dir since eviction modifies it.
+            if parent.parent != root:
+                if parent not in active_dirs:
+                    active_dirs[parent] = parent.stat().st_mtime >= threshold
+                if active_dirs[parent]:
+                    continue
+            os.unlink(root / path)
+            evicted_dirs.add(parent)
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            logger.warning(f"Failed evicting {path}: {ex}")
+            continue
+
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        result.files += 1
+        result.size += size
+        total_size -= size
+        if total_size <= target_size:
+            break
+
+
+def _remove_empty_dirs(root: Path, dirs: Set[Path]):
+    """Remove directories left empty by eviction, up to the cache subdir"""
+    for path in sorted(dirs, key=lambda p: len(p.parts), reverse=True):
+        while path.parent != root and path != root:
+            try:
+                path.rmdir()
+            except OSError:
+                break
+            path = path.parent
+
+
+def _walk(root: Path) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yields paths relative to root and stats of all files in cache subdirs"""
+    stack = [
+        entry.path
+        for entry in os.scandir(root)
+        if entry.is_dir(follow_symlinks=False) and entry.name not in IGNORED_SUBDIRS
+    ]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    relative = os.path.relpath(entry.path, root)
+                    yield Path(relative).as_posix(), entry.stat()
+
+
+def _connect(timeout: float = 30, root: Optional[Path] = None) -> sqlite3.Connection:
+    path = (root or cache.get_cache_dir()) / INDEX_FILENAME
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    # Use explicit transactions for batched writes
+    conn.isolation_level = "DEFERRED"
+    return conn
+
+
+def _relative_path(path: Path, root: str) -> Optional[str]:
+    try:
+        relative = Path(os.path.abspath(path)).relative_to(root)
+    except ValueError:
+        return None
+
+    # Only files in subdirs are indexed
+    if len(relative.parts) < 2 or relative.parts[0] in IGNORED_SUBDIRS:
+        return None
+
+    return relative.as_posix()
+
+
+def _subdir(relative: str) -> str:
+    return relative.split("/", 1)[0]
+
+
+@lru_cache(maxsize=1)
+def _absolute_path(path: Path) -> str:
+    return os.path.abspath(path)
@@ -0,0 +1,178 @@
+"""
+Local archive of video comments kept in the cache dir.
+
+Comments are stored as gzipped NDJSON, one gzip member per fetched page, next
+to a small JSON state file which records how much of the archive is valid and
+the cursor from which to continue fetching. This allows rendering the same chat
+multiple times without downloading it again, resuming interrupted downloads,
+and fetching only new comments on refresh.
+
+Processes using the same archive, e.g. exporting chat to several formats at
+once, take turns using a file lock, so they don't append the same pages.
+"""
+
+import gzip
+import json
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Generator, List, Optional
+
+from twitchdl import cache_index, locks
+from twitchdl.cache import get_cache_dir
+from twitchdl.chat.comments import generate_comment_pages
+from twitchdl.entities import Comment, Video
+from twitchdl.utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUBDIR = "comments"
+
+READ_PAGE_SIZE = 1000
+"""Number of comments per page when reading comments from the archive"""
+
+
+@dataclass
+class ArchiveState:
+    size: int = 0
+    """Size of the valid part of the archive file in bytes"""
+    count: int = 0
+    """Number of archived comments"""
+    cursor: Optional[str] = None
+    """Cursor of the last archived comment"""
+    last_offset: int = 0
+    """Content offset of the last archived comment in seconds"""
+    complete: bool = False
+    """Set when all comments have been fetched"""
+
+
+def load_comments(video: Video, refresh: bool = False) -> Generator[Comment, None, None]:
+    for page in load_comment_pages(video, refresh):
+        yield from page
+
+
+def load_comment_pages(video: Video, refresh: bool = False) -> Generator[List[Comment], None, None]:
+    """
+    Yield pages of comments for the given video, reading archived comments
+    first and then fetching the remaining ones from Twitch.
+
+    If the archive is complete, Twitch is not contacted unless `refresh` is
+    set, in which case only comments after the last archived one are fetched.
+    Archives of videos which were recording when fetched are never complete.
+    """
+    archive_path = _archive_path(video["id"])
+    state_path = _state_path(video["id"])
+
+    lock = locks.path_lock(str(archive_path))
+    if not lock.acquire(blocking=False):
+        logger.info(f"Waiting for another process using {archive_path}")
+        lock.acquire()
+
+    try:
+        yield from _load_comment_pages(video, refresh, archive_path, state_path)
+    finally:
+        lock.release()
+
+
+def _load_comment_pages(
+    video: Video,
+    refresh: bool,
+    archive_path: Path,
+    state_path: Path,
+) -> Generator[List[Comment], None, None]:
+    state = _load_state(archive_path, state_path)
+    cache_index.touch(archive_path)
+    cache_index.touch(state_path, hit=False)
+
+    if state.count:
+        logger.info(f"Reading {state.count} archived comments from {archive_path}")
+        yield from _read_pages(archive_path)
+
+    if state.complete and not refresh:
+        return
+
+    if state.cursor:
+        pages = generate_comment_pages(
+            video["id"],
+            video["lengthSeconds"],
+            start=state.last_offset,
+            cursor=state.cursor,
+        )
+    else:
+        pages = generate_comment_pages(video["id"], video["lengthSeconds"])
+
+    with open(archive_path, "ab") as f:
+        for page in pages:
+            f.write(gzip.compress(_dump_page(page.comments)))
+            f.flush()
+
+            state.size = f.tell()
+            state.count += len(page.comments)
+            state.cursor = page.cursor
+            state.last_offset = page.comments[-1]["contentOffsetSeconds"]
+            state.complete = False
+            _save_state(state_path, state)
+
+            yield page.comments
+
+    # Comments are still being added while the video is recording, so keep
+    # fetching new ones next time
+    state.complete = video["status"] != "RECORDING"
+    _save_state(state_path, state)
+
+
+def _archive_path(video_id: str) -> Path:
+    return get_cache_dir(ARCHIVE_SUBDIR) / f"{video_id}.ndjson.gz"
+
+
+def _state_path(video_id: str) -> Path:
+    return get_cache_dir(ARCHIVE_SUBDIR) / f"{video_id}.json"
+
+
+def _load_state(archive_path: Path, state_path: Path) -> ArchiveState:
+    try:
+        with open(state_path, "r") as f:
+            state = ArchiveState(**json.load(f))
+    except FileNotFoundError:
+        state = ArchiveState()
+    except Exception as ex:
+        logger.warning(f"Discarding invalid comment archive state {state_path}: {ex}")
+        state = ArchiveState()
+
+    size = archive_path.stat().st_size if archive_path.exists() else 0
+
+    if size < state.size:
+        logger.warning(f"Comment archive {archive_path} is truncated, discarding")
+        state = ArchiveState()
+
+    # Drop anything written after the last saved state, e.g. a page which was
+    # only partially written when the previous run was interrupted
+    if size > state.size:
+        with open(archive_path, "ab") as f:
+            f.truncate(state.size)
+
+    return state
+
+
+def _save_state(state_path: Path, state: ArchiveState):
+    with atomic_write(state_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(asdict(state), f)
+
+
+def _dump_page(comments: List[Comment]) -> bytes:
+    lines = (json.dumps(comment, ensure_ascii=False, separators=(",", ":")) for comment in comments)
+    return "".join(line + "\n" for line in lines).encode()
+
+
+def _read_pages(archive_path: Path) -> Generator[List[Comment], None, None]:
+    page: List[Comment] = []
+
+    with gzip.open(archive_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            page.append(json.loads(line))
+            if len(page) >= READ_PAGE_SIZE:
+                yield page
+                page = []
+
+    if page:
+        yield page
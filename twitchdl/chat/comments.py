@@ -0,0 +1,190 @@
+"""
+Fetch video comments concurrently.
+
+The video timeline is split into shards by content offset. Each shard is paged
+through using cursors, all shards are fetched concurrently, and their comments
+are merged back in offset order.
+"""
+
+import asyncio
+import logging
+import math
+import queue
+import threading
+from typing import Generator, List, NamedTuple, Optional, Set, Union
+
+import httpx
+
+from twitchdl import twitch_async
+from twitchdl.entities import Comment, Data, Video
+from twitchdl.http import TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+SHARD_SECONDS = 1800
+"""Preferred length of a single shard of the video timeline in seconds."""
+
+MAX_SHARDS = 10
+"""Maximum number of shards, and therefore concurrent requests, per video."""
+
+PREFETCH_PAGES = 20
+"""Number of pages each shard is allowed to fetch ahead of the consumer."""
+
+
+class Shard(NamedTuple):
+    start: int
+    """Start offset in seconds, inclusive"""
+    end: Optional[int]
+    """End offset in seconds, exclusive, None for the last shard"""
+
+    def contains(self, offset: int) -> bool:
+        return offset >= self.start and (self.end is None or offset < self.end)
+
+
+class CommentPage(NamedTuple):
+    comments: List[Comment]
+    cursor: Optional[str]
+    """Cursor of the last comment in the page, can be used to continue paging"""
+
+
+def make_shards(
+    duration: int,
+    start: int = 0,
+    max_shards: int = MAX_SHARDS,
+    shard_seconds: int = SHARD_SECONDS,
+) -> List[Shard]:
+    """Split the video timeline from `start` to `duration` into shards."""
+    span = max(duration - start, 0)
+    count = max(1, min(max_shards, math.ceil(span / shard_seconds)))
+    offsets = [start + span * n // count for n in range(count)]
+    ends = offsets[1:] + [None]
+    return [Shard(offset, end) for offset, end in zip(offsets, ends)]
+
+
+def generate_comments(video: Video) -> Generator[Comment, None, None]:
+    for page in generate_comment_pages(video["id"], video["lengthSeconds"]):
+        yield from page.comments
+
+
+def generate_comment_pages(
+    video_id: str,
+    duration: int,
+    *,
+    start: int = 0,
+    cursor: Optional[str] = None,
+    max_shards: int = MAX_SHARDS,
+) -> Generator[CommentPage, None, None]:
+    """
+    Fetch comments for the given video concurrently and yield pages in offset
+    order as they become available.
+
+    If `cursor` is given, the first shard continues paging from it instead of
+    seeking to `start`, which should be the offset of the comment the cursor
+    points to.
+    """
+    shards = make_shards(duration, start, max_shards)
+    queues: List["queue.Queue[_Item]"] = [queue.Queue(PREFETCH_PAGES) for _ in shards]
+    stop = threading.Event()
+
+    def run():
+        asyncio.run(_fetch_shards(video_id, shards, queues, cursor, stop))
+
+    # Run the event loop in a separate thread so pages can be consumed by
+    # regular generators while the shards are being fetched.
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    try:
+        for shard_queue in queues:
+            while True:
+                item = shard_queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+    finally:
+        stop.set()
+
+
+# A page of comments, an error raised while fetching, or None when done
+_Item = Union[CommentPage, BaseException, None]
+
+
+async def _fetch_shards(
+    video_id: str,
+    shards: List[Shard],
+    queues: List["queue.Queue[_Item]"],
+    cursor: Optional[str],
+    stop: threading.Event,
+):
+    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+        tasks = [
+            _fetch_shard(client, video_id, shard, shard_queue, cursor if index == 0 else None, stop)
+            for index, (shard, shard_queue) in enumerate(zip(shards, queues))
+        ]
+        await asyncio.gather(*tasks)
+
+
+async def _fetch_shard(
+    client: httpx.AsyncClient,
+    video_id: str,
+    shard: Shard,
+    shard_queue: "queue.Queue[_Item]",
+    cursor: Optional[str],
+    stop: threading.Event,
+):
+    logger.info(f"Fetching comments for shard {shard}")
+    offset = None if cursor or shard.start == 0 else shard.start
+    previous_ids: Set[str] = set()
+
+    try:
+        while not stop.is_set():
+            video = await twitch_async.get_comments(
+                client, video_id, cursor=cursor, offset_seconds=offset
+            )
+            offset = None
+            edges = video["comments"]["edges"]
+
+            # Drop comments which belong to other shards, and ones repeated
+            # from the previous page
+            page_edges = [
+                edge
+                for edge in edges
+                if shard.contains(edge["node"]["contentOffsetSeconds"])
+                and edge["node"]["id"] not in previous_ids
+            ]
+            previous_ids = {edge["node"]["id"] for edge in edges}
+
+            if page_edges:
+                comments = [edge["node"] for edge in page_edges]
+                page = CommentPage(comments, page_edges[-1]["cursor"])
+                if not await asyncio.to_thread(_put, shard_queue, page, stop):
+                    return
+
+            has_next = video["comments"]["pageInfo"]["hasNextPage"]
+            if not edges or not has_next or _is_past_end(shard, edges):
+                break
+
+            cursor = edges[-1]["cursor"]
+
+        await asyncio.to_thread(_put, shard_queue, None, stop)
+    except Exception as ex:
+        await asyncio.to_thread(_put, shard_queue, ex, stop)
+
+
+def _is_past_end(shard: Shard, edges: List[Data]) -> bool:
+    return shard.end is not None and edges[-1]["node"]["contentOffsetSeconds"] >= shard.end
+
+
+def _put(shard_queue: "queue.Queue[_Item]", item: _Item, stop: threading.Event) -> bool:
+    """Put an item in the queue, waiting for free space unless stopped.
+    Returns False if stopped before the item was queued."""
+    while not stop.is_set():
+        try:
+            shard_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
@@ -1,29 +1,117 @@
+import gzip
 import json
+from pathlib import Path
+from typing import IO, Iterable, Optional
 
 import click
 
-from twitchdl.chat.utils import get_all_comments, get_target_path, get_video
+from twitchdl.chat.utils import generate_comments, get_target_path, get_video
+from twitchdl.entities import ChatJsonFormat, Comment, Compression, Video, VideoComments
+from twitchdl.exceptions import ConsoleError
 from twitchdl.output import print_log
 from twitchdl.twitch import get_video_comments
+from twitchdl.utils import atomic_write
 
+COMPRESSION_EXTENSIONS = {
+    "gzip": "gz",
+    "zstd": "zst",
+}
 
-def render_chat_json(id: str, output: str, overwrite: bool):
-    format = "json"
+
+def render_chat_json(
+    id: str,
+    output: str,
+    overwrite: bool,
+    refresh: bool,
+    format: ChatJsonFormat = "json",
+    compress: Optional[Compression] = None,
+):
     video = get_video(id)
-    target_path = get_target_path(video, format, output, overwrite)
+    extension = f"{format}.{COMPRESSION_EXTENSIONS[compress]}" if compress else format
+    target_path = get_target_path(video, extension, output, overwrite)
 
     print_log("Loading VideoComments...")
     video_comments = get_video_comments(video["id"])
 
     print_log("Loading Comments...")
-    comments = get_all_comments(video)
+    comments = generate_comments(video, refresh)
 
-    with open(target_path, "w", encoding="utf8") as f:
-        obj = {
-            "video": video,
-            "video_comments": video_comments,
-            "comments": comments,
-        }
-        json.dump(obj, f)
+    # Comments are written as they are loaded so the whole chat is never kept
+    # in memory. Write to a temp file first so that failing part way doesn't
+    # leave an incomplete chat at the target path.
+    with atomic_write(target_path) as tmp_path, _open_target(tmp_path, compress) as f:
+        if format == "jsonl":
+            write_json_lines(f, video, video_comments, comments)
+        else:
+            write_json(f, video, video_comments, comments)
 
     click.echo(f"Chat saved to: {target_path}")
+
+
+def write_json(
+    f: IO[str],
+    video: Video,
+    video_comments: VideoComments,
+    comments: Iterable[Comment],
+):
+    """
+    Write chat as a single JSON object containing the list of comments.
+    Produces the same output as dumping the whole object at once.
+    """
+    f.write('{"video": ')
+    f.write(json.dumps(video))
+    f.write(', "video_comments": ')
+    f.write(json.dumps(video_comments))
+    f.write(', "comments": [')
+    for index, comment in enumerate(comments):
+        if index > 0:
+            f.write(", ")
+        f.write(json.dumps(comment))
+    f.write("]}")
+
+
+def write_json_lines(
+    f: IO[str],
+    video: Video,
+    video_comments: VideoComments,
+    comments: Iterable[Comment],
+):
+    """
+    Write chat in JSON Lines format. The first line contains the video and
+    video comments metadata, followed by one comment per line.
+    """
+    f.write(json.dumps({"video": video, "video_comments": video_comments}))
+    f.write("\n")
+    for comment in comments:
+        f.write(json.dumps(comment))
+        f.write("\n")
+
+
+def _open_target(path: Path, compress: Optional[Compression]) -> IO[str]:
+    if compress == "gzip":
+        return gzip.open(path, "wt", encoding="utf8")
+
+    if compress == "zstd":
+        return _open_zstd(path)
+
+    return open(path, "w", encoding="utf8")
+
+
+def _open_zstd(path: Path) -> IO[str]:
+    # Available in the standard library since Python 3.14
+    try:
+        from compression import zstd  # type: ignore
+
+        return zstd.open(path, "wt", encoding="utf8")  # type: ignore
+    except ImportError:
+        pass
+
+    try:
+        import zstandard  # type: ignore
+
+        return zstandard.open(path, "wt", encoding="utf8")  # type: ignore
+    except ImportError:
+        raise ConsoleError(
+            "zstd compression requires Python 3.14+ or the zstandard package:\n"
+            + "pip install zstandard"
+        )
@@ -1,8 +1,9 @@
 from pathlib import Path
-from typing import Generator, List
+from typing import Generator
 
 import click
 from twitchdl import twitch
+from twitchdl.chat.archive import load_comment_pages
 from twitchdl.entities import Comment, Commenter, Video
 from twitchdl.exceptions import ConsoleError
 from twitchdl.naming import video_filename
@@ -61,31 +62,14 @@ def get_target_path(video: Video, format: str, output: str, overwrite: bool) ->
     return target_path
 
 
-def get_all_comments(video: Video) -> List[Comment]:
-    comments: List[Comment] = []
+def generate_comments(video: Video, refresh: bool = False) -> Generator[Comment, None, None]:
+    """Yield comments as they are loaded while printing progress"""
     total_duration = video["lengthSeconds"]
-    for page in _generate_paged_comments(video["id"]):
-        if page:
-            comments.extend(page)
-            offset_seconds = page[-1]["contentOffsetSeconds"]
-            progress = _format_progress(offset_seconds, total_duration)
-            print_status(f"Loading Comments {progress}", transient=True, dim=True)
-
-    return comments
-
-
-def _generate_paged_comments(video_id: str) -> Generator[List[Comment], None, None]:
-    page = 1
-    has_next = True
-    cursor = None
-
-    while has_next:
-        video = twitch.get_comments(video_id, cursor=cursor)
-        yield [comment["node"] for comment in video["comments"]["edges"]]
-
-        has_next = video["comments"]["pageInfo"]["hasNextPage"]
-        cursor = video["comments"]["edges"][-1]["cursor"]
-        page += 1
+    for page in load_comment_pages(video, refresh):
+        yield from page
+        offset_seconds = page[-1]["contentOffsetSeconds"]
+        progress = _format_progress(offset_seconds, total_duration)
+        print_status(f"Loading Comments {progress}", transient=True, dim=True)
 
 
 def _format_progress(offset_seconds: int, total_duration: int):
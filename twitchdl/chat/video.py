@@ -8,19 +8,21 @@ from collections import deque
 from itertools import groupby
 from pathlib import Path
 from statistics import mean
-from typing import Deque, Dict, Generator, List, Optional, Tuple
+from typing import Deque, Dict, List, Optional, Set, Tuple
 from urllib.parse import urlparse
 
 import click
 from PIL import Image, ImageDraw
 
 from twitchdl import cache, twitch
+from twitchdl.chat.archive import load_comments
 from twitchdl.chat.utils import get_commenter_color, get_target_path, get_video
-from twitchdl.entities import Badge, Comment, Emote
+from twitchdl.entities import Badge, Comment, Emote, Video
 from twitchdl.exceptions import ConsoleError
 from twitchdl.fonts import Font, char_name, load_font, make_group_by_font
 from twitchdl.output import blue, green, print_log, print_status, yellow
-from twitchdl.utils import format_time, iterate_with_next, parse_video_identifier
+from twitchdl.tracing import span
+from twitchdl.utils import format_time, iterate_with_next
 
 # Use NotoSans for latin, greek, cyrillic
 # Use NotoSansCJK for Chinese, Japanese, and Korean
@@ -50,22 +52,23 @@ def render_chat(
     overwrite: bool,
     keep: bool,
     no_join: bool,
+    refresh: bool,
 ):
-    video = get_video(id)
-
-    video_id = parse_video_identifier(id)
-    if not video_id:
-        raise ConsoleError("Invalid video ID")
-
-    print_log("Looking up video...")
-    video = get_video(video_id)
+    with span("look up video"):
+        video = get_video(id)
+    video_id = video["id"]
     target_path = get_target_path(video, format, output, overwrite)
 
     print_log("Loading video comments...")
-    video_comments = twitch.get_video_comments(video_id)
+    with span("video comments"):
+        video_comments = twitch.get_video_comments(video_id)
     badges_by_id = {badge["id"]: badge for badge in video_comments["badges"]}
 
-    fonts = load_fonts(font_size)
+    with span("prefetch images"):
+        prefetch_images(video, dark, badges_by_id, refresh)
+
+    with span("load fonts"):
+        fonts = load_fonts(font_size)
     foreground = "#ffffff" if dark else "#000000"
     background = "#000000" if dark else "#ffffff"
     screen = Screen(width, height, fonts, foreground, background, padding)
@@ -77,27 +80,31 @@ def render_chat(
     first = True
     frame_durations: Deque[float] = deque(maxlen=100)
     total_duration = video["lengthSeconds"]
-    for group_index, offset, duration, comments in group_comments(video_id, total_duration):
-        if group_index == 0:
-            # Save the initial empty frame
-            frame_path = cache_dir / f"chat_{0:05d}.{image_format}"
-            screen.padded_image().save(frame_path)
-            frames.append((frame_path, offset))
-
-        frame_start = time.monotonic()
-        for comment in comments:
-            if comment["commenter"]:
-                if not first:
-                    screen.next_line()
-                draw_comment(screen, comment, dark, badges_by_id)
-            first = False
-
-        frame_path = cache_dir / f"chat_{offset:05d}.{image_format}"
-        screen.padded_image().save(frame_path)
-        frames.append((frame_path, duration))
-        frame_durations.append(time.monotonic() - frame_start)
-
-        _print_progress(group_index, offset, frame_durations, total_duration)
+    with span("render frames"):
+        # Comments were archived while prefetching images, no need to refresh again
+        for group_index, offset, duration, comments in group_comments(video, False):
+            if group_index == 0:
+                # Save the initial empty frame
+                frame_path = cache_dir / f"chat_{0:05d}.{image_format}"
+                screen.padded_image().save(frame_path)
+                frames.append((frame_path, offset))
+
+            frame_start = time.monotonic()
+            with span("draw comments"):
+                for comment in comments:
+                    if comment["commenter"]:
+                        if not first:
+                            screen.next_line()
+                        draw_comment(screen, comment, dark, badges_by_id)
+                    first = False
+
+            frame_path = cache_dir / f"chat_{offset:05d}.{image_format}"
+            with span("save frame"):
+                screen.padded_image().save(frame_path)
+            frames.append((frame_path, duration))
+            frame_durations.append(time.monotonic() - frame_start)
+
+            _print_progress(group_index, offset, frame_durations, total_duration)
 
     spec_path = cache_dir / "concat.txt"
     with open(spec_path, "w") as f:
@@ -111,13 +118,15 @@ def render_chat(
         return
 
     print_status("Generating chat video...", dim=True)
-    generate_video(spec_path, target_path, overwrite)
+    with span("generate video"):
+        generate_video(spec_path, target_path, overwrite)
 
     if keep:
         click.echo(f"Cached files not deleted: {yellow(cache_dir)}")
     else:
         print_status("Deleting cache...", dim=True)
-        shutil.rmtree(cache_dir)
+        with span("delete cache"):
+            shutil.rmtree(cache_dir)
 
 
 def load_fonts(font_size: int):
@@ -377,19 +386,57 @@ def generate_video(spec_path: Path, target: Path, overwrite: bool):
     print_status(f"Saved: {green(target)}")
 
 
+_prefetched: Dict[str, Optional[Path]] = {}
+"""Paths to prefetched images by URL, None if the download failed"""
+
+
+def prefetch_images(video: Video, dark: bool, badges_by_id: Dict[str, Badge], refresh: bool):
+    """
+    Download badges and emotes used in the video's comments ahead of rendering
+    so that rendering doesn't wait for each new image to download.
+    """
+    print_log("Scanning comments for badges and emotes...")
+    badge_urls: Set[str] = set()
+    emote_urls: Set[str] = set()
+    for comment in load_comments(video, refresh):
+        for message_badge in comment["message"]["userBadges"]:
+            badge = badges_by_id.get(message_badge["id"])
+            if badge:
+                badge_urls.add(badge["image4x"])
+        for fragment in comment["message"]["fragments"]:
+            if fragment["emote"]:
+                emote_urls.add(emote_url(fragment["emote"], dark))
+
+    print_log(f"Loading {len(badge_urls)} badges and {len(emote_urls)} emotes...")
+    for label, urls, subdir in [("Badges", badge_urls, "badges"), ("Emotes", emote_urls, "emotes")]:
+        paths, stats = cache.download_cached_all(urls, subdir=subdir)
+        _prefetched.update(paths)
+        print_log(f"{label}: {stats}")
+
+
 def download_badge(badge: Badge) -> Optional[Path]:
-    return cache.download_cached_or_none(badge["image4x"], subdir="badges")
+    url = badge["image4x"]
+    if url in _prefetched:
+        return _prefetched[url]
+    return cache.download_cached_or_none(url, subdir="badges")
 
 
 def download_emote(emote: Emote, dark: bool) -> Optional[Path]:
+    url = emote_url(emote, dark)
+    if url in _prefetched:
+        return _prefetched[url]
+    return cache.download_cached_or_none(url, subdir="emotes")
+
+
+def emote_url(emote: Emote, dark: bool) -> str:
     emote_id = emote["emoteID"]
     variant = "dark" if dark else "light"
-    url = f"https://static-cdn.jtvnw.net/emoticons/v2/{emote_id}/default/{variant}/4.0"
-    return cache.download_cached_or_none(url, subdir="emotes")
+    return f"https://static-cdn.jtvnw.net/emoticons/v2/{emote_id}/default/{variant}/4.0"
 
 
-def group_comments(video_id: str, total_duration: int):
-    g1 = generate_comments(video_id)
+def group_comments(video: Video, refresh: bool):
+    total_duration = video["lengthSeconds"]
+    g1 = load_comments(video, refresh)
     g2 = groupby(g1, lambda x: x["contentOffsetSeconds"])
     # Delazify the comments list, without this they are consumed before we get to them
     g3 = ((offset, list(comments)) for offset, comments in g2)
@@ -401,18 +448,3 @@ def group_comments(video_id: str, total_duration: int):
         next_offset = next_pair[0] if next_pair else total_duration
         duration = next_offset - offset
         yield index, offset, duration, comments
-
-
-def generate_comments(video_id: str) -> Generator[Comment, None, None]:
-    page = 1
-    has_next = True
-    cursor = None
-
-    while has_next:
-        video = twitch.get_comments(video_id, cursor=cursor)
-        for comment in video["comments"]["edges"]:
-            yield comment["node"]
-
-        has_next = video["comments"]["pageInfo"]["hasNextPage"]
-        cursor = video["comments"]["edges"][-1]["cursor"]
-        page += 1
@@ -5,90 +5,26 @@ Idea from: https://www.twitch.tv/tsoding
 Implementation based on: https://github.com/Kam1k4dze/SubChat
 """
 
-import re
-from collections import defaultdict
-from enum import Enum
-from typing import Any, Dict, List, NamedTuple, Optional
+from collections import deque
+from functools import lru_cache
+from itertools import groupby
+from typing import Any, BinaryIO, Deque, Dict, Generator, Iterable, List, NamedTuple, Optional
 from wcwidth import wcswidth  # type: ignore
-from xml.etree.ElementTree import Element, ElementTree, SubElement
+from xml.etree.ElementTree import Element, SubElement, tostring
 from xml.etree.ElementTree import Comment as XMLComment, indent
 
 from twitchdl.chat.utils import (
     USER_COLORS,
-    get_all_comments,
+    generate_comments,
     get_commenter_color,
     get_target_path,
     get_video,
 )
+from twitchdl.chat.ytt_options import AnchorPoint, YttOptions
 from twitchdl.entities import Comment as CommentEntitiy
 from twitchdl.entities import Video
 from twitchdl.utils import iterate_with_next
 
-
-class AnchorPoint(Enum):
-    TopLeft = "0"
-    TopCenter = "1"
-    TopRight = "2"
-    CenterLeft = "3"
-    Center = "4"
-    CenterRight = "5"
-    BottomLeft = "6"
-    BottomCenter = "7"
-    BottomRight = "8"
-
-
-class EdgeType(Enum):
-    HardShadow = "1"
-    Bevel = "2"
-    GlowOutline = "3"
-    SoftShadow = "4"
-
-
-class FontStyle(Enum):
-    """Font style (`fs` attribute)"""
-
-    Default = "0"
-    """Default font (same as ProportionalSansSerif)."""
-    MonospacedSerif = "1"
-    """Monospaced Serif (Courier New)"""
-    ProportionalSerif = "2"
-    """Proportional Serif (Times New Roman)"""
-    MonospacedSansSerif = "3"
-    """Monospaced Sans-Serif (Lucida Console)"""
-    ProportionalSansSerif = "4"
-    """Proportional Sans-Serif (Roboto)"""
-    Casual = "5"
-    """Casual (Comic Sans)"""
-    Cursive = "6"
-    """Cursive (Monotype Corsiva)"""
-    SmallCapitals = "7"
-    """Small Capitals (Arial small-caps)"""
-
-
-class HorizontalAlignment(Enum):
-    """Horizontal text alignment (`ju` attribute)"""
-
-    Left = "0"
-    Right = "1"
-    Center = "2"
-
-
-class YttOptions(NamedTuple):
-    background_color: str
-    background_opacity: int
-    font_size: int
-    font_style: str
-    foreground_color: str
-    foreground_opacity: int
-    horizontal_offset: int
-    text_align: str
-    text_edge_color: str
-    text_edge_type: str
-    vertical_offset: int
-    line_count: int
-    line_chars: int
-
-
 USERNAME_SEPARATOR = ": "
 
 
@@ -105,19 +41,53 @@ class Comment(NamedTuple):
     lines: List[str]
 
 
-def render_chat_ytt(id: str, output: str, overwrite: bool, options: YttOptions, pretty: bool):
+def render_chat_ytt(
+    id: str,
+    output: str,
+    overwrite: bool,
+    refresh: bool,
+    options: YttOptions,
+    pretty: bool,
+):
     format = "ytt"
     video = get_video(id)
     target_path = get_target_path(video, format, output, overwrite)
 
-    all_comments = load_comments(video, options)
-    comments_by_start: Dict[int, List[Comment]] = defaultdict(list)
-    for comment in all_comments:
-        comments_by_start[comment.start].append(comment)
+    comments = load_comments(video, refresh, options)
+    video_end = video["lengthSeconds"] * 1000
+
+    with open(target_path, "wb") as f:
+        write_ytt(f, comments, options, video_end, pretty)
+
+
+def write_ytt(
+    f: BinaryIO,
+    comments: Iterable[Comment],
+    options: YttOptions,
+    video_end: int,
+    pretty: bool,
+):
+    """
+    Write comments as a ytt document.
 
-    root = Element("timedtext", attrib={"format": "3"})
-    head = SubElement(root, "head")
-    body = SubElement(root, "body")
+    The document is written incrementally, one batch at a time, so that only
+    the currently visible lines are kept in memory.
+    """
+
+    def write(text: str):
+        f.write(text.encode("utf-8"))
+
+    def write_element(element: "Element[Any]", level: int):
+        if pretty:
+            indent(element, level=level)
+            write("\n" + "  " * level)
+        write(tostring(element, encoding="unicode"))
+
+    def write_comment(text: str, level: int):
+        if pretty:
+            write_element(XMLComment(text), level)
+
+    head = Element("head")
 
     def add_comment(element: Element, text: str):
         if pretty:
@@ -141,24 +111,32 @@ def render_chat_ytt(id: str, output: str, overwrite: bool, options: YttOptions,
         av=options.vertical_offset,
     )
 
-    lines: List[Line] = []
-    starts = comments_by_start.keys()
-    video_end = video["lengthSeconds"] * 1000
-    for batch_id, (start, next_start) in enumerate(iterate_with_next(starts)):
-        add_comment(body, f"Batch {batch_id}")
+    write("<?xml version='1.0' encoding='utf-8'?>\n")
+    write('<timedtext format="3">')
+    write_element(head, 1)
+
+    # Line count of 0 shows all lines
+    lines: Deque[Line] = deque(maxlen=options.line_count or None)
+    batches = ((start, list(batch)) for start, batch in groupby(comments, lambda c: c.start))
+    batch_id = -1
+
+    for batch_id, ((start, batch), next_batch) in enumerate(iterate_with_next(batches)):
+        if batch_id == 0:
+            write("\n  " if pretty else "")
+            write("<body>")
+
+        write_comment(f"Batch {batch_id}", 2)
+        next_start = next_batch[0] if next_batch else None
         duration = (next_start or video_end) - start
-        comments = comments_by_start[start]
-        for comment in comments:
+        for comment in batch:
             for idx, line in enumerate(comment.lines):
                 if idx == 0:
                     lines.append(Line(comment.username, comment.color, line))
                 else:
                     lines.append(Line(None, None, line))
 
-        visible_lines = lines[-options.line_count :]
-
-        p = sub_element(body, "p", t=start, d=duration, wp=position_id, ws=workspace_id, p=0)
-        for idx, line in enumerate(visible_lines):
+        p = make_element("p", t=start, d=duration, wp=position_id, ws=workspace_id, p=0)
+        for line in lines:
             s = None
 
             if line.username:
@@ -179,25 +157,31 @@ def render_chat_ytt(id: str, output: str, overwrite: bool, options: YttOptions,
             if s is not None:
                 s.tail = "\n"
 
-    tree = ElementTree(root)
-    if pretty:
-        indent(tree)
-    tree.write(target_path, xml_declaration=True, encoding="utf-8")
+        write_element(p, 2)
 
+    if batch_id < 0:
+        write_element(Element("body"), 1)
+    else:
+        write("\n  " if pretty else "")
+        write("</body>")
 
-def load_comments(video: Video, params: YttOptions):
-    comments = get_all_comments(video)
+    write("\n" if pretty else "")
+    write("</timedtext>")
 
-    return [
-        Comment(
-            start=comment["contentOffsetSeconds"] * 1000,
-            username=comment["commenter"]["displayName"],
-            color=get_commenter_color(comment["commenter"]),
-            lines=wrap_lines(comment, params),
-        )
-        for comment in comments
-        if comment["commenter"] is not None
-    ]
+
+def load_comments(
+    video: Video,
+    refresh: bool,
+    params: YttOptions,
+) -> Generator[Comment, None, None]:
+    for comment in generate_comments(video, refresh):
+        if comment["commenter"] is not None:
+            yield Comment(
+                start=comment["contentOffsetSeconds"] * 1000,
+                username=comment["commenter"]["displayName"],
+                color=get_commenter_color(comment["commenter"]),
+                lines=wrap_lines(comment, params),
+            )
 
 
 def add_pens(head: Element, options: YttOptions) -> Dict[str, int]:
@@ -228,6 +212,10 @@ def attrs(**kwargs: Any) -> Dict[str, str]:
     return {k: str(v) for k, v in kwargs.items()}
 
 
+def make_element(name: str, **attr: Any):
+    return Element(name, attrs(**attr))
+
+
 def sub_element(element: Element, name: str, **attr: Any):
     return SubElement(element, name, attrs(**attr))
 
@@ -235,23 +223,24 @@ def sub_element(element: Element, name: str, **attr: Any):
 def wrap_lines(comment: CommentEntitiy, options: YttOptions) -> List[str]:
     assert comment["commenter"] is not None
     text = "".join(f["text"] for f in comment["message"]["fragments"])
-    words: List[str] = re.split(r"\s+", text)
+    words = split_words(text)
 
     # First line will contain the username
     username = comment["commenter"]["displayName"]
-    line_length = wc_width(username + USERNAME_SEPARATOR)
+    line_length = username_width(username)
+    line_chars = options.line_chars
     line_words: List[str] = []
     lines: List[str] = []
 
     for word in words:
-        word_length = wc_width(word) + 1  # for space
-        if line_length + word_length <= options.line_chars:
+        width = wc_width(word)
+        if line_length + width + 1 <= line_chars:  # +1 for space
             line_words.append(word)
-            line_length += word_length
+            line_length += width + 1
         else:
             lines.append(" ".join(line_words))
             line_words = [word]
-            line_length = len(word)
+            line_length = width
 
     if line_words:
         lines.append(" ".join(line_words))
@@ -259,5 +248,34 @@ def wrap_lines(comment: CommentEntitiy, options: YttOptions) -> List[str]:
     return lines
 
 
+def split_words(text: str) -> List[str]:
+    r"""
+    Split text on whitespace, equivalent to `re.split(r"\s+", text)`, which
+    yields empty words for leading and trailing whitespace, but faster.
+    """
+    words = text.split()
+    if not words:
+        return ["", ""] if text else [""]
+    if text[0].isspace():
+        words.insert(0, "")
+    if text[-1].isspace():
+        words.append("")
+    return words
+
+
+@lru_cache(maxsize=4096)
+def username_width(username: str) -> int:
+    return wc_width(username + USERNAME_SEPARATOR)
+
+
 def wc_width(value: str) -> int:
+    # Fast path for the most common case, printable ASCII chars are all one
+    # column wide
+    if value.isascii() and value.isprintable():
+        return len(value)
+    return _wc_width(value)
+
+
+@lru_cache(maxsize=65536)
+def _wc_width(value: str) -> int:
     return wcswidth(value)  # type: ignore
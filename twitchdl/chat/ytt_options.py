@@ -0,0 +1,73 @@
+"""
+Options for rendering chat as ytt subtitles.
+
+Kept separate from the renderer so the CLI can use them to define options
+without importing the renderer and its dependencies.
+"""
+
+from enum import Enum
+from typing import NamedTuple
+
+
+class AnchorPoint(Enum):
+    TopLeft = "0"
+    TopCenter = "1"
+    TopRight = "2"
+    CenterLeft = "3"
+    Center = "4"
+    CenterRight = "5"
+    BottomLeft = "6"
+    BottomCenter = "7"
+    BottomRight = "8"
+
+
+class EdgeType(Enum):
+    HardShadow = "1"
+    Bevel = "2"
+    GlowOutline = "3"
+    SoftShadow = "4"
+
+
+class FontStyle(Enum):
+    """Font style (`fs` attribute)"""
+
+    Default = "0"
+    """Default font (same as ProportionalSansSerif)."""
+    MonospacedSerif = "1"
+    """Monospaced Serif (Courier New)"""
+    ProportionalSerif = "2"
+    """Proportional Serif (Times New Roman)"""
+    MonospacedSansSerif = "3"
+    """Monospaced Sans-Serif (Lucida Console)"""
+    ProportionalSansSerif = "4"
+    """Proportional Sans-Serif (Roboto)"""
+    Casual = "5"
+    """Casual (Comic Sans)"""
+    Cursive = "6"
+    """Cursive (Monotype Corsiva)"""
+    SmallCapitals = "7"
+    """Small Capitals (Arial small-caps)"""
+
+
+class HorizontalAlignment(Enum):
+    """Horizontal text alignment (`ju` attribute)"""
+
+    Left = "0"
+    Right = "1"
+    Center = "2"
+
+
+class YttOptions(NamedTuple):
+    background_color: str
+    background_opacity: int
+    font_size: int
+    font_style: str
+    foreground_color: str
+    foreground_opacity: int
+    horizontal_offset: int
+    text_align: str
+    text_edge_color: str
+    text_edge_type: str
+    vertical_offset: int
+    line_count: int
+    line_chars: int
@@ -7,19 +7,27 @@ import subprocess
 import sys
 from pathlib import Path
 from textwrap import dedent
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import click
 
-from twitchdl import __version__
-from twitchdl.cache import get_cache_dir, get_cache_subdirs
-from twitchdl.chat.ytt import EdgeType, FontStyle, HorizontalAlignment, YttOptions
-from twitchdl.entities import DownloadOptions
+from twitchdl.cache import get_cache_dir
+from twitchdl.chat.ytt_options import EdgeType, FontStyle, HorizontalAlignment, YttOptions
+from twitchdl.entities import (
+    ChatJsonFormat,
+    ClipsPeriod,
+    Compression,
+    DownloadOptions,
+    VideosSort,
+    VideosType,
+)
 from twitchdl.exceptions import ConsoleError
 from twitchdl.naming import DEFAULT_CHAT_OUTPUT, DEFAULT_VIDEO_OUTPUT
 from twitchdl.output import print_table, print_warning
-from twitchdl.twitch import ClipsPeriod, VideosSort, VideosType
-from twitchdl.utils import format_size, get_size
+from twitchdl.utils import format_size
+
+if TYPE_CHECKING:
+    from twitchdl.cache_index import Policy
 
 DEFAULT_VIDEO_FORMAT = "mp4"
 """Default format to pass to ffmpeg"""
@@ -44,6 +52,13 @@ json_option = click.option(
     help="Print data as JSON rather than human readable text",
 )
 
+refresh_option = click.option(
+    "--refresh",
+    is_flag=True,
+    help="""Check Twitch for comments posted since the chat was last
+         downloaded, instead of only using the locally archived comments.""",
+)
+
 
 def validate_positive(_ctx: click.Context, _param: click.Parameter, value: Optional[int]):
     if value is not None and value <= 0:
@@ -98,6 +113,34 @@ def validate_rate(_ctx: click.Context, _param: click.Parameter, value: str) -> O
     return amount
 
 
+def parse_size(value: str) -> int:
+    match = re.search(r"^([0-9]+)([kmg]?)$", value, flags=re.IGNORECASE)
+    if not match:
+        raise click.BadParameter("must be an integer, followed by an optional 'k', 'm' or 'g'")
+
+    amount = int(match.group(1))
+    unit = match.group(2).lower()
+    return amount * {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}[unit]
+
+
+def validate_size(_ctx: click.Context, _param: click.Parameter, value: str) -> Optional[int]:
+    return parse_size(value) if value else None
+
+
+def validate_quotas(
+    _ctx: click.Context,
+    _param: click.Parameter,
+    values: Tuple[str, ...],
+) -> Dict[str, int]:
+    quotas: Dict[str, int] = {}
+    for value in values:
+        subdir, _, size = value.partition("=")
+        if not subdir or not size:
+            raise click.BadParameter(f"must be in SUBDIR=SIZE format, got '{value}'")
+        quotas[subdir] = parse_size(size)
+    return quotas
+
+
 # RGBA represented as color in #RRGGBB string and int opacity
 RGBA = Tuple[str, int]
 
@@ -125,15 +168,74 @@ def validate_color_rgb(_c: click.Context, _p: click.Parameter, value: str) -> Op
 @click.option("--debug/--no-debug", default=False, help="Enable debug logging to stderr")
 @click.option("--verbose/--no-verbose", default=False, help="More verbose debug logging")
 @click.option("--color/--no-color", default=sys.stdout.isatty(), help="Use ANSI color in output")
+@click.option(
+    "--api-cache/--no-api-cache",
+    default=True,
+    help="Cache rarely changing Twitch API responses, such as video metadata",
+)
+@click.option(
+    "--cache-max-size",
+    help="""Maximum size of the cache dir, e.g. 10g. When exceeded, least recently
+         used cached files are deleted in the background.""",
+    callback=validate_size,
+)
+@click.option(
+    "--http2/--no-http2",
+    default=False,
+    help="""Download videos and clips over HTTP/2, multiplexing downloads over
+         fewer connections. Requires the http2 extra, see installation docs.""",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print how long each phase of the command took to stderr",
+)
+@click.option(
+    "--profile-output",
+    help="""Write a profile to this file, implies --profile. Files ending in .json
+         get a Chrome trace of the phases, other files get cProfile stats.""",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
 @click.version_option(package_name="twitch-dl")
 @click.pass_context
-def cli(ctx: click.Context, color: bool, debug: bool, verbose: bool):
+def cli(
+    ctx: click.Context,
+    color: bool,
+    debug: bool,
+    verbose: bool,
+    api_cache: bool,
+    cache_max_size: Optional[int],
+    http2: bool,
+    profile: bool,
+    profile_output: Optional[Path],
+):
     """twitch-dl - twitch.tv downloader
 
     https://twitch-dl.bezdomni.net/
     """
     ctx.color = color
 
+    if not api_cache:
+        from twitchdl import api_cache as api_cache_module
+
+        api_cache_module.enabled = False
+
+    if cache_max_size:
+        from twitchdl import cache_index
+
+        cache_index.max_size = cache_max_size
+        cache_index.evict_in_background()
+
+    if http2:
+        from twitchdl import http
+
+        http.http2 = True
+
+    if profile or profile_output:
+        from twitchdl import tracing
+
+        ctx.call_on_close(tracing.start_profile(profile_output))
+
     if debug:
         logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
         logging.getLogger("httpx").setLevel(logging.WARN)
@@ -337,6 +439,13 @@ def clips(
     help="Folder where VODs are downloaded before joining. Uses placeholders similar to --output.",
     default=f"{get_cache_dir()}/videos/{{id}}/{{quality}}",
 )
+@click.option(
+    "--segment-store",
+    help="""Keep downloaded VODs in a store shared between downloads and reuse
+         them instead of downloading them again, e.g. when downloading the same
+         video with a different crop.""",
+    is_flag=True,
+)
 def download(
     ids: Tuple[str, ...],
     auth_token: Optional[str],
@@ -355,6 +464,7 @@ def download(
     start: Optional[int],
     max_workers: int,
     cache_dir: str,
+    segment_store: bool,
 ):
     """Download videos or clips.
 
@@ -385,6 +495,7 @@ def download(
         start=start,
         max_workers=max_workers,
         cache_dir=cache_dir,
+        segment_store=segment_store,
     )
 
     download(list(ids), options)
@@ -393,6 +504,8 @@ def download(
 @cli.command()
 def env():
     """Print environment information for inclusion in bug reports."""
+    from twitchdl import __version__
+
     click.echo(f"twitch-dl {__version__}")
     click.echo(f"Python {sys.version}")
     click.echo(f"Platform: {platform.platform()}")
@@ -433,6 +546,115 @@ def info(id: str, json: bool, auth_token: Optional[str], sub_only: bool):
     info(id, json=json, auth_token=auth_token, sub_only=sub_only)
 
 
+@cli.command()
+@click.argument("channel_name")
+@click.option(
+    "-a",
+    "--auth-token",
+    help="""Authentication token, passed to Twitch to access subscriber only
+         VODs. Can be copied from the `auth_token` cookie in any browser logged
+         in on Twitch.""",
+)
+@click.option(
+    "--videos/--no-videos",
+    help="Download new videos",
+    default=True,
+)
+@click.option(
+    "--clips/--no-clips",
+    help="Download new clips",
+    default=True,
+)
+@click.option(
+    "--full",
+    help="""Ignore the saved sync state and check all videos and clips. Files
+         which already exist in the target directory are not downloaded
+         again.""",
+    is_flag=True,
+)
+@click.option(
+    "-f",
+    "--format",
+    help="Video format to convert into, passed to ffmpeg as the target file extension.",
+    default=DEFAULT_VIDEO_FORMAT,
+)
+@click.option(
+    "-o",
+    "--output",
+    help="Video file name template, relative to the target directory. See docs for details.",
+    default=DEFAULT_VIDEO_OUTPUT,
+)
+@click.option(
+    "-q",
+    "--quality",
+    help="Video quality, e.g. `720p`. Defaults to `source`.",
+    default="source",
+)
+@click.option(
+    "-t",
+    "--target-dir",
+    help="Target directory for downloaded videos and clips",
+    type=click.Path(
+        file_okay=False,
+        readable=False,
+        writable=True,
+        path_type=Path,
+    ),
+    default=Path(),
+)
+@click.option(
+    "-T",
+    "--type",
+    "types_tuple",
+    help="Broadcast type of videos to sync (can be given multiple times)",
+    default=["archive"],
+    multiple=True,
+    type=click.Choice(["archive", "highlight", "upload"]),
+)
+@click.option(
+    "-w",
+    "--max-workers",
+    help="Number of workers for downloading concurrently",
+    type=int,
+    default=10,
+)
+def sync(
+    channel_name: str,
+    auth_token: Optional[str],
+    videos: bool,
+    clips: bool,
+    full: bool,
+    format: str,
+    output: str,
+    quality: str,
+    target_dir: Path,
+    types_tuple: Tuple[VideosType, ...],
+    max_workers: int,
+):
+    """
+    Download new videos and clips for given CHANNEL_NAME.
+
+    Keeps track of what was downloaded in previous runs so that only videos
+    and clips published since then are fetched, which makes it suitable for
+    running periodically to keep a local archive of a channel up to date.
+    """
+    from twitchdl.commands.sync import sync
+
+    sync(
+        channel_name,
+        auth_token=auth_token,
+        clips=clips,
+        format=format,
+        full=full,
+        max_workers=max_workers,
+        output=output,
+        quality=quality,
+        target_dir=target_dir,
+        video_types=list(types_tuple),
+        videos=videos,
+    )
+
+
 @cli.command()
 @click.argument("channel_name")
 @click.option(
@@ -601,6 +823,7 @@ def chat():
     help="Don't run ffmpeg to join the generated frames, implies --keep.",
     is_flag=True,
 )
+@refresh_option
 def chat_video(
     id: str,
     width: int,
@@ -615,6 +838,7 @@ def chat_video(
     overwrite: bool,
     keep: bool,
     no_join: bool,
+    refresh: bool,
 ):
     """
     Render twitch chat as video
@@ -643,6 +867,7 @@ def chat_video(
             overwrite,
             keep,
             no_join,
+            refresh,
         )
     except ModuleNotFoundError as ex:
         raise ConsoleError(
@@ -671,11 +896,32 @@ def chat_video(
     help="Overwrite the target file if it already exists without prompting.",
     is_flag=True,
 )
-def chat_json(id: str, output: str, overwrite: bool):
+@click.option(
+    "-f",
+    "--format",
+    help="""Output format, either a single JSON object, or JSON Lines with
+         one comment per line.""",
+    type=click.Choice(["json", "jsonl"]),
+    default="json",
+)
+@click.option(
+    "--compress",
+    help="Compress the output file. Adds the .gz or .zst extension.",
+    type=click.Choice(["gzip", "zstd"]),
+)
+@refresh_option
+def chat_json(
+    id: str,
+    output: str,
+    overwrite: bool,
+    format: ChatJsonFormat,
+    compress: Optional[Compression],
+    refresh: bool,
+):
     """Render twitch chat as json"""
     from twitchdl.chat.json import render_chat_json
 
-    render_chat_json(id, output, overwrite)
+    render_chat_json(id, output, overwrite, refresh, format, compress)
 
 
 class HashType(enum.Enum):
@@ -772,10 +1018,12 @@ class HashType(enum.Enum):
     help="Overwrite the target file if it already exists without prompting.",
     is_flag=True,
 )
+@refresh_option
 def chat_ytt(
     id: str,
     output: str,
     overwrite: bool,
+    refresh: bool,
     foreground: RGBA,
     background: RGBA,
     text_edge_color: str,
@@ -817,7 +1065,7 @@ def chat_ytt(
         line_chars=line_chars,
     )
 
-    render_chat_ytt(id, output, overwrite, params, pretty)
+    render_chat_ytt(id, output, overwrite, refresh, params, pretty)
 
 
 @cli.command
@@ -826,25 +1074,88 @@ def chat_ytt(
     "--clear",
     "clear_subdir",
     help="Clear cached files",
-    type=click.Choice(["all", "fonts", "chats", "videos", "emotes", "badges"]),
+    type=click.Choice(
+        ["all", "fonts", "chats", "comments", "videos", "emotes", "badges", "sync", "api"]
+    ),
+)
+@click.option(
+    "-e",
+    "--evict",
+    is_flag=True,
+    help="Delete least recently or least frequently used cached files to stay within limits",
+)
+@click.option(
+    "-m",
+    "--max-size",
+    help="Maximum size of the cache dir when evicting, e.g. 10g",
+    callback=validate_size,
+)
+@click.option(
+    "-Q",
+    "--quota",
+    "quotas",
+    help="Maximum size of a cache subdir when evicting, e.g. emotes=500m, can be repeated",
+    multiple=True,
+    callback=validate_quotas,
+)
+@click.option(
+    "-p",
+    "--policy",
+    help="Eviction policy: least recently used or least frequently used",
+    type=click.Choice(["lru", "lfu"]),
+    default="lru",
 )
-def cache(clear_subdir: str):
+@click.option(
+    "-r",
+    "--rescan",
+    is_flag=True,
+    help="Rebuild the cache index by scanning the cache dir before listing",
+)
+def cache(
+    clear_subdir: str,
+    evict: bool,
+    max_size: Optional[int],
+    quotas: Dict[str, int],
+    policy: "Policy",
+    rescan: bool,
+):
     """View and manage cached files"""
+    from twitchdl import cache_index
+
+    if evict:
+        # Fall back to --cache-max-size
+        max_size = max_size or cache_index.max_size
+        if max_size is None and not quotas:
+            raise ConsoleError("Give --max-size and/or --quota to evict the cache")
+
+        result = cache_index.evict(max_size, quotas, policy)
+        click.echo(f"Evicted {result.files} files ({format_size(result.size)})")
+        return
+
     if clear_subdir:
-        clear_path = get_cache_dir() if clear_subdir == "all" else get_cache_dir(clear_subdir)
-        size = get_size(clear_path)
-        shutil.rmtree(clear_path)
+        usage = cache_index.usage()
+        if clear_subdir == "all":
+            size = sum(size for _, size in usage.values())
+            shutil.rmtree(get_cache_dir())
+        else:
+            _, size = usage.get(clear_subdir, (0, 0))
+            shutil.rmtree(get_cache_dir(clear_subdir))
+            cache_index.clear(clear_subdir)
         click.echo(f"Cleared {clear_subdir} cache ({format_size(size)})")
         return
 
+    if rescan:
+        cache_index.rescan()
+
     cache_dir = get_cache_dir()
     click.echo(f"Cache dir: {cache_dir}")
 
     rows: List[List[str]] = []
+    total_count = 0
     total_size = 0
-    for directory in get_cache_subdirs():
-        size = get_size(directory)
-        rows.append([str(directory), format_size(size)])
+    for subdir, (count, size) in cache_index.usage().items():
+        rows.append([str(cache_dir / subdir), str(count), format_size(size)])
+        total_count += count
         total_size += size
 
     if not rows:
@@ -854,7 +1165,7 @@ def cache(clear_subdir: str):
     click.echo()
     print_table(
         rows,
-        headers=["Directory", "Size"],
-        footers=["Total", format_size(total_size)],
-        alignments={1: "right"},
+        headers=["Directory", "Files", "Size"],
+        footers=["Total", str(total_count), format_size(total_size)],
+        alignments={1: "right", 2: "right"},
     )
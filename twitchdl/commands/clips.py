@@ -2,10 +2,11 @@ import asyncio
 import os
 import re
 import sys
+from dataclasses import dataclass
 from os import path
 from pathlib import Path
-from typing import Callable, Generator, List, NamedTuple, Optional
-from urllib.parse import urlencode
+from typing import Callable, Dict, Generator, List, NamedTuple, Optional
+from urllib.parse import urlencode, urlparse
 
 import click
 import httpx
@@ -13,7 +14,7 @@ import httpx
 from twitchdl import twitch, twitch_async, utils
 from twitchdl.entities import ClipAccessToken, VideoQuality
 from twitchdl.exceptions import ConsoleError
-from twitchdl.http import CHUNK_SIZE, TIMEOUT
+from twitchdl.http import CHUNK_SIZE, TIMEOUT, ConnectionStats, make_transport
 from twitchdl.output import (
     green,
     print_clip,
@@ -22,6 +23,7 @@ from twitchdl.output import (
     print_paged,
     print_status,
 )
+from twitchdl.tracing import span
 from twitchdl.twitch import Clip, ClipsPeriod
 
 
@@ -45,7 +47,8 @@ def clips(
     limit = sys.maxsize if all or pager else (limit or default_limit)
 
     if download:
-        asyncio.run(_download_clips(channel_name, period, target_dir, workers))
+        with span("download clips", workers=workers):
+            asyncio.run(download_clips(channel_name, period, target_dir, workers))
         return
 
     generator = twitch.channel_clips_generator(channel_name, period, limit)
@@ -87,20 +90,20 @@ def _target_filename(clip: Clip, video_qualities: List[VideoQuality]):
 # TODO: add --limit
 
 
-async def _download_clips(
-    channel_name: str,
-    period: ClipsPeriod,
-    target_dir: Path,
-    workers: int,
-):
-    if not target_dir.exists():
-        target_dir.mkdir(parents=True, exist_ok=True)
+CLIP_FILENAME_PATTERN = re.compile(r"^\d{8}_(\d+)_")
+"""Matches the clip ID in file names generated by _target_filename"""
 
-    generator = twitch.channel_clips_page_generator(channel_name, period, 100)
+PAGE_SIZE = 100
+"""Number of clips fetched per request when downloading"""
 
-    for page in generator:
-        print_status(f"Fetched page {page.page_no} of {page.size} clips", dim=True)
-        await _download_page(page.items, target_dir, workers)
+GQL_ORIGIN = "{0.scheme}://{0.netloc}".format(urlparse(twitch.GQL_URL))
+"""Scheme and host of the GQL API, used to route its requests to a separate pool"""
+
+GQL_MAX_CONNECTIONS = 4
+"""
+Maximum number of connections to the GQL API, which is used for short
+requests which don't benefit from many parallel connections.
+"""
 
 
 class Task(NamedTuple):
@@ -108,48 +111,179 @@ class Task(NamedTuple):
     target: Path
 
 
-async def _download_page(clips: List[Clip], target_dir: Path, workers: int):
-    queue: asyncio.Queue[Task] = asyncio.Queue()
+@dataclass
+class DownloadStats:
+    downloaded: int = 0
+    existing: int = 0
+    failed: int = 0
 
-    # Fill the download queue
-    for clip in clips:
-        # videoQualities can be null in some circumstances, see:
-        # https://github.com/ihabunek/twitch-dl/issues/160
-        if clip["videoQualities"]:
-            target = target_dir / _target_filename(clip, clip["videoQualities"])
-            if target.exists():
-                print_status(f"Clip exists: {green(target)}")
-            else:
-                await queue.put(Task(clip["slug"], target))
 
-    tasks = [asyncio.create_task(_download_worker(queue)) for _ in range(workers)]
+async def download_clips(
+    channel_name: str,
+    period: ClipsPeriod,
+    target_dir: Path,
+    workers: int,
+) -> DownloadStats:
+    if not target_dir.exists():
+        target_dir.mkdir(parents=True, exist_ok=True)
 
-    await queue.join()
+    with span("scan existing"):
+        existing = _scan_clips(target_dir)
+    stats = DownloadStats()
+    connection_stats = ConnectionStats()
+
+    async with _make_client(workers, connection_stats) as client:
+        tokens = twitch_async.ClipAccessTokenBatcher(client)
+
+        # Pages are fetched concurrently with downloading so workers don't wait
+        # for the next page. The queue is bounded so fetching doesn't get more
+        # than about a page ahead of the workers.
+        queue: asyncio.Queue[Task] = asyncio.Queue(maxsize=PAGE_SIZE)
+        tasks = [
+            asyncio.create_task(
+                _download_worker(client, tokens, queue, stats),
+                name=f"worker-{n}",
+            )
+            for n in range(workers)
+        ]
 
-    # Cleanup
-    for task in tasks:
-        task.cancel()
+        try:
+            await _fetch_clips(
+                client,
+                tokens,
+                channel_name,
+                period,
+                target_dir,
+                existing,
+                queue,
+                stats,
+            )
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await tokens.close()
+
+    click.echo(
+        f"\nDownloaded {stats.downloaded} clips, {stats.existing} already existed"
+        + f", {stats.failed} failed"
+    )
+    click.secho(f"HTTP: {connection_stats}", dim=True)
+    click.secho(f"Access tokens loaded in {tokens.requests} batched requests", dim=True)
+
+    return stats
+
+
+def _scan_clips(target_dir: Path) -> Dict[str, Path]:
+    """
+    Find clips which were already downloaded to target_dir, indexed by clip ID.
+
+    Lists the directory once instead of checking each clip's file separately,
+    which is slow on network mounted file systems. Matching on clip ID also
+    finds clips whose file name changed since they were downloaded, e.g. when
+    the clip was renamed.
+    """
+    clips: Dict[str, Path] = {}
+
+    with os.scandir(target_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".tmp"):
+                continue
+            match = CLIP_FILENAME_PATTERN.match(entry.name)
+            if match and entry.is_file():
+                clips[match.group(1)] = Path(entry.path)
+
+    return clips
+
+
+def _make_client(workers: int, connection_stats: ConnectionStats) -> httpx.AsyncClient:
+    """
+    Create a client shared by all workers, so that connections are kept alive
+    and reused between clips. GQL and CDN requests get separate connection
+    pools so that slow downloads don't block access token requests.
+    """
+    gql_limits = httpx.Limits(
+        max_connections=GQL_MAX_CONNECTIONS,
+        max_keepalive_connections=GQL_MAX_CONNECTIONS,
+    )
+    cdn_limits = httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+
+    return httpx.AsyncClient(
+        timeout=TIMEOUT,
+        limits=cdn_limits,
+        transport=make_transport(workers),
+        mounts={GQL_ORIGIN: httpx.AsyncHTTPTransport(limits=gql_limits)},
+        event_hooks={"request": [connection_stats.on_request]},
+    )
 
-    await asyncio.gather(*tasks, return_exceptions=True)
 
+async def _fetch_clips(
+    client: httpx.AsyncClient,
+    tokens: twitch_async.ClipAccessTokenBatcher,
+    channel_name: str,
+    period: ClipsPeriod,
+    target_dir: Path,
+    existing: Dict[str, Path],
+    queue: asyncio.Queue[Task],
+    stats: DownloadStats,
+):
+    pages = twitch_async.channel_clips_page_generator(client, channel_name, period, PAGE_SIZE)
+    async for page in pages:
+        print_status(f"Fetched page {page.page_no} of {page.size} clips", dim=True)
+        page_tasks: List[Task] = []
+        for clip in page.items:
+            # videoQualities can be null in some circumstances, see:
+            # https://github.com/ihabunek/twitch-dl/issues/160
+            if clip["videoQualities"]:
+                if clip["id"] in existing:
+                    print_status(f"Clip exists: {green(existing[clip['id']])}")
+                    stats.existing += 1
+                else:
+                    target = target_dir / _target_filename(clip, clip["videoQualities"])
+                    page_tasks.append(Task(clip["slug"], target))
+
+        # Start loading access tokens for the whole page so they are ready by
+        # the time the workers get to the clips
+        tokens.prefetch(task.slug for task in page_tasks)
+        for task in page_tasks:
+            await queue.put(task)
+
+
+async def _download_worker(
+    client: httpx.AsyncClient,
+    tokens: twitch_async.ClipAccessTokenBatcher,
+    queue: asyncio.Queue[Task],
+    stats: DownloadStats,
+):
+    while True:
+        task = await queue.get()
+        try:
+            if await _download_clip(client, tokens, task):
+                stats.downloaded += 1
+            else:
+                stats.failed += 1
+        finally:
+            queue.task_done()
 
-async def _download_worker(queue: asyncio.Queue[Task]):
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        while True:
-            task = await queue.get()
-            tmp_target = Path(f"{task.target}.tmp")
 
-            try:
-                print_status(f"Downloading {task.target}...", dim=True, transient=True)
-                url = await _get_clip_authenticated_url(client, task.slug, "source")
+async def _download_clip(
+    client: httpx.AsyncClient,
+    tokens: twitch_async.ClipAccessTokenBatcher,
+    task: Task,
+) -> bool:
+    try:
+        print_status(f"Downloading {task.target}...", dim=True, transient=True)
+        with span("clip", slug=task.slug):
+            with span("access token"):
+                url = await _get_clip_authenticated_url(tokens, task.slug, "source")
+            with span("download"), utils.atomic_write(task.target) as tmp_target:
                 await _download_file(client, url, tmp_target)
-                os.rename(tmp_target, task.target)
-                print_status(f"Downloaded {green(task.target)}")
-            except Exception as ex:
-                click.secho(f"Failed downloading {task.slug}: {ex}", err=True, fg="red")
-                tmp_target.unlink(missing_ok=True)
-
-            queue.task_done()
+        print_status(f"Downloaded {green(task.target)}")
+        return True
+    except Exception as ex:
+        click.secho(f"Failed downloading {task.slug}: {ex}", err=True, fg="red")
+        return False
 
 
 async def _download_file(client: httpx.AsyncClient, url: str, target: Path):
@@ -160,12 +294,12 @@ async def _download_file(client: httpx.AsyncClient, url: str, target: Path):
                 f.write(chunk)
 
 
-async def _get_clip_authenticated_url(client: httpx.AsyncClient, slug: str, quality: str):
-    access_token = await twitch_async.get_clip_access_token(client, slug)
-
-    if not access_token:
-        raise ConsoleError(f"Access token not found for slug '{slug}'")
-
+async def _get_clip_authenticated_url(
+    tokens: twitch_async.ClipAccessTokenBatcher,
+    slug: str,
+    quality: str,
+):
+    access_token = await tokens.get(slug)
     url = _get_clip_url(access_token, quality)
 
     query = urlencode(
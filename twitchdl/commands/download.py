@@ -11,7 +11,7 @@ from urllib.parse import urlencode
 import click
 import httpx
 
-from twitchdl import twitch, utils
+from twitchdl import segment_store, twitch, utils
 from twitchdl.cache import Cache
 from twitchdl.commands.info import fetch_chapters
 from twitchdl.entities import Clip, DownloadOptions
@@ -40,6 +40,7 @@ from twitchdl.playlists import (
     select_playlist,
 )
 from twitchdl.subonly import get_subonly_playlists
+from twitchdl.tracing import span
 from twitchdl.twitch import Chapter, ClipAccessToken, Video
 
 
@@ -56,9 +57,10 @@ def download_one(id_or_slug: str, args: DownloadOptions):
     video_id = utils.parse_video_identifier(id_or_slug)
     if video_id:
         print_log("Looking up video...")
-        video = twitch.get_video(video_id)
+        with span("look up video"):
+            video = twitch.get_video(video_id)
         if video:
-            _download_video(video, args)
+            download_video(video, args)
         else:
             print_error(f"Video '{video_id}' not found")
         return
@@ -66,7 +68,8 @@ def download_one(id_or_slug: str, args: DownloadOptions):
     slug = utils.parse_clip_identifier(id_or_slug)
     if slug:
         print_log("Looking up clip...")
-        clip = twitch.get_clip(slug)
+        with span("look up clip"):
+            clip = twitch.get_clip(slug)
 
         if clip:
             _download_clip(clip, args)
@@ -203,13 +206,15 @@ def _download_clip(clip: Clip, args: DownloadOptions) -> None:
             elif response == Overwrite.ABORT:
                 raise click.Abort()
 
-    url = get_clip_authenticated_url(clip["slug"], args.quality)
+    with span("access token"):
+        url = get_clip_authenticated_url(clip["slug"], args.quality)
     print_log(f"Downloading from: {url}")
 
     if args.dry_run:
         click.echo("Dry run, clip not downloaded.")
     else:
-        download_file(url, target)
+        with span("download clip"):
+            download_file(url, target)
         click.echo(f"Downloaded clip: {green(target)}")
 
 
@@ -225,7 +230,7 @@ def _print_found_clip(clip: Clip):
     )
 
 
-def _download_video(video: Video, args: DownloadOptions) -> None:
+def download_video(video: Video, args: DownloadOptions) -> None:
     target = Path(video_filename(video, args.format, args.output))
     print_found_video(video)
     print_log(f"Target: {blue(target)}")
@@ -253,35 +258,39 @@ def _download_video(video: Video, args: DownloadOptions) -> None:
             elif response == Overwrite.ABORT:
                 raise click.Abort()
 
-    chapters = fetch_chapters(video["id"])
+    with span("chapters"):
+        chapters = fetch_chapters(video["id"])
     start, end = _determine_time_range(chapters, args)
 
     print_log("Fetching access token...")
-    access_token = twitch.get_access_token(video["id"], auth_token=args.auth_token)
+    with span("access token"):
+        access_token = twitch.get_access_token(video["id"], auth_token=args.auth_token)
 
     print_log("Fetching playlists...")
 
     subonly_playlist = False
-    try:
-        playlists_text = twitch.get_playlists(video["id"], access_token)
-        playlists = parse_playlists(playlists_text)
-    except AuthRequiredError:
-        print_warning("\nPossible subscriber-only VOD, attempting workaround...")
-        print_warning("If this does not work, check out the authentication chapter in docs:")
-        print_warning("https://twitch-dl.bezdomni.net/authentication.html")
-
-        playlists_text = ""
-        playlists = get_subonly_playlists(video)
-        subonly_playlist = True
+    with span("playlists"):
+        try:
+            playlists_text = twitch.get_playlists(video["id"], access_token)
+            playlists = parse_playlists(playlists_text)
+        except AuthRequiredError:
+            print_warning("\nPossible subscriber-only VOD, attempting workaround...")
+            print_warning("If this does not work, check out the authentication chapter in docs:")
+            print_warning("https://twitch-dl.bezdomni.net/authentication.html")
+
+            playlists_text = ""
+            playlists = get_subonly_playlists(video)
+            subonly_playlist = True
 
     playlist = select_playlist(playlists, args.quality)
     base_uri = re.sub("/[^/]+$", "/", playlist.url)
 
     print_log("Fetching playlist...")
-    vods_text = http_get(playlist.url)
-    vods_m3u8 = load_m3u8(vods_text)
-    all_vods = enumerate_vods(vods_m3u8)
-    vods, crop_start, crop_duration = filter_vods(all_vods, start, end)
+    with span("playlist"):
+        vods_text = http_get(playlist.url)
+        vods_m3u8 = load_m3u8(vods_text)
+        all_vods = enumerate_vods(vods_m3u8)
+        vods, crop_start, crop_duration = filter_vods(all_vods, start, end)
 
     if args.dry_run:
         click.echo("Dry run, video not downloaded.")
@@ -304,11 +313,11 @@ def _download_video(video: Video, args: DownloadOptions) -> None:
     with open(playlist_path, "w") as f:
         f.write(vods_text)
 
-    init_sections = get_init_sections(vods_m3u8)
-    for uri in init_sections:
-        print_log(f"Downloading init section {uri}...")
-        init_section_path = cache.get_path(uri)
-        download_file(f"{base_uri}{uri}", init_section_path)
+    # Init sections are downloaded ahead of VODs, using the same workers
+    init_sections = [
+        (base_uri + section.uri, cache.get_path(section.filename), section.byterange)
+        for section in get_init_sections(vods_m3u8)
+    ]
 
     print_log(f"Downloading {len(vods)} VODs using {args.max_workers} workers")
 
@@ -334,14 +343,36 @@ def _download_video(video: Video, args: DownloadOptions) -> None:
                 f"Muted {muted_count} VODs available only to subscribers. Use an access token to get the unmuted audio."
             )
 
-    asyncio.run(
-        download_all(
-            zip(sources, targets),
-            args.max_workers,
-            rate_limit=args.rate_limit,
-            count=len(vods),
-        )
-    )
+    # Another process downloading the same video to the same cache dir
+    # would download the same files, wait for it to finish and reuse them
+    download_lock = cache.download_lock()
+    if not download_lock.acquire(blocking=False):
+        print_log("Waiting for another process downloading to the same cache dir...")
+        with span("wait for lock"):
+            download_lock.acquire()
+
+    try:
+        if args.segment_store:
+            linked = segment_store.link_stored(zip(sources, targets))
+            if linked:
+                print_log(f"Reusing {linked} VODs from the segment store")
+
+        with span("download segments", count=len(vods), workers=args.max_workers):
+            asyncio.run(
+                download_all(
+                    zip(sources, targets),
+                    args.max_workers,
+                    rate_limit=args.rate_limit,
+                    count=len(vods),
+                    priority=init_sections,
+                )
+            )
+    finally:
+        # Store segments even if the download failed part way
+        if args.segment_store:
+            with span("store segments"):
+                segment_store.store(zip(sources, targets))
+        download_lock.release()
 
     join_playlist = make_join_playlist(vods_m3u8, vods, targets)
     join_playlist_path = cache.get_path("playlist_downloaded.m3u8")
@@ -355,17 +386,19 @@ def _download_video(video: Video, args: DownloadOptions) -> None:
 
     if args.concat:
         print_log("Concating files...")
-        _concat_vods(targets, target)
+        with span("concat"):
+            _concat_vods(targets, target)
     else:
         print_log("Joining files...")
-        _join_vods(
-            join_playlist_path,
-            metadata_path,
-            target,
-            overwrite,
-            crop_start,
-            crop_duration,
-        )
+        with span("join"):
+            _join_vods(
+                join_playlist_path,
+                metadata_path,
+                target,
+                overwrite,
+                crop_start,
+                crop_duration,
+            )
 
     click.echo()
 
@@ -373,7 +406,8 @@ def _download_video(video: Video, args: DownloadOptions) -> None:
         click.echo(f"Cached files not deleted: {yellow(cache_dir)}")
     else:
         print_log("Deleting cached files...")
-        cache.delete()
+        with span("delete cache"):
+            cache.delete()
 
     click.echo(f"Downloaded: {green(target)}")
 
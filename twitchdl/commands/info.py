@@ -8,7 +8,6 @@ from twitchdl.exceptions import ConsoleError, AuthRequiredError
 from twitchdl.naming import video_placeholders
 from twitchdl.output import bold, dim, print_clip, print_json, print_log, print_table, print_video, print_warning
 from twitchdl.playlists import Playlist, parse_playlists
-from twitchdl.subonly import get_subonly_playlists
 from twitchdl.twitch import Chapter, Clip, Video
 
 
@@ -26,7 +25,7 @@ def info(id: str, *, json: bool = False, auth_token: Optional[str], sub_only: bo
 
         if sub_only:
             print_log("Fetching sub-only playlists...")
-            playlists = get_subonly_playlists(video)
+            playlists = _get_subonly_playlists(video)
         else:
             print_log("Fetching playlists...")
             try:
@@ -34,7 +33,7 @@ def info(id: str, *, json: bool = False, auth_token: Optional[str], sub_only: bo
                 playlists = parse_playlists(playlists_text)
             except AuthRequiredError:
                 print_log("Possible subscriber-only VOD, attempting workaround...")
-                playlists = get_subonly_playlists(video)
+                playlists = _get_subonly_playlists(video)
 
         chapters = fetch_chapters(video_id)
 
@@ -69,6 +68,13 @@ def fetch_chapters(video_id: str) -> List[Chapter]:
         return []
 
 
+def _get_subonly_playlists(video: Video) -> List[Playlist]:
+    # Imported only when needed since it's slow to import
+    from twitchdl.subonly import get_subonly_playlists
+
+    return get_subonly_playlists(video)
+
+
 def video_info(video: Video, playlists: List[Playlist], chapters: List[Chapter]):
     click.echo()
     print_video(video)
@@ -0,0 +1,224 @@
+"""
+Incrementally download new videos and clips for a channel.
+
+Sync state is kept per channel in the cache dir. For videos it records the
+newest downloaded video of each type, so listing videos can stop as soon as it
+reaches a known one. For clips, which can only be listed by views, it records
+the time of the last successful sync, which is used to pick the shortest clips
+period which covers all clips created since then.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import click
+
+from twitchdl import twitch
+from twitchdl.cache import get_cache_dir
+from twitchdl.commands.clips import download_clips
+from twitchdl.commands.download import download_video
+from twitchdl.entities import ClipsPeriod, DownloadOptions, Video, VideosType
+from twitchdl.output import bold, print_log, print_status
+from twitchdl.utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+SYNC_SUBDIR = "sync"
+
+DAY = 24 * 3600
+
+CLIPS_PERIODS: List[Tuple[int, ClipsPeriod]] = [
+    (DAY, "last_day"),
+    (7 * DAY, "last_week"),
+    (30 * DAY, "last_month"),
+]
+"""Clip periods and their duration in seconds, shortest first"""
+
+CLIPS_PERIOD_MARGIN = 3600
+"""Extra time added when choosing the clip period to account for clock skew"""
+
+
+@dataclass
+class VideosState:
+    last_id: Optional[str] = None
+    """ID of the newest downloaded video"""
+    last_published_at: Optional[str] = None
+    """Publish time of the newest downloaded video"""
+
+
+@dataclass
+class SyncState:
+    videos: Dict[str, VideosState] = field(default_factory=lambda: {})
+    """Videos sync state by video type"""
+    clips_synced_at: Optional[float] = None
+    """Time of the last successful clips sync as a unix timestamp"""
+
+
+def sync(
+    channel_name: str,
+    *,
+    auth_token: Optional[str],
+    clips: bool,
+    format: str,
+    full: bool,
+    max_workers: int,
+    output: str,
+    quality: Optional[str],
+    target_dir: Path,
+    video_types: List[VideosType],
+    videos: bool,
+):
+    state_path = _state_path(channel_name)
+    state = SyncState() if full else _load_state(state_path)
+
+    if not target_dir.exists():
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+    if videos:
+        options = DownloadOptions(
+            auth_token=auth_token,
+            chapter=None,
+            concat=False,
+            dry_run=False,
+            end=None,
+            format=format,
+            keep=False,
+            no_join=False,
+            overwrite=False,
+            skip_existing=True,
+            output=str(target_dir / output),
+            quality=quality,
+            rate_limit=None,
+            start=None,
+            max_workers=max_workers,
+            cache_dir=f"{get_cache_dir()}/videos/{{id}}/{{quality}}",
+            segment_store=False,
+        )
+
+        for type in video_types:
+            video_state = state.videos.setdefault(type, VideosState())
+            _sync_videos(channel_name, type, video_state, options, state, state_path)
+
+    if clips:
+        _sync_clips(channel_name, target_dir, max_workers, state, state_path)
+
+
+def _sync_videos(
+    channel_name: str,
+    type: VideosType,
+    video_state: VideosState,
+    options: DownloadOptions,
+    state: SyncState,
+    state_path: Path,
+):
+    print_status(f"Checking for new {type} videos...", dim=True)
+    new_videos = _find_new_videos(channel_name, type, video_state)
+
+    if not new_videos:
+        click.echo(f"No new {type} videos")
+        return
+
+    click.echo(f"Found {bold(len(new_videos))} new {type} videos")
+
+    # Download oldest first so the state can be updated after each video
+    for video in reversed(new_videos):
+        download_video(video, options)
+        video_state.last_id = video["id"]
+        video_state.last_published_at = video["publishedAt"]
+        _save_state(state_path, state)
+
+
+def _find_new_videos(channel_name: str, type: VideosType, video_state: VideosState) -> List[Video]:
+    """Returns videos published since the last sync, newest first."""
+    # Prefetching is disabled because usually only the first page is needed
+    _, generator = twitch.channel_videos_generator(
+        channel_name, sys.maxsize, "time", type, prefetch=0
+    )
+    videos: List[Video] = []
+
+    # The generator fetches pages lazily, so stopping at a known video means
+    # no more pages are fetched
+    for video in generator:
+        if _is_known_video(video, video_state):
+            break
+
+        # Skip videos which are still being recorded, they will be downloaded
+        # on the next sync after the stream ends
+        if video["status"] == "RECORDING":
+            print_log(f"Skipping video {video['id']} which is still recording")
+            continue
+
+        videos.append(video)
+
+    return videos
+
+
+def _is_known_video(video: Video, video_state: VideosState) -> bool:
+    if video["id"] == video_state.last_id:
+        return True
+
+    # Handle the last known video being deleted
+    last_published_at = video_state.last_published_at
+    published_at = video["publishedAt"]
+    return bool(last_published_at and published_at and published_at <= last_published_at)
+
+
+def _sync_clips(
+    channel_name: str,
+    target_dir: Path,
+    max_workers: int,
+    state: SyncState,
+    state_path: Path,
+):
+    started_at = time.time()
+    period = clips_period(state.clips_synced_at, started_at)
+    print_status(f"Checking for new clips in period: {period}", dim=True)
+
+    stats = asyncio.run(download_clips(channel_name, period, target_dir, max_workers))
+
+    # Don't move the sync time forward if some clips failed to download so they
+    # are retried on the next sync
+    if stats.failed == 0:
+        state.clips_synced_at = started_at
+        _save_state(state_path, state)
+
+
+def clips_period(synced_at: Optional[float], now: float) -> ClipsPeriod:
+    """Returns the shortest clips period which includes all clips created since synced_at."""
+    if synced_at is None:
+        return "all_time"
+
+    elapsed = now - synced_at + CLIPS_PERIOD_MARGIN
+    for duration, period in CLIPS_PERIODS:
+        if elapsed <= duration:
+            return period
+
+    return "all_time"
+
+
+def _state_path(channel_name: str) -> Path:
+    return get_cache_dir(SYNC_SUBDIR) / f"{channel_name.lower()}.json"
+
+
+def _load_state(state_path: Path) -> SyncState:
+    try:
+        with open(state_path, "r") as f:
+            data = json.load(f)
+        videos = {type: VideosState(**v) for type, v in data.pop("videos", {}).items()}
+        return SyncState(videos=videos, **data)
+    except FileNotFoundError:
+        return SyncState()
+    except Exception as ex:
+        logger.warning(f"Discarding invalid sync state {state_path}: {ex}")
+        return SyncState()
+
+
+def _save_state(state_path: Path, state: SyncState):
+    with atomic_write(state_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(asdict(state), f, indent=2)
@@ -33,11 +33,14 @@ class DownloadOptions:
     start: Optional[int]
     max_workers: int
     cache_dir: str
+    segment_store: bool
 
 
 ClipsPeriod = Literal["last_day", "last_week", "last_month", "all_time"]
 VideosSort = Literal["views", "time"]
 VideosType = Literal["archive", "highlight", "upload"]
+ChatJsonFormat = Literal["json", "jsonl"]
+Compression = Literal["gzip", "zstd"]
 
 
 class AccessToken(TypedDict):
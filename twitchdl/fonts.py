@@ -1,11 +1,10 @@
 import hashlib
-import json
 import math
+import sys
 import unicodedata
 from dataclasses import dataclass
-from functools import lru_cache
 from pathlib import Path
-from typing import Callable, Generator, Iterable, List, Optional, Set, Tuple
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Set, Tuple
 
 from fontTools.ttLib import TTFont, TTLibFileIsCollectionError  # type: ignore
 from fontTools.ttLib.ttCollection import TTCollection  # type: ignore
@@ -13,13 +12,14 @@ from PIL import ImageFont
 
 from twitchdl.cache import get_cache_dir
 from twitchdl.output import print_log
+from twitchdl.utils import atomic_write
 
 
 @dataclass
 class Font:
     path: Path
     image_font: ImageFont.FreeTypeFont
-    codepoints: Set[int]
+    codepoints: "Coverage"
     is_bitmap: bool
     size: int
 
@@ -64,27 +64,68 @@ def get_codepoints(path: Path) -> Set[int]:
     return empty_set.union(*gen())
 
 
-def get_codepoints_cached(path: Path) -> Set[int]:
-    # Cache codepoints, since it's slow to extract them
-    hash = hashlib.md5(str(path).encode()).hexdigest()
-    filename = f"{path.name}.{hash}.json"
-    codepoints_path = get_cache_dir("fonts") / filename
+def get_codepoints_cached(path: Path) -> "Coverage":
+    # Cache codepoints, since it's slow to extract them. The cache key includes
+    # the file size and modification time so it's invalidated if the font changes.
+    stat = path.stat()
+    key = f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    hash = hashlib.md5(key.encode()).hexdigest()
+    filename = f"{path.name}.{hash}.cov"
+    coverage_path = get_cache_dir("fonts") / filename
 
-    if codepoints_path.exists():
+    if coverage_path.exists():
         try:
-            with open(codepoints_path, "r") as f:
-                return set(json.load(f))
+            return Coverage.load(coverage_path)
         except Exception:
             pass
 
     print_log("Extracting supported codepoints...")
-    codepoints = get_codepoints(path)
+    coverage = Coverage.from_codepoints(get_codepoints(path))
 
-    print_log(f"Saving codepoints cache to: {codepoints_path}")
-    with open(codepoints_path, "w") as f:
-        json.dump(list(codepoints), f)
+    print_log(f"Saving codepoints cache to: {coverage_path}")
+    coverage.save(coverage_path)
 
-    return get_codepoints(path)
+    return coverage
+
+
+class Coverage:
+    """
+    Set of codepoints supported by a font, stored as a bitmap with one bit per
+    Unicode codepoint. Fast to check, and fast to load from and save to disk.
+    """
+
+    SIZE = (sys.maxunicode + 1) // 8
+    """Size of the bitmap in bytes"""
+
+    def __init__(self, bitmap: bytes):
+        if len(bitmap) != self.SIZE:
+            raise ValueError(f"Invalid bitmap size: {len(bitmap)}")
+        self.bitmap = bitmap
+        self._count: Optional[int] = None
+
+    @classmethod
+    def from_codepoints(cls, codepoints: Iterable[int]) -> "Coverage":
+        bitmap = bytearray(cls.SIZE)
+        for codepoint in codepoints:
+            bitmap[codepoint >> 3] |= 1 << (codepoint & 7)
+        return cls(bytes(bitmap))
+
+    @classmethod
+    def load(cls, path: Path) -> "Coverage":
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def save(self, path: Path):
+        with atomic_write(path) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(self.bitmap)
+
+    def __contains__(self, codepoint: int) -> bool:
+        return bool(self.bitmap[codepoint >> 3] & (1 << (codepoint & 7)))
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = bin(int.from_bytes(self.bitmap, "little")).count("1")
+        return self._count
 
 
 def tt_fonts(path: Path) -> Generator[TTFont, None, None]:
@@ -128,36 +169,56 @@ def make_group_by_font(
     fonts: List[Font],
     on_char_not_found: Callable[[str], None],
 ) -> Callable[[str], Generator[Tuple[str, Font], None, None]]:
-    @lru_cache
+    font_by_char: Dict[str, Optional[Font]] = {}
+
     def get_font(char: str) -> Optional[Font]:
-        for font in fonts:
-            if ord(char) in font.codepoints:
-                return font
+        try:
+            return font_by_char[char]
+        except KeyError:
+            codepoint = ord(char)
+            font = next((f for f in fonts if codepoint in f.codepoints), None)
+            font_by_char[char] = font
+            return font
+
+    # Most chat text is printable ASCII, which is usually covered by the first
+    # font. If so, such text can be rendered without checking each char.
+    ascii_fonts = [get_font(chr(codepoint)) for codepoint in range(0x20, 0x7F)]
+    ascii_font = ascii_fonts[0] if all(f is ascii_fonts[0] for f in ascii_fonts) else None
 
     def group_by_font(text: str):
         """Split given text into chunks which can be rendered by the same font."""
         if not text:
             return
 
-        buffer = ""
+        if ascii_font and text.isascii() and text.isprintable():
+            yield text, ascii_font
+            return
+
+        # Chunks of text skipping any chars which cannot be rendered
+        parts: List[str] = []
+        start = 0
         font = None
 
-        for char in text:
+        for index, char in enumerate(text):
             char_font = get_font(char)
             if not char_font:
                 on_char_not_found(char)
+                parts.append(text[start:index])
+                start = index + 1
                 continue
 
             if not font:
                 font = char_font
 
-            if font == char_font:
-                buffer += char
-            else:
-                yield buffer, font
+            if font is not char_font:
+                parts.append(text[start:index])
+                yield "".join(parts), font
+                parts = []
+                start = index
                 font = char_font
-                buffer = char
 
+        parts.append(text[start:])
+        buffer = "".join(parts)
         if buffer and font:
             yield buffer, font
 
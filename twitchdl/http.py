@@ -4,12 +4,13 @@ import os
 import time
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Iterable, Optional, Tuple
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import httpx
 
 from twitchdl.exceptions import ConsoleError
 from twitchdl.progress import Progress
+from twitchdl.utils import atomic_write
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,146 @@ Number of seconds to wait before aborting when there is no network activity.
 https://www.python-httpx.org/advanced/#timeout-configuration
 """
 
+HTTP2_MAX_STREAMS = 8
+"""
+Maximum number of concurrent downloads over a single HTTP/2 connection. More
+connections are opened for more workers, so a single congested connection
+doesn't slow down all downloads.
+"""
+
+http2 = False
+"""Download over HTTP/2 when supported by the server, set by the --http2 option"""
+
+
+ByteRange = Tuple[int, int]
+"""Inclusive start and end offsets of a byte range"""
+
+
+class ConnectionStats:
+    """
+    Counts requests made by an async client and the connections it opened to
+    make them, to show how well connections are reused.
+
+    Uses the httpcore trace extension, see:
+    https://www.encode.io/httpcore/extensions/#trace
+    """
+
+    def __init__(self):
+        self.requests: int = 0
+        self.connections: int = 0
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    async def on_request(self, request: httpx.Request):
+        """Request event hook which enables tracing for the request."""
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections += 1
+
+    def __str__(self):
+        return (
+            f"{self.requests} requests over {self.connections} connections"
+            + f" ({self.reused} reused)"
+        )
+
+
+class MultiplexingTransport(httpx.AsyncBaseTransport):
+    """
+    Spreads requests over several transports, sending each request using the
+    one with fewest active requests, and limits concurrent requests on each.
+
+    An HTTP/2 transport sends all concurrent requests to an origin over a
+    single connection, so using several transports opens several connections.
+    """
+
+    def __init__(self, transports: List[httpx.AsyncBaseTransport], max_streams: int):
+        self.transports = transports
+        self.active = [0] * len(transports)
+        self.semaphores = [asyncio.Semaphore(max_streams) for _ in transports]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        index = min(range(len(self.transports)), key=lambda n: self.active[n])
+        self.active[index] += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.active[index] -= 1
+                self.semaphores[index].release()
+
+        try:
+            await self.semaphores[index].acquire()
+        except BaseException:
+            self.active[index] -= 1
+            raise
+
+        try:
+            response = await self.transports[index].handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+
+        # Streams are active until the response body is read or closed
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        response.stream = _ClosingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        for transport in self.transports:
+            await transport.aclose()
+
+
+class _ClosingStream(httpx.AsyncByteStream):
+    """Calls `on_close` when the stream is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.on_close()
+
+
+def make_transport(workers: int) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    Transport for an async client making up to `workers` concurrent downloads.
+
+    Returns None, so the client uses its default HTTP/1.1 transport, unless
+    HTTP/2 is enabled, in which case downloads are multiplexed over as many
+    HTTP/2 connections as needed to keep within HTTP2_MAX_STREAMS on each.
+    Servers which don't support HTTP/2 are accessed over HTTP/1.1.
+    """
+    if not http2:
+        return None
+
+    connections = -(-workers // HTTP2_MAX_STREAMS)
+    try:
+        transports: List[httpx.AsyncBaseTransport] = [
+            httpx.AsyncHTTPTransport(http2=True) for _ in range(connections)
+        ]
+    except ImportError as ex:
+        raise ConsoleError(
+            f"{ex}\n\n"
+            + 'HTTP/2 requires twitch-dl to be installed with optional "http2" dependencies:\n'
+            + 'pipx install "twitch-dl[http2]"'
+        )
+
+    return MultiplexingTransport(transports, HTTP2_MAX_STREAMS)
+
 
 class TokenBucket(ABC):
     @abstractmethod
@@ -79,8 +220,7 @@ async def download(
 ):
     # Download to a temp file first, then copy to target when over to avoid
     # getting saving chunks which may persist if canceled or --keep is used
-    tmp_target = f"{target}.tmp"
-    with open(tmp_target, "wb") as f:
+    with atomic_write(target) as tmp_target, open(tmp_target, "wb") as f:
         async with client.stream("GET", source) as response:
             response.raise_for_status()
 
@@ -96,7 +236,6 @@ async def download(
                 token_bucket.advance(size)
                 progress.advance(task_id, size)
             progress.end(task_id)
-    os.rename(tmp_target, target)
 
 
 async def download_with_retries(
@@ -126,17 +265,69 @@ async def download_with_retries(
         raise Exception("Should not happen")
 
 
+async def download_ranged(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    source: str,
+    target: Path,
+    byterange: Optional[ByteRange],
+):
+    """
+    Download a small file, or a byte range of one, without tracking progress.
+    Used for files which are needed before the rest, such as init sections.
+    """
+    async with semaphore:
+        if target.exists():
+            return
+
+        headers = {"Range": f"bytes={byterange[0]}-{byterange[1]}"} if byterange else {}
+        for n in range(RETRY_COUNT):
+            try:
+                response = await client.get(source, headers=headers)
+                response.raise_for_status()
+                break
+            except httpx.RequestError:
+                logger.exception(f"Downloading {source} failed. Retrying. Maybe.")
+                if n + 1 >= RETRY_COUNT:
+                    raise
+        else:
+            raise Exception("Should not happen")
+
+        content = response.content
+        # Server may ignore the Range header and return the whole file
+        if byterange and response.status_code != 206:
+            content = content[byterange[0] : byterange[1] + 1]
+
+        with atomic_write(target) as tmp_target, open(tmp_target, "wb") as f:
+            f.write(content)
+
+
 async def download_all(
     source_targets: Iterable[Tuple[str, Path]],
     workers: int,
     *,
     count: Optional[int] = None,
     rate_limit: Optional[int] = None,
+    priority: Sequence[Tuple[str, Path, Optional[ByteRange]]] = (),
 ):
+    """
+    Download sources to targets using the given number of concurrent workers.
+
+    Files in `priority` are downloaded ahead of the others, optionally only the
+    given byte range. They are not included in progress or the rate limit.
+    """
     progress = Progress(count)
     token_bucket = LimitingTokenBucket(rate_limit) if rate_limit else EndlessTokenBucket()
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+    async with httpx.AsyncClient(timeout=TIMEOUT, transport=make_transport(workers)) as client:
         semaphore = asyncio.Semaphore(workers)
+
+        # Semaphore is acquired in the order in which tasks are started, so
+        # priority downloads are started first
+        priority_tasks = [
+            download_ranged(client, semaphore, source, target, byterange)
+            for source, target, byterange in priority
+        ]
+
         tasks = [
             download_with_retries(
                 client,
@@ -149,7 +340,7 @@ async def download_all(
             )
             for task_id, (source, target) in enumerate(source_targets)
         ]
-        await asyncio.gather(*tasks)
+        await asyncio.gather(*priority_tasks, *tasks)
 
 
 def download_file(url: str, target: Path, retries: int = RETRY_COUNT) -> None:
@@ -171,12 +362,8 @@ def download_file(url: str, target: Path, retries: int = RETRY_COUNT) -> None:
 
 
 def _do_download_file(url: str, target: Path) -> None:
-    tmp_path = Path(str(target) + ".tmp")
-
     with httpx.stream("GET", url, timeout=TIMEOUT, follow_redirects=True) as response:
         response.raise_for_status()
-        with open(tmp_path, "wb") as f:
+        with atomic_write(target) as tmp_path, open(tmp_path, "wb") as f:
             for chunk in response.iter_bytes(chunk_size=CHUNK_SIZE):
                 f.write(chunk)
-
-    os.rename(tmp_path, target)
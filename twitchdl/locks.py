@@ -0,0 +1,139 @@
+"""
+File locks for coordinating twitch-dl processes which share the cache dir.
+
+Locks are held on lock files in the `locks` cache subdir, using `flock` on
+Unix and `msvcrt.locking` on Windows. They are released when the process
+exits, even if it crashes. Windows doesn't support shared locks, so they
+behave like exclusive locks there.
+"""
+
+import hashlib
+import sys
+import time
+from pathlib import Path
+from typing import IO, Optional
+
+from twitchdl import cache
+
+LOCKS_SUBDIR = "locks"
+
+STRIPES = 256
+"""Number of lock files shared by striped locks"""
+
+POLL_INTERVAL = 0.1
+"""How often to retry taking a lock which can't be waited on, in seconds"""
+
+
+class FileLock:
+    """Exclusive or shared lock on a lock file."""
+
+    def __init__(self, path: Path, shared: bool = False):
+        self.path = path
+        self.shared = shared and sys.platform != "win32"
+        self._file: Optional[IO[bytes]] = None
+
+    @property
+    def locked(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock, waiting for it if `blocking` is set. Returns False if not
+        blocking and the lock is held by another process.
+        """
+        if self._file is not None:
+            raise RuntimeError(f"Lock already taken: {self.path}")
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, "a+b")
+        try:
+            if _lock(file, self.shared, blocking):
+                self._file = file
+                return True
+        except BaseException:
+            file.close()
+            raise
+
+        file.close()
+        return False
+
+    def upgrade(self, blocking: bool = True) -> bool:
+        """
+        Convert a shared lock to an exclusive one. Returns False if not
+        blocking and another process holds a shared lock.
+        """
+        if self._file is None:
+            raise RuntimeError(f"Lock not taken: {self.path}")
+
+        if not self.shared:
+            return True
+
+        if _lock(self._file, False, blocking):
+            self.shared = False
+            return True
+
+        return False
+
+    def release(self):
+        if self._file is not None:
+            _unlock(self._file)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args: object):
+        self.release()
+
+
+def path_lock(key: str, shared: bool = False) -> FileLock:
+    """Lock identified by the given key, usually a path to the locked resource."""
+    name = hashlib.sha256(key.encode()).hexdigest()
+    return FileLock(cache.get_cache_dir(LOCKS_SUBDIR) / f"{name}.lock", shared)
+
+
+def striped_lock(key: str) -> FileLock:
+    """
+    Exclusive lock identified by the given key, which shares lock files with
+    other keys so that the number of lock files is bounded. Use for locks which
+    are held briefly, where occasionally waiting for an unrelated lock is ok.
+    """
+    stripe = int(hashlib.sha256(key.encode()).hexdigest(), 16) % STRIPES
+    return FileLock(cache.get_cache_dir(LOCKS_SUBDIR) / f"stripe-{stripe:03}.lock")
+
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock(file: IO[bytes], shared: bool, blocking: bool) -> bool:
+        file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(POLL_INTERVAL)
+
+    def _unlock(file: IO[bytes]):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(file: IO[bytes], shared: bool, blocking: bool) -> bool:
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(file.fileno(), operation)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock(file: IO[bytes]):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
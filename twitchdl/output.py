@@ -1,4 +1,3 @@
-import json
 import sys
 from itertools import islice
 from typing import Any, Callable, Generator, List, Literal, Mapping, Optional, TypeVar
@@ -28,6 +27,8 @@ def truncate(string: str, length: int) -> str:
 
 
 def print_json(data: Any):
+    import json
+
     click.echo(json.dumps(data))
 
 
@@ -1,19 +1,27 @@
 """
 Parse and manipulate m3u8 playlists.
+
+The m3u8 library is slow to import, so it's imported only when parsing.
 """
 
+from __future__ import annotations
+
+import hashlib
 from dataclasses import dataclass
 from os.path import splitext
 from pathlib import Path
-from typing import Generator, Iterable, List, Optional, OrderedDict, Set, Tuple
+from typing import TYPE_CHECKING, Dict, Generator, Iterable, List, Optional, OrderedDict, Tuple
 from urllib.parse import urlparse
 
 import click
-import m3u8
 
 from twitchdl import utils
 from twitchdl.output import bold, dim, print_table
 
+if TYPE_CHECKING:
+    import m3u8
+    from m3u8.model import InitializationSection
+
 
 @dataclass
 class Playlist:
@@ -36,6 +44,16 @@ class Vod:
     """File name to which to download the VOD"""
 
 
+@dataclass
+class InitSection:
+    uri: str
+    """URI of the init section, relative to the playlist"""
+    byterange: Optional[Tuple[int, int]]
+    """Inclusive byte range of the init section within the file, if given"""
+    filename: str
+    """File name to which to download the init section"""
+
+
 def parse_playlists(playlists_m3u8: str) -> List[Playlist]:
     def _parse(source: str) -> Generator[Playlist, None, None]:
         document = load_m3u8(source)
@@ -56,6 +74,8 @@ def parse_playlists(playlists_m3u8: str) -> List[Playlist]:
 
 
 def load_m3u8(playlist_m3u8: str) -> m3u8.M3U8:
+    import m3u8
+
     return m3u8.loads(playlist_m3u8)
 
 
@@ -115,6 +135,8 @@ def make_join_playlist(
     Make a modified playlist which references downloaded VODs
     Keep only the downloaded segments and skip the rest
     """
+    from m3u8.model import InitializationSection
+
     org_segments = playlist.segments.copy()
 
     path_map = OrderedDict(zip([v.path for v in vods], targets))
@@ -122,6 +144,14 @@ def make_join_playlist(
     for segment in org_segments:
         if segment.uri in path_map:
             segment.uri = str(path_map[segment.uri].name)
+            # Point to the downloaded init section which contains only the
+            # requested byte range, if any. Segments may share the same
+            # init section object so replace it instead of modifying it.
+            if segment.init_section is not None and segment.init_section.uri is not None:
+                init_section = _make_init_section(segment.init_section)
+                segment.init_section = InitializationSection(
+                    segment.init_section.base_uri, init_section.filename
+                )
             playlist.segments.append(segment)
 
     return playlist
@@ -197,10 +227,38 @@ def _playlist_key(playlist: Playlist) -> int:
     return MAX
 
 
-def get_init_sections(playlist: m3u8.M3U8) -> Set[str]:
-    # TODO: we're ignoring initi_section.base_uri and bytes
-    return set(
-        segment.init_section.uri
-        for segment in playlist.segments
-        if segment.init_section is not None and segment.init_section.uri is not None
-    )
+def get_init_sections(playlist: m3u8.M3U8) -> List[InitSection]:
+    """Returns unique init sections referenced by segments in the playlist"""
+    init_sections: Dict[Tuple[str, Optional[str]], InitSection] = {}
+    for segment in playlist.segments:
+        section = segment.init_section
+        if section is not None and section.uri is not None:
+            key = (section.uri, section.byterange)
+            if key not in init_sections:
+                init_sections[key] = _make_init_section(section)
+
+    return list(init_sections.values())
+
+
+def _make_init_section(section: InitializationSection) -> InitSection:
+    assert section.uri is not None
+    byterange = _parse_byterange(section.byterange) if section.byterange else None
+
+    # Name the file after the full URI and byte range, since the same file can
+    # contain multiple init sections, and files in different directories can
+    # have the same name. Keep the extension, ffmpeg uses it to detect format.
+    key = f"{section.uri}@{byterange[0]}-{byterange[1]}" if byterange else section.uri
+    _, ext = splitext(urlparse(section.uri).path)
+    filename = f"init-{hashlib.sha256(key.encode()).hexdigest()[:16]}{ext}"
+
+    return InitSection(section.uri, byterange, filename)
+
+
+def _parse_byterange(byterange: str) -> Tuple[int, int]:
+    """
+    Parse a BYTERANGE attribute in the form of `<length>[@<offset>]` into an
+    inclusive byte range. When offset is not given for EXT-X-MAP, it's zero.
+    """
+    length, _, offset = byterange.partition("@")
+    start = int(offset or 0)
+    return start, start + int(length) - 1
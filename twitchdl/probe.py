@@ -0,0 +1,423 @@
+"""
+Detect video resolution and frame rate by parsing the start of a video file.
+
+Supports MPEG-TS segments and fragmented MP4 init sections containing H.264
+video, which is what Twitch serves. This avoids running ffprobe when only the
+basic stream parameters are needed. Returns None for anything it does not
+understand so the caller can fall back to ffprobe.
+"""
+
+import logging
+import struct
+from typing import Dict, Generator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    frame_rate: Optional[float]
+
+
+def probe(data: bytes) -> Optional[VideoInfo]:
+    """Detect video parameters from the first bytes of a TS or MP4 file."""
+    try:
+        if _is_ts(data):
+            return _probe_ts(data)
+        if data[4:8] in (b"ftyp", b"moov", b"styp"):
+            return _probe_mp4(data)
+    except Exception:
+        logger.exception("Failed probing video")
+
+    return None
+
+
+# ------------------------------------------------------------------------------
+# H.264 SPS
+# ------------------------------------------------------------------------------
+
+
+class SPS(NamedTuple):
+    width: int
+    height: int
+    frame_rate: Optional[float]
+
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def u(self, bits: int) -> int:
+        value = 0
+        for _ in range(bits):
+            byte = self.data[self.pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self) -> int:
+        """Unsigned Exp-Golomb code"""
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self) -> int:
+        """Signed Exp-Golomb code"""
+        value = self.ue()
+        return (value + 1) // 2 if value % 2 else -(value // 2)
+
+
+# Profiles which include chroma format and bit depth in the SPS
+HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+
+def parse_sps(nal: bytes) -> SPS:
+    """Parse a H.264 sequence parameter set NAL unit, including the header byte."""
+    r = BitReader(_unescape_rbsp(nal[1:]))
+
+    profile_idc = r.u(8)
+    r.u(16)  # constraint flags, level_idc
+    r.ue()  # seq_parameter_set_id
+
+    chroma_format_idc = 1
+    separate_colour_plane = 0
+    if profile_idc in HIGH_PROFILES:
+        chroma_format_idc = r.ue()
+        if chroma_format_idc == 3:
+            separate_colour_plane = r.u(1)
+        r.ue()  # bit_depth_luma_minus8
+        r.ue()  # bit_depth_chroma_minus8
+        r.u(1)  # qpprime_y_zero_transform_bypass_flag
+        if r.u(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if r.u(1):
+                    _skip_scaling_list(r, 16 if i < 6 else 64)
+
+    r.ue()  # log2_max_frame_num_minus4
+    pic_order_cnt_type = r.ue()
+    if pic_order_cnt_type == 0:
+        r.ue()  # log2_max_pic_order_cnt_lsb_minus4
+    elif pic_order_cnt_type == 1:
+        r.u(1)  # delta_pic_order_always_zero_flag
+        r.se()  # offset_for_non_ref_pic
+        r.se()  # offset_for_top_to_bottom_field
+        for _ in range(r.ue()):
+            r.se()  # offset_for_ref_frame
+
+    r.ue()  # max_num_ref_frames
+    r.u(1)  # gaps_in_frame_num_value_allowed_flag
+    width_in_mbs = r.ue() + 1
+    height_in_map_units = r.ue() + 1
+    frame_mbs_only = r.u(1)
+    if not frame_mbs_only:
+        r.u(1)  # mb_adaptive_frame_field_flag
+    r.u(1)  # direct_8x8_inference_flag
+
+    crop_left = crop_right = crop_top = crop_bottom = 0
+    if r.u(1):  # frame_cropping_flag
+        crop_left, crop_right, crop_top, crop_bottom = r.ue(), r.ue(), r.ue(), r.ue()
+
+    chroma_array_type = 0 if separate_colour_plane else chroma_format_idc
+    if chroma_array_type == 0:
+        crop_unit_x = 1
+        crop_unit_y = 2 - frame_mbs_only
+    else:
+        sub_width = 2 if chroma_format_idc in (1, 2) else 1
+        sub_height = 2 if chroma_format_idc == 1 else 1
+        crop_unit_x = sub_width
+        crop_unit_y = sub_height * (2 - frame_mbs_only)
+
+    width = width_in_mbs * 16 - crop_unit_x * (crop_left + crop_right)
+    height = (2 - frame_mbs_only) * height_in_map_units * 16
+    height -= crop_unit_y * (crop_top + crop_bottom)
+
+    frame_rate = None
+    if r.u(1):  # vui_parameters_present_flag
+        frame_rate = _parse_vui_frame_rate(r)
+
+    return SPS(width, height, frame_rate)
+
+
+def _parse_vui_frame_rate(r: BitReader) -> Optional[float]:
+    if r.u(1):  # aspect_ratio_info_present_flag
+        if r.u(8) == 255:  # aspect_ratio_idc == Extended_SAR
+            r.u(32)  # sar_width, sar_height
+    if r.u(1):  # overscan_info_present_flag
+        r.u(1)  # overscan_appropriate_flag
+    if r.u(1):  # video_signal_type_present_flag
+        r.u(4)  # video_format, video_full_range_flag
+        if r.u(1):  # colour_description_present_flag
+            r.u(24)  # colour_primaries, transfer_characteristics, matrix_coefficients
+    if r.u(1):  # chroma_loc_info_present_flag
+        r.ue()
+        r.ue()
+    if r.u(1):  # timing_info_present_flag
+        num_units_in_tick = r.u(32)
+        time_scale = r.u(32)
+        if num_units_in_tick:
+            return time_scale / (2 * num_units_in_tick)
+    return None
+
+
+def _skip_scaling_list(r: BitReader, size: int):
+    last_scale = next_scale = 8
+    for _ in range(size):
+        if next_scale != 0:
+            next_scale = (last_scale + r.se() + 256) % 256
+        last_scale = next_scale if next_scale != 0 else last_scale
+
+
+def _unescape_rbsp(data: bytes) -> bytes:
+    """Remove emulation prevention bytes (0x000003 -> 0x0000)"""
+    return data.replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+def _iter_nal_units(data: bytes) -> Generator[bytes, None, None]:
+    """Iterate over NAL units in an Annex B byte stream"""
+    start = data.find(b"\x00\x00\x01")
+    while start >= 0:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        nal = data[start:end] if end >= 0 else data[start:]
+        # Strip the leading zero of the next 4-byte start code
+        yield nal.rstrip(b"\x00")
+        start = end
+
+
+# ------------------------------------------------------------------------------
+# MPEG-TS
+# ------------------------------------------------------------------------------
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+STREAM_TYPE_H264 = 0x1B
+PTS_CLOCK = 90000
+
+
+def _is_ts(data: bytes) -> bool:
+    return (
+        len(data) >= 2 * TS_PACKET_SIZE
+        and data[0] == TS_SYNC_BYTE
+        and data[TS_PACKET_SIZE] == TS_SYNC_BYTE
+    )
+
+
+def _iter_ts_packets(data: bytes) -> Generator[Tuple[int, bool, bytes], None, None]:
+    """Yields (pid, payload_unit_start, payload) for each packet"""
+    for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        packet = data[offset : offset + TS_PACKET_SIZE]
+        if packet[0] != TS_SYNC_BYTE:
+            return
+
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        payload_unit_start = bool(packet[1] & 0x40)
+        adaptation_field_control = (packet[3] >> 4) & 0x3
+
+        start = 4
+        if adaptation_field_control in (2, 3):
+            start += 1 + packet[4]
+        if adaptation_field_control in (1, 3) and start < TS_PACKET_SIZE:
+            yield pid, payload_unit_start, packet[start:]
+
+
+def _psi_section(payload: bytes) -> bytes:
+    pointer = payload[0]
+    section = payload[1 + pointer :]
+    section_length = ((section[1] & 0x0F) << 8) | section[2]
+    # Exclude the trailing CRC
+    return section[: 3 + section_length - 4]
+
+
+def _probe_ts(data: bytes) -> Optional[VideoInfo]:
+    pmt_pids: List[int] = []
+    video_pid: Optional[int] = None
+    stream_type: Optional[int] = None
+    es = bytearray()
+    pts_values: List[int] = []
+
+    for pid, payload_unit_start, payload in _iter_ts_packets(data):
+        if pid == 0 and payload_unit_start and not pmt_pids:
+            section = _psi_section(payload)
+            for i in range(8, len(section), 4):
+                program_number = (section[i] << 8) | section[i + 1]
+                if program_number != 0:
+                    pmt_pids.append(((section[i + 2] & 0x1F) << 8) | section[i + 3])
+
+        elif pid in pmt_pids and payload_unit_start and video_pid is None:
+            section = _psi_section(payload)
+            i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+            while i + 5 <= len(section):
+                es_stream_type = section[i]
+                es_pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                if es_stream_type in (STREAM_TYPE_H264, 0x24) and video_pid is None:
+                    video_pid = es_pid
+                    stream_type = es_stream_type
+                i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+
+        elif pid == video_pid:
+            if payload_unit_start:
+                if payload[:3] != b"\x00\x00\x01" or len(payload) < 14:
+                    continue
+                flags = payload[7]
+                header_length = payload[8]
+                if flags & 0x80:
+                    pts_values.append(_parse_pts(payload[9:14]))
+                es += payload[9 + header_length :]
+            else:
+                es += payload
+
+    if stream_type != STREAM_TYPE_H264:
+        return None
+
+    for nal in _iter_nal_units(bytes(es)):
+        if nal and nal[0] & 0x1F == 7:
+            sps = parse_sps(nal)
+            frame_rate = sps.frame_rate or _frame_rate_from_pts(pts_values)
+            return VideoInfo(sps.width, sps.height, frame_rate)
+
+    return None
+
+
+def _parse_pts(data: bytes) -> int:
+    return (
+        ((data[0] >> 1) & 0x07) << 30
+        | data[1] << 22
+        | (data[2] >> 1) << 15
+        | data[3] << 7
+        | data[4] >> 1
+    )
+
+
+def _frame_rate_from_pts(pts_values: List[int]) -> Optional[float]:
+    # Frames may be out of order due to B-frames, so sort the timestamps and
+    # take the shortest interval between them as the frame duration
+    values = sorted(set(pts_values))
+    deltas = [b - a for a, b in zip(values, values[1:])]
+    if not deltas:
+        return None
+    return PTS_CLOCK / min(deltas)
+
+
+# ------------------------------------------------------------------------------
+# MP4
+# ------------------------------------------------------------------------------
+
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"mvex", b"dinf", b"edts"}
+VISUAL_SAMPLE_ENTRY_SIZE = 78
+"""Size of VisualSampleEntry fields preceding its child boxes"""
+
+
+class Mp4Track(NamedTuple):
+    track_id: int
+    handler: bytes
+    timescale: int
+    width: int
+    height: int
+    sps: Optional[SPS]
+
+
+def _iter_boxes(data: bytes, start: int, end: int) -> Generator[Tuple[bytes, int, int], None, None]:
+    """Yields (type, payload_start, payload_end) for each box in the given range"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[offset : offset + 8])
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", data[offset + 8 : offset + 16])
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+
+        if size < header_size:
+            return
+
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+
+def _probe_mp4(data: bytes) -> Optional[VideoInfo]:
+    tracks: List[Mp4Track] = []
+    sample_durations: Dict[int, int] = {}
+
+    for box_type, start, end in _iter_boxes(data, 0, len(data)):
+        if box_type == b"moov":
+            for child_type, child_start, child_end in _iter_boxes(data, start, end):
+                if child_type == b"trak":
+                    tracks.append(_parse_trak(data, child_start, child_end))
+                elif child_type == b"mvex":
+                    sample_durations.update(_parse_mvex(data, child_start, child_end))
+
+    for track in tracks:
+        if track.handler == b"vide" and track.width and track.height:
+            frame_rate = track.sps.frame_rate if track.sps else None
+            duration = sample_durations.get(track.track_id)
+            if not frame_rate and duration and track.timescale:
+                frame_rate = track.timescale / duration
+            return VideoInfo(track.width, track.height, frame_rate)
+
+    return None
+
+
+def _parse_trak(data: bytes, start: int, end: int) -> Mp4Track:
+    track_id = 0
+    handler = b""
+    timescale = 0
+    width = height = 0
+    sps = None
+
+    def walk(start: int, end: int):
+        nonlocal track_id, handler, timescale, width, height, sps
+        for box_type, box_start, box_end in _iter_boxes(data, start, end):
+            if box_type in MP4_CONTAINERS:
+                walk(box_start, box_end)
+            elif box_type == b"tkhd":
+                version = data[box_start]
+                offset = box_start + (20 if version == 1 else 12)
+                (track_id,) = struct.unpack(">I", data[offset : offset + 4])
+            elif box_type == b"mdhd":
+                version = data[box_start]
+                offset = box_start + (20 if version == 1 else 12)
+                (timescale,) = struct.unpack(">I", data[offset : offset + 4])
+            elif box_type == b"hdlr":
+                handler = data[box_start + 8 : box_start + 12]
+            elif box_type == b"stsd":
+                # Skip version, flags and entry count
+                for entry_type, entry_start, entry_end in _iter_boxes(data, box_start + 8, box_end):
+                    if entry_type in (b"avc1", b"avc3"):
+                        width, height, sps = _parse_avc_sample_entry(data, entry_start, entry_end)
+
+    walk(start, end)
+    return Mp4Track(track_id, handler, timescale, width, height, sps)
+
+
+def _parse_avc_sample_entry(data: bytes, start: int, end: int) -> Tuple[int, int, Optional[SPS]]:
+    width, height = struct.unpack(">HH", data[start + 24 : start + 28])
+
+    sps = None
+    for box_type, box_start, _ in _iter_boxes(data, start + VISUAL_SAMPLE_ENTRY_SIZE, end):
+        if box_type == b"avcC":
+            sps = _parse_avcc_sps(data, box_start)
+
+    return width, height, sps
+
+
+def _parse_avcc_sps(data: bytes, start: int) -> Optional[SPS]:
+    sps_count = data[start + 5] & 0x1F
+    if not sps_count:
+        return None
+    (length,) = struct.unpack(">H", data[start + 6 : start + 8])
+    return parse_sps(data[start + 8 : start + 8 + length])
+
+
+def _parse_mvex(data: bytes, start: int, end: int) -> Dict[int, int]:
+    """Returns default sample durations by track ID"""
+    durations: Dict[int, int] = {}
+    for box_type, box_start, _ in _iter_boxes(data, start, end):
+        if box_type == b"trex":
+            track_id, _, duration = struct.unpack(">III", data[box_start + 4 : box_start + 16])
+            if duration:
+                durations[track_id] = duration
+    return durations
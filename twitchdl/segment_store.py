@@ -0,0 +1,96 @@
+"""
+Content-addressed store for downloaded VOD segments, shared between downloads.
+
+Segments are stored in the `segments` cache subdir, named by a hash of the path
+part of their URL, which uniquely identifies a segment of a given VOD and
+quality, regardless of which CDN host it's served from. Segment URLs are never
+reused for different content so there's no need to revalidate stored files.
+
+Downloads link stored segments into their cache dir instead of downloading
+them, and add newly downloaded segments to the store. Hardlinks are used so the
+segments don't take up extra space and deleting the download's cache dir
+doesn't affect the store. Old segments are removed by cache eviction.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Tuple
+from urllib.parse import urlparse
+
+from twitchdl import cache_index
+from twitchdl.cache import get_cache_dir
+from twitchdl.utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS_SUBDIR = "segments"
+
+
+def store_path(url: str) -> Path:
+    """Path at which the segment with the given URL is stored"""
+    path = urlparse(url).path
+    _, ext = os.path.splitext(path)
+    key = hashlib.sha256(path.encode()).hexdigest()
+    return get_cache_dir(SEGMENTS_SUBDIR) / f"{key}{ext}"
+
+
+def link_stored(source_targets: Iterable[Tuple[str, Path]]) -> int:
+    """
+    Link stored segments to their targets, if not already there. Returns the
+    number of linked segments.
+    """
+    count = 0
+    for source, target in source_targets:
+        stored = store_path(source)
+        if target.exists() or not stored.exists():
+            continue
+
+        try:
+            _link(stored, target)
+        except OSError as ex:
+            logger.warning(f"Failed linking stored segment {stored} to {target}: {ex}")
+            continue
+
+        cache_index.touch(stored)
+        count += 1
+
+    return count
+
+
+def store(source_targets: Iterable[Tuple[str, Path]]) -> int:
+    """
+    Add downloaded segments to the store, skipping ones which are not
+    downloaded or already stored. Returns the number of stored segments.
+    """
+    count = 0
+    for source, target in source_targets:
+        stored = store_path(source)
+        if stored.exists() or not target.exists():
+            continue
+
+        try:
+            _link(target, stored)
+        except OSError as ex:
+            logger.warning(f"Failed storing segment {target}: {ex}")
+            continue
+
+        cache_index.touch(stored, hit=False)
+        count += 1
+
+    return count
+
+
+def _link(source: Path, target: Path):
+    """
+    Hardlink source to target, falling back to copying when hardlinks are not
+    supported, e.g. across file systems. Links via a temp file so that target
+    never exists partially.
+    """
+    with atomic_write(target) as tmp_target:
+        try:
+            os.link(source, tmp_target)
+        except OSError:
+            shutil.copyfile(source, tmp_target)
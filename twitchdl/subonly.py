@@ -5,11 +5,13 @@ import json
 import logging
 import re
 import shutil
-from typing import List, NamedTuple, Optional
+from dataclasses import asdict
+from typing import List, NamedTuple, Optional, Tuple
 from urllib.parse import urlparse
 
 import httpx
 
+from twitchdl import api_cache, probe
 from twitchdl.entities import Video
 from twitchdl.exceptions import ConsoleError
 from twitchdl.output import print_warning
@@ -36,6 +38,17 @@ RESOLUTIONS = [
     Resolution(name="Audio Only", group_id="audio_only", resolution=None, is_source=False),
 ]
 
+PLAYLISTS_TTL = 7 * 24 * 3600
+"""Time for which detected playlists are cached, in seconds"""
+
+PROBE_SIZE = 512 * 1024
+"""
+Number of bytes to fetch from the start of the first segment when detecting
+source resolution. Needs to be large enough to contain a few video frames to
+determine the frame rate from their timestamps if it's not given in the stream
+parameters.
+"""
+
 
 def get_subonly_playlists(video: Video) -> List[Playlist]:
     """
@@ -56,6 +69,23 @@ def get_subonly_playlists(video: Video) -> List[Playlist]:
 
 
 async def _get_subonly_playlists_async(video: Video) -> List[Playlist]:
+    # Detecting playlists takes a number of requests, and the results don't
+    # change, so they're cached per video
+    cache_key = api_cache.make_key({"subonly_playlists": video["id"]})
+    cached = api_cache.get(cache_key)
+    if cached:
+        return [Playlist(**playlist) for playlist in cached]
+
+    playlists = await _detect_subonly_playlists(video)
+
+    # Don't cache if source resolution detection failed so it's retried
+    if playlists and all(p.resolution != "???" for p in playlists):
+        api_cache.put(cache_key, [asdict(p) for p in playlists], PLAYLISTS_TTL)
+
+    return playlists
+
+
+async def _detect_subonly_playlists(video: Video) -> List[Playlist]:
     async with httpx.AsyncClient() as client:
         client.event_hooks["request"] = [log_request]
         client.event_hooks["response"] = [log_response]
@@ -81,7 +111,7 @@ async def _get_source_playlist(client: httpx.AsyncClient, video: Video) -> Optio
     if not response.is_success:
         return None
 
-    resolution = await _detect_source_resolution(playlist_url, response.text, group_id)
+    resolution = await _detect_source_resolution(client, playlist_url, response.text, group_id)
     # Don't break if unable to determine source stream parameters
     if not resolution:
         return Playlist(
@@ -140,12 +170,13 @@ def _get_playlist_url(video: Video, group_id: str):
 
 
 async def _detect_source_resolution(
+    client: httpx.AsyncClient,
     playlist_url: str,
     playlists: str,
     group_id: str,
 ) -> Optional[Resolution]:
     """Attempt to determine video resolution and framerate by examining the first
-    VOD in the playlist via ffprobe."""
+    VOD in the playlist."""
     m3u8 = load_m3u8(playlists)
 
     # Examine the init section if it exists, otherwise examine the first segment
@@ -154,8 +185,10 @@ async def _detect_source_resolution(
     first_segment = m3u8.segments[0]
     if first_segment.init_section:
         path = first_segment.init_section.uri
+        byterange = first_segment.init_section.byterange
     else:
         path = first_segment.uri
+        byterange = first_segment.byterange
 
     assert path is not None
     base_url = re.sub("/[^/]+$", "/", playlist_url)
@@ -164,6 +197,50 @@ async def _detect_source_resolution(
     # return HTTP 403
     url = base_url + path.replace("-unmuted", "-muted")
 
+    # Parse the header in-process, fall back to ffprobe if that fails
+    info = await _probe(client, url, byterange)
+    if info and info.frame_rate:
+        return _source_resolution(info.width, info.height, round(info.frame_rate), group_id)
+
+    logger.info("Failed detecting source resolution from stream header, trying ffprobe")
+    return await _ffprobe_resolution(url, group_id)
+
+
+async def _probe(
+    client: httpx.AsyncClient,
+    url: str,
+    byterange: Optional[str],
+) -> Optional[probe.VideoInfo]:
+    start, end = _probe_range(byterange)
+    headers = {"Range": f"bytes={start}-{end}"}
+    data = bytearray()
+
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                # Server may ignore the range and return the whole file
+                if len(data) > end - start:
+                    break
+    except httpx.HTTPError as ex:
+        logger.info(f"Failed fetching {url}: {ex}")
+        return None
+
+    return probe.probe(bytes(data[: end - start + 1]))
+
+
+def _probe_range(byterange: Optional[str]) -> Tuple[int, int]:
+    """Returns the inclusive byte range to fetch given an EXT-X-BYTERANGE value"""
+    if byterange:
+        length, _, offset = byterange.partition("@")
+        start = int(offset or 0)
+        return start, start + min(int(length), PROBE_SIZE) - 1
+
+    return 0, PROBE_SIZE - 1
+
+
+async def _ffprobe_resolution(url: str, group_id: str) -> Optional[Resolution]:
     ffprobe = shutil.which("ffprobe")
     if not ffprobe:
         print_warning("ffprobe not found, cannot detect source resulution")
@@ -189,7 +266,6 @@ async def _detect_source_resolution(
 
     data = json.loads(stdout)
     stream = data["streams"][0]
-    resolution = f"{stream['width']}x{stream['height']}"
 
     frame_rate_raw = stream["r_frame_rate"]
     frame_rate = _parse_frame_rate(frame_rate_raw)
@@ -197,13 +273,17 @@ async def _detect_source_resolution(
         print_warning(f"failed detecting frame rate, cannot parse '{frame_rate_raw}'")
         return None
 
+    return _source_resolution(stream["width"], stream["height"], frame_rate, group_id)
+
+
+def _source_resolution(width: int, height: int, frame_rate: int, group_id: str) -> Resolution:
     # 30fps streams are named 1080p, 60fps streams are named 1080p60
-    name = f"{stream['height']}p" if frame_rate == 30 else f"{stream['height']}p{frame_rate}"
+    name = f"{height}p" if frame_rate == 30 else f"{height}p{frame_rate}"
 
     return Resolution(
         name=name,
         group_id=group_id,
-        resolution=resolution,
+        resolution=f"{width}x{height}",
         is_source=True,
     )
 
@@ -0,0 +1,202 @@
+"""
+Records how long phases of a command take, used by the `--profile` option.
+
+Phases are wrapped in `span()` blocks, which do nothing unless tracing is
+enabled. Spans may be nested, and may run concurrently in threads or asyncio
+tasks. Recorded spans are summarized per phase, or written to a file in the
+Chrome trace event format, which can be opened in https://ui.perfetto.dev/ or
+chrome://tracing.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+import click
+
+from twitchdl.output import print_table
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    """Start time in seconds since tracing was enabled"""
+    duration: float
+    """Duration in seconds"""
+    depth: int
+    """Number of spans this one is nested in"""
+    track: str
+    """Name of the thread or asyncio task which recorded the span"""
+    args: Dict[str, Any]
+
+
+enabled = False
+
+_spans: List[Span] = []
+_spans_lock = threading.Lock()
+_started_at = 0.0
+_depth: ContextVar[int] = ContextVar("depth", default=0)
+
+
+def enable():
+    global enabled, _started_at
+    enabled = True
+    _started_at = time.perf_counter()
+    _spans.clear()
+
+
+def start_profile(output: Optional[Path]) -> Callable[[], None]:
+    """
+    Start tracing, and profiling with cProfile unless the output is a Chrome
+    trace. Returns a function which stops them, prints the phase summary and
+    writes the output file, if given.
+    """
+    enable()
+    profiler = None
+    if output and output.suffix != ".json":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def stop():
+        if profiler:
+            profiler.disable()
+
+        print_summary()
+
+        if output:
+            if profiler:
+                profiler.dump_stats(output)
+            else:
+                write_chrome_trace(output)
+            click.echo(f"Profile written to: {output}", err=True)
+
+    return stop
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Generator[None, None, None]:
+    """Record the time it takes to run the block, if tracing is enabled."""
+    if not enabled:
+        yield
+        return
+
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        _depth.reset(token)
+        with _spans_lock:
+            _spans.append(Span(name, start - _started_at, duration, depth, _track(), args))
+
+
+def get_spans() -> List[Span]:
+    with _spans_lock:
+        return list(_spans)
+
+
+def print_summary():
+    """
+    Print the total time spent in each phase, nested phases are marked with dots.
+    Phases which run concurrently, such as clip downloads, can take up more
+    than the total time.
+    """
+    total = time.perf_counter() - _started_at
+    rows: List[List[str]] = []
+    for (depth, name), (count, duration) in _summarize(get_spans()).items():
+        rows.append(
+            [
+                "· " * depth + name,
+                str(count),
+                f"{duration:.2f}s",
+                f"{duration / total:.0%}" if total else "",
+            ]
+        )
+
+    click.echo(err=True)
+    with _redirect_to_stderr():
+        print_table(
+            rows,
+            headers=["Phase", "Count", "Time", "Share"],
+            footers=["Total", "", f"{total:.2f}s", ""],
+            alignments={1: "right", 2: "right", 3: "right"},
+        )
+
+
+def write_chrome_trace(path: Path):
+    """Write recorded spans in the Chrome trace event format."""
+    tracks: Dict[str, int] = {}
+    events: List[Dict[str, Any]] = []
+
+    for span in sorted(get_spans(), key=lambda s: s.start):
+        if span.track not in tracks:
+            tracks[span.track] = len(tracks) + 1
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": 1,
+                    "tid": tracks[span.track],
+                    "args": {"name": span.track},
+                }
+            )
+
+        events.append(
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": round(span.start * 1_000_000),
+                "dur": round(span.duration * 1_000_000),
+                "pid": 1,
+                "tid": tracks[span.track],
+                "args": span.args,
+            }
+        )
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+def _summarize(spans: List[Span]) -> Dict[Tuple[int, str], Tuple[int, float]]:
+    """Count and total duration of spans by depth and name, ordered by first start"""
+    summary: Dict[Tuple[int, str], Tuple[int, float]] = {}
+    for span in sorted(spans, key=lambda s: s.start):
+        count, duration = summary.get((span.depth, span.name), (0, 0.0))
+        summary[(span.depth, span.name)] = (count + 1, duration + span.duration)
+    return summary
+
+
+def _track() -> str:
+    # Spans from concurrent asyncio tasks overlap, so they are recorded to
+    # separate tracks. Avoids importing asyncio if it's not used.
+    asyncio = sys.modules.get("asyncio")
+    if asyncio:
+        try:
+            task = asyncio.current_task()
+            if task:
+                return task.get_name()
+        except RuntimeError:
+            pass
+
+    return threading.current_thread().name
+
+
+@contextmanager
+def _redirect_to_stderr() -> Generator[None, None, None]:
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
@@ -3,14 +3,16 @@ Twitch API access.
 """
 
 import logging
+import os
 import random
 import time
-from typing import Any, Dict, Generator, List, Mapping, Optional, Tuple, Union
+from contextlib import closing
+from typing import Any, Callable, Dict, Generator, List, Mapping, Optional, Tuple, Union, cast
 
 import click
 import httpx
 
-from twitchdl import CLIENT_ID
+from twitchdl import CLIENT_ID, api_cache, utils
 from twitchdl.entities import (
     AccessToken,
     Chapter,
@@ -18,7 +20,6 @@ from twitchdl.entities import (
     ClipAccessToken,
     ClipsPeriod,
     Data,
-    Page,
     Video,
     VideoComments,
     VideosSort,
@@ -28,6 +29,13 @@ from twitchdl.exceptions import ConsoleError, AuthRequiredError
 from twitchdl.utils import format_size, remove_null_values
 
 
+GQL_URL = os.getenv("TWITCH_DL_GQL_URL", "https://gql.twitch.tv/gql")
+"""Twitch GraphQL API endpoint, overridable to use a stand-in server for benchmarks"""
+
+USHER_URL = os.getenv("TWITCH_DL_USHER_URL", "https://usher.ttvnw.net")
+"""Base URL of the video playlists API, overridable like GQL_URL"""
+
+
 class GQLError(click.ClickException):
     def __init__(self, errors: List[str]):
         message = "GraphQL query failed."
@@ -96,18 +104,50 @@ def log_response(response: httpx.Response, duration_seconds: float):
         logger.debug(f"<-- {response.content.decode()}")
 
 
-def gql_persisted_query(query: Data):
-    url = "https://gql.twitch.tv/gql"
-    response = authenticated_post(url, json=query)
-    gql_raise_on_error(response)
-    return response.json()
+def gql_persisted_query(query: Data, *, ttl: Optional[int] = None):
+    """
+    Execute a persisted query. If `ttl` is given, the response is cached for
+    that many seconds.
+    """
+    return _gql_post(query, ttl=ttl)
+
+
+def gql_query(query: str, auth_token: Optional[str] = None, *, ttl: Optional[int] = None):
+    """
+    Execute a query. If `ttl` is given, the response is cached for that many
+    seconds, unless an auth token is given.
+    """
+    return _gql_post({"query": query}, auth_token=auth_token, ttl=ttl)
+
+
+def _gql_post(payload: Data, auth_token: Optional[str] = None, ttl: Optional[int] = None):
+    # Responses to authenticated queries may contain private data, never cache
+    cacheable = ttl is not None and auth_token is None
+    key = api_cache.make_key(payload) if cacheable else None
 
+    if key:
+        cached = api_cache.get(key)
+        if cached is not None:
+            return cached
 
-def gql_query(query: str, auth_token: Optional[str] = None):
-    url = "https://gql.twitch.tv/gql"
-    response = authenticated_post(url, json={"query": query}, auth_token=auth_token)
+    response = authenticated_post(GQL_URL, json=payload, auth_token=auth_token)
     gql_raise_on_error(response)
-    return response.json()
+    data = response.json()
+
+    # Don't cache lookups which found nothing, it may exist soon, e.g. a clip
+    # which is being created
+    if key and ttl and not _is_not_found(data):
+        api_cache.put(key, data, ttl)
+
+    return data
+
+
+def _is_not_found(data: Data) -> bool:
+    """True if any of the looked up objects was not found, e.g. {"data": {"video": null}}"""
+    result = data.get("data")
+    if not isinstance(result, dict):
+        return False
+    return any(value is None for value in cast(Dict[str, Any], result).values())
 
 
 def gql_raise_on_error(response: httpx.Response):
@@ -120,6 +160,21 @@ def gql_raise_on_error(response: httpx.Response):
         raise GQLError(errors)
 
 
+# Time for which responses are cached, in seconds, see api_cache
+VIDEO_TTL = 5 * 60
+CLIP_TTL = 5 * 60
+CHAPTERS_TTL = 10 * 60
+GAME_TTL = 7 * 24 * 3600
+VIDEO_COMMENTS_TTL = 24 * 3600
+
+
+MAX_PAGE_SIZE = 100
+"""Maximum number of items Twitch returns in a single page"""
+
+PREFETCH_PAGES = 1
+"""Number of pages to fetch in the background ahead of the one being consumed"""
+
+
 VIDEO_FIELDS = """
     id
     title
@@ -183,7 +238,7 @@ def get_video(video_id: str) -> Optional[Video]:
     }}
     """
 
-    response = gql_query(query)
+    response = gql_query(query, ttl=VIDEO_TTL)
     return response["data"]["video"]
 
 
@@ -196,12 +251,18 @@ def get_clip(slug: str) -> Optional[Clip]:
     }}
     """
 
-    response = gql_query(query)
+    response = gql_query(query, ttl=CLIP_TTL)
     return response["data"]["clip"]
 
 
 def get_clip_access_token(slug: str) -> ClipAccessToken:
-    query = {
+    query = clip_access_token_query(slug)
+    response = gql_persisted_query(query)
+    return response["data"]["clip"]
+
+
+def clip_access_token_query(slug: str) -> Data:
+    return {
         "operationName": "VideoAccessToken_Clip",
         "variables": {"slug": slug},
         "extensions": {
@@ -212,9 +273,6 @@ def get_clip_access_token(slug: str) -> ClipAccessToken:
         },
     }
 
-    response = gql_persisted_query(query)
-    return response["data"]["clip"]
-
 
 def get_channel_clips(
     channel_id: str,
@@ -231,7 +289,18 @@ def get_channel_clips(
     * sorting by VIEWS_DESC and TRENDING returns the same results
     * there is no totalCount
     """
-    query = f"""
+    query = channel_clips_query(channel_id, period, limit, after)
+    response = gql_query(query)
+    return parse_channel_clips(channel_id, response)
+
+
+def channel_clips_query(
+    channel_id: str,
+    period: ClipsPeriod,
+    limit: int,
+    after: Optional[str] = None,
+) -> str:
+    return f"""
     {{
       user(login: "{channel_id}") {{
         clips(
@@ -258,56 +327,28 @@ def get_channel_clips(
     }}
     """
 
-    response = gql_query(query)
+
+def parse_channel_clips(channel_id: str, response: Data) -> Data:
     user = response["data"]["user"]
     if not user:
         raise ConsoleError(f"Channel {channel_id} not found")
 
-    return response["data"]["user"]["clips"]
+    return user["clips"]
 
 
 def channel_clips_generator(
     channel_id: str,
     period: ClipsPeriod,
     limit: int,
+    *,
+    prefetch: int = PREFETCH_PAGES,
 ) -> Generator[Clip, None, None]:
-    def _generator(clips: Data, limit: int) -> Generator[Clip, None, None]:
-        for clip in clips["edges"]:
-            if limit < 1:
-                return
-            yield clip["node"]
-            limit -= 1
-
-        has_next = clips["pageInfo"]["hasNextPage"]
-        if limit < 1 or not has_next:
-            return
+    def fetch_page(page_size: int, cursor: Optional[str]):
+        return get_channel_clips(channel_id, period, page_size, cursor)
 
-        req_limit = min(limit, 100)
-        cursor = clips["edges"][-1]["cursor"]
-        clips = get_channel_clips(channel_id, period, req_limit, cursor)
-        yield from _generator(clips, limit)
-
-    req_limit = min(limit, 100)
-    clips = get_channel_clips(channel_id, period, req_limit)
-    return _generator(clips, limit)
-
-
-def channel_clips_page_generator(
-    channel_id: str,
-    period: ClipsPeriod,
-    page_size: int = 40,
-) -> Generator[Page[Clip], None, None]:
-    cursor = None
-    has_next = True
-    page_no = 1
-
-    while has_next:
-        response = get_channel_clips(channel_id, period, page_size, cursor)
-        has_next = response["pageInfo"]["hasNextPage"]
-        clips = [edge["node"] for edge in response["edges"]]
-        yield Page(page_no, has_next, clips)
-        cursor = response["edges"][-1]["cursor"] if response["edges"] else None
-        page_no += 1
+    # Fetch the first page before returning so errors are raised early
+    first_page = fetch_page(min(limit, MAX_PAGE_SIZE), None)
+    return _paginate(fetch_page, limit, first_page, prefetch)
 
 
 def get_channel_videos(
@@ -362,30 +403,57 @@ def channel_videos_generator(
     sort: VideosSort,
     type: VideosType,
     game_ids: Optional[List[str]] = None,
+    *,
+    prefetch: int = PREFETCH_PAGES,
 ) -> Tuple[int, Generator[Video, None, None]]:
     game_ids = game_ids or []
 
-    def _generator(videos: Data, max_videos: int) -> Generator[Video, None, None]:
-        for video in videos["edges"]:
-            if max_videos < 1:
-                return
-            yield video["node"]
-            max_videos -= 1
-
-        has_next = videos["pageInfo"]["hasNextPage"]
-        if max_videos < 1 or not has_next:
-            return
+    def fetch_page(page_size: int, cursor: Optional[str]):
+        return get_channel_videos(channel_id, page_size, sort, type, game_ids, cursor)
 
-        limit = min(max_videos, 100)
-        cursor = videos["edges"][-1]["cursor"]
-        videos = get_channel_videos(channel_id, limit, sort, type, game_ids, cursor)
-        yield from _generator(videos, max_videos)
-
-    limit = min(max_videos, 100)
-    videos = get_channel_videos(channel_id, limit, sort, type, game_ids)
+    videos = fetch_page(min(max_videos, MAX_PAGE_SIZE), None)
     if videos is None:
         raise ConsoleError(f"Channel {channel_id} not found")
-    return videos["totalCount"], _generator(videos, max_videos)
+    return videos["totalCount"], _paginate(fetch_page, max_videos, videos, prefetch)
+
+
+def _paginate(
+    fetch_page: Callable[[int, Optional[str]], Data],
+    limit: int,
+    first_page: Data,
+    prefetch: int,
+) -> Generator[Any, None, None]:
+    """
+    Yields up to `limit` nodes from a paginated GQL connection, starting with
+    the given first page. Following pages are fetched in the background while
+    the current one is being consumed.
+    """
+    count = 0
+    # Close explicitly when done to stop fetching pages in the background
+    with closing(utils.prefetch(_fetch_pages(fetch_page, limit, first_page), prefetch)) as pages:
+        for page in pages:
+            for edge in page["edges"]:
+                if count >= limit:
+                    return
+                yield edge["node"]
+                count += 1
+
+
+def _fetch_pages(
+    fetch_page: Callable[[int, Optional[str]], Data],
+    limit: int,
+    page: Data,
+) -> Generator[Data, None, None]:
+    fetched = 0
+    while True:
+        yield page
+
+        fetched += len(page["edges"])
+        if fetched >= limit or not page["pageInfo"]["hasNextPage"] or not page["edges"]:
+            return
+
+        cursor = page["edges"][-1]["cursor"]
+        page = fetch_page(min(limit - fetched, MAX_PAGE_SIZE), cursor)
 
 
 def get_access_token(video_id: str, auth_token: Optional[str] = None) -> AccessToken:
@@ -434,7 +502,7 @@ def get_playlists(video_id: str, access_token: AccessToken) -> str:
     """
     For a given video return a playlist which contains possible video qualities.
     """
-    url = f"https://usher.ttvnw.net/vod/{video_id}"
+    url = f"{USHER_URL}/vod/{video_id}"
 
     params = {
         "nauth": access_token["value"],
@@ -466,7 +534,7 @@ def get_game_id(name: str):
     }}
     """
 
-    response = gql_query(query)
+    response = gql_query(query, ttl=GAME_TTL)
     game = response["data"]["game"]
     if game:
         return game["id"]
@@ -487,7 +555,7 @@ def get_video_chapters(video_id: str) -> List[Chapter]:
         },
     }
 
-    response = gql_persisted_query(query)
+    response = gql_persisted_query(query, ttl=CHAPTERS_TTL)
     video = response["data"]["video"]
     return list(_chapter_nodes(video["moments"])) if video else []
 
@@ -501,12 +569,12 @@ def _chapter_nodes(moments: Data) -> Generator[Chapter, None, None]:
         yield node
 
 
-def get_comments(
+def comments_query(
     video_id: str,
     *,
     cursor: Optional[str] = None,
     offset_seconds: Optional[int] = None,
-):
+) -> Data:
     variables = remove_null_values(
         {
             "videoID": video_id,
@@ -515,7 +583,7 @@ def get_comments(
         }
     )
 
-    query = {
+    return {
         "operationName": "VideoCommentsByOffsetOrCursor",
         "variables": variables,
         "extensions": {
@@ -526,9 +594,6 @@ def get_comments(
         },
     }
 
-    response = gql_persisted_query(query)
-    return response["data"]["video"]
-
 
 def get_video_comments(video_id: str) -> VideoComments:
     query = {
@@ -545,5 +610,5 @@ def get_video_comments(video_id: str) -> VideoComments:
         },
     }
 
-    response = gql_persisted_query(query)
+    response = gql_persisted_query(query, ttl=VIDEO_COMMENTS_TTL)
     return response["data"]
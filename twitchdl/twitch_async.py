@@ -2,15 +2,31 @@
 Twitch API access, but async.
 """
 
+import asyncio
+import json
+import logging
 import time
-from typing import Any, Mapping, Optional
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Mapping, Optional, Tuple, cast
 
 import httpx
 
 from twitchdl import CLIENT_ID
-from twitchdl.entities import ClipAccessToken, Data
+from twitchdl.entities import Clip, ClipAccessToken, ClipsPeriod, Data, Page
 from twitchdl.exceptions import ConsoleError
-from twitchdl.twitch import Content, gql_raise_on_error, log_request, log_response
+from twitchdl.twitch import (
+    GQL_URL,
+    Content,
+    GQLError,
+    channel_clips_query,
+    clip_access_token_query,
+    comments_query,
+    gql_raise_on_error,
+    log_request,
+    log_response,
+    parse_channel_clips,
+)
+
+logger = logging.getLogger(__name__)
 
 
 async def authenticated_post(
@@ -53,23 +69,209 @@ async def request(
 
 
 async def gql_persisted_query(client: httpx.AsyncClient, query: Data):
-    url = "https://gql.twitch.tv/gql"
-    response = await authenticated_post(client, url, json=query)
+    response = await authenticated_post(client, GQL_URL, json=query)
     gql_raise_on_error(response)
     return response.json()
 
 
-async def get_clip_access_token(client: httpx.AsyncClient, slug: str) -> ClipAccessToken:
-    query = {
-        "operationName": "VideoAccessToken_Clip",
-        "variables": {"slug": slug},
-        "extensions": {
-            "persistedQuery": {
-                "version": 1,
-                "sha256Hash": "36b89d2507fce29e5ca551df756d27c1cfe079e2609642b4390aa4c35796eb11",
-            }
-        },
-    }
+async def gql_query(client: httpx.AsyncClient, query: str, auth_token: Optional[str] = None):
+    payload = {"query": query}
+    response = await authenticated_post(client, GQL_URL, json=payload, auth_token=auth_token)
+    gql_raise_on_error(response)
+    return response.json()
+
+
+async def gql_persisted_query_batch(client: httpx.AsyncClient, queries: List[Data]) -> List[Data]:
+    """
+    Send multiple persisted queries in a single request. Returns the list of
+    responses in the same order as queries. Errors are not raised, they should
+    be checked for each response.
+    """
+    response = await authenticated_post(client, GQL_URL, json=queries)
+    data = response.json()
+    if not isinstance(data, list):
+        raise ConsoleError("Unexpected response to batched query")
+    return cast(List[Data], data)
 
+
+async def get_clip_access_token(client: httpx.AsyncClient, slug: str) -> ClipAccessToken:
+    query = clip_access_token_query(slug)
     response = await gql_persisted_query(client, query)
     return response["data"]["clip"]
+
+
+async def get_comments(
+    client: httpx.AsyncClient,
+    video_id: str,
+    *,
+    cursor: Optional[str] = None,
+    offset_seconds: Optional[int] = None,
+):
+    query = comments_query(video_id, cursor=cursor, offset_seconds=offset_seconds)
+    response = await gql_persisted_query(client, query)
+    return response["data"]["video"]
+
+
+async def get_channel_clips(
+    client: httpx.AsyncClient,
+    channel_id: str,
+    period: ClipsPeriod,
+    limit: int,
+    after: Optional[str] = None,
+):
+    query = channel_clips_query(channel_id, period, limit, after)
+    response = await gql_query(client, query)
+    return parse_channel_clips(channel_id, response)
+
+
+async def channel_clips_page_generator(
+    client: httpx.AsyncClient,
+    channel_id: str,
+    period: ClipsPeriod,
+    page_size: int = 40,
+) -> AsyncGenerator[Page[Clip], None]:
+    cursor = None
+    has_next = True
+    page_no = 1
+
+    while has_next:
+        response = await get_channel_clips(client, channel_id, period, page_size, cursor)
+        has_next = response["pageInfo"]["hasNextPage"]
+        clips = [edge["node"] for edge in response["edges"]]
+        yield Page(page_no, has_next, clips)
+        cursor = response["edges"][-1]["cursor"] if response["edges"] else None
+        page_no += 1
+
+
+class ClipAccessTokenBatcher:
+    """
+    Loads clip access tokens in batches.
+
+    Slugs requested within a short delay of each other are resolved using a
+    single batched GQL request. Loaded tokens are cached until they expire.
+    Use `prefetch` to start loading tokens before they are needed.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        *,
+        batch_size: int = 35,
+        delay: float = 0.01,
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.delay = delay
+        self.requests = 0
+
+        self._cache: Dict[str, Tuple[ClipAccessToken, float]] = {}
+        self._pending: Dict[str, asyncio.Future[ClipAccessToken]] = {}
+        self._queue: List[str] = []
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: List[asyncio.Task[None]] = []
+
+    async def get(self, slug: str) -> ClipAccessToken:
+        cached = self._get_cached(slug)
+        if cached:
+            return cached
+
+        return await self._enqueue(slug)
+
+    def prefetch(self, slugs: Iterable[str]):
+        for slug in slugs:
+            if not self._get_cached(slug):
+                self._enqueue(slug)
+
+    async def close(self):
+        """Cancel any pending requests."""
+        if self._handle:
+            self._handle.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _get_cached(self, slug: str) -> Optional[ClipAccessToken]:
+        if slug in self._cache:
+            token, expires = self._cache[slug]
+            if expires > time.time():
+                return token
+            del self._cache[slug]
+
+    def _enqueue(self, slug: str) -> asyncio.Future[ClipAccessToken]:
+        if slug in self._pending:
+            return self._pending[slug]
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[ClipAccessToken] = loop.create_future()
+        # Prevent "exception was never retrieved" warnings for prefetched tokens
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[slug] = future
+        self._queue.append(slug)
+
+        if len(self._queue) >= self.batch_size:
+            self._dispatch()
+        elif not self._handle:
+            self._handle = loop.call_later(self.delay, self._dispatch)
+
+        return future
+
+    def _dispatch(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+        while self._queue:
+            slugs = self._queue[: self.batch_size]
+            self._queue = self._queue[self.batch_size :]
+            task = asyncio.create_task(self._load(slugs))
+            task.add_done_callback(self._tasks.remove)
+            self._tasks.append(task)
+
+    async def _load(self, slugs: List[str]):
+        futures = [self._pending[slug] for slug in slugs]
+
+        try:
+            self.requests += 1
+            queries = [clip_access_token_query(slug) for slug in slugs]
+            responses = await gql_persisted_query_batch(self.client, queries)
+            if len(responses) != len(slugs):
+                raise ConsoleError("Unexpected response to batched access token query")
+        except asyncio.CancelledError:
+            for slug, future in zip(slugs, futures):
+                del self._pending[slug]
+                future.cancel()
+            raise
+        except Exception as ex:
+            for slug, future in zip(slugs, futures):
+                del self._pending[slug]
+                future.set_exception(ex)
+            return
+
+        for slug, future, response in zip(slugs, futures, responses):
+            del self._pending[slug]
+            if "errors" in response:
+                future.set_exception(GQLError([e["message"] for e in response["errors"]]))
+                continue
+
+            token = response["data"]["clip"]
+            if not token:
+                future.set_exception(ConsoleError(f"Access token not found for slug '{slug}'"))
+                continue
+
+            expires = _token_expires(token)
+            if expires:
+                self._cache[slug] = (token, expires)
+            future.set_result(token)
+
+
+TOKEN_EXPIRY_MARGIN = 60
+"""Tokens which expire within this many seconds are considered expired"""
+
+
+def _token_expires(token: ClipAccessToken) -> Optional[float]:
+    try:
+        value = json.loads(token["playbackAccessToken"]["value"])
+        return value["expires"] - TOKEN_EXPIRY_MARGIN
+    except Exception:
+        logger.warning(f"Failed parsing clip access token expiry for {token.get('id')}")
+        return None
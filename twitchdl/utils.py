@@ -1,16 +1,28 @@
 import os
 import re
-import time
 import unicodedata
-from collections import defaultdict, deque
+from collections import deque
 from contextlib import contextmanager
 from itertools import chain, islice, tee
 from pathlib import Path
-from statistics import fmean
-from typing import Deque, Dict, Iterable, Optional, Tuple, TypeVar, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import click
 
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
 T = TypeVar("T")
 K = TypeVar("K")
 V = TypeVar("V")
@@ -139,37 +151,50 @@ def iterate_with_next(iterable: Iterable[T]) -> Iterable[Tuple[T, Optional[T]]]:
     return zip(items, nexts)
 
 
-@contextmanager
-def timed(message: str = "Time taken"):
-    """Print how long it took to execute a block of code"""
-    start = time.monotonic()
-    yield
-    duration = time.monotonic() - start
-    print(f"{message}: {int(1000 * duration):.1f}ms")
+_DONE: Any = object()
 
 
-perfs: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=50))
+def prefetch(iterable: Iterable[T], depth: int = 1) -> Generator[T, None, None]:
+    """
+    Iterates over the iterable in a background thread, keeping up to `depth`
+    items ahead of the consumer. Useful for iterables which perform blocking
+    IO to produce items, such as fetching pages from an API.
+    """
+    if depth < 1:
+        yield from iterable
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    iterator = iter(iterable)
+
+    # A single worker advances the iterator, so it's never used concurrently
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        futures: Deque[Future[T]] = deque(
+            executor.submit(next, iterator, _DONE) for _ in range(depth)
+        )
+        while True:
+            item = futures.popleft().result()
+            if item is _DONE:
+                return
+            futures.append(executor.submit(next, iterator, _DONE))
+            yield item
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 @contextmanager
-def monitor_performance(group: str):
-    from twitchdl.output import print_status
-
-    global perfs
-    start = time.monotonic()
-    yield
-    perfs[group].append(time.monotonic() - start)
-    print_status(f"{group}: {1000 * fmean(perfs[group]):.1f}ms")
-
-
-def get_size(path: Path):
-    """Get the total size of all files in the given directory."""
-    if path.is_file():
-        return os.path.getsize(path)
-
-    size = 0
-    for subpath, _, filenames in os.walk(path):
-        for filename in filenames:
-            full_path = os.path.join(subpath, filename)
-            size += os.path.getsize(full_path)
-    return size
+def atomic_write(target: Union[str, Path]) -> Generator[Path, None, None]:
+    """
+    Yields a temp path to write to instead of the target, which is moved to the
+    target when the block completes, or removed if it fails. This way target
+    never exists partially written, even when several processes write it.
+    """
+    tmp_path = Path(f"{target}.{os.getpid()}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise